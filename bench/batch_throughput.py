@@ -0,0 +1,74 @@
+"""묶음 블록(batching) 켜고/끄고 호스트 처리량 측정
+
+    python bench/batch_throughput.py [메시지 수] [수신 클라이언트 수] [묶음 시간 ms ...]
+
+asyncio 호스트에 클라이언트들이 접속한 상태에서 한 클라이언트가 CHAT 을 연속으로 보내고,
+모든 클라이언트가 블록을 받아 검증하고 메시지를 하나씩 꺼낼 때까지 걸린 시간을 잼 (0 ms = 끔)
+"""
+import json
+import os
+import socket
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import main
+
+
+def join(port, name):
+    s = socket.create_connection(("127.0.0.1", port))
+    s.sendall(main.encode_packet({"type": "JOIN", "nickname": name, "have": None}))
+    return s
+
+
+def receiver(sock, total, done, stats):
+    """BLOCK 을 받아 검증하고 벤치 메시지 개수를 셈"""
+    count = 0
+    for line in main.FrameReader(sock).frames():
+        p = json.loads(line)
+        if p['type'] != 'BLOCK': continue
+        block = main.Block.from_dict(p['data'])
+        if not block.verify(): raise SystemExit("invalid block")
+        stats["blocks"] += 1
+        stats["bytes"] += len(line)
+        count += sum(1 for e in main.block_entries(block) if e[3].startswith("bench "))
+        if count >= total: break
+    done.release()
+
+
+def run(messages, clients, window):
+    main.OUTBOUND_QUEUE_LIMIT = messages + 1000  # 처리량만 재기 위해 느린 클라이언트 패킷 버리기를 끔
+    host = main.AsyncChatHost("host", main.Blockchain(), "bench", batch_window=window)
+    host.open("127.0.0.1", 0)
+    port = host.server.sockets[0].getsockname()[1]
+    host.run_in_thread()
+    socks = [join(port, f"guest{i}") for i in range(clients)]
+    time.sleep(0.5)  # JOIN/동기화가 끝날 때까지
+    done = threading.Semaphore(0)
+    stats = {"blocks": 0, "bytes": 0}
+    for s in socks: threading.Thread(target=receiver, args=(s, messages, done, stats), daemon=True).start()
+    sender = socks[0]
+    start = time.perf_counter()
+    data = b"".join(main.encode_packet({"type": "CHAT", "sender": "guest0", "sender_id": 2, "message": f"bench {i}"})
+                    for i in range(messages))
+    sender.sendall(data)
+    for _ in socks:
+        if not done.acquire(timeout=300): raise SystemExit("timed out")
+    elapsed = time.perf_counter() - start
+    host.stop()
+    for s in socks: s.close()
+    return {"seconds": round(elapsed, 3), "msgs_per_sec": round(messages / elapsed),
+            "blocks_per_client": stats["blocks"] // clients, "bytes_per_client": stats["bytes"] // clients}
+
+
+if __name__ == "__main__":
+    messages = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    clients = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    windows = [float(a) for a in sys.argv[3:]] or [0, 20]
+    results = {}
+    for ms in windows:
+        results[f"{ms:g}ms"] = row = run(messages, clients, ms / 1000)
+        print(f"batch {ms:>5g}ms  {row['msgs_per_sec']:>8} msg/s  {row['blocks_per_client']:>6} blocks", file=sys.stderr)
+    json.dump({"messages": messages, "clients": clients, "results": results}, sys.stdout, indent=2)
+    print()
@@ -0,0 +1,110 @@
+"""블록 표현 방식별 메모리 사용량 비교
+
+    python bench/block_memory.py              # 10^5, 10^6 블록
+    python bench/block_memory.py 100000       # 크기 지정
+
+legacy     : 기존 방식 (__dict__ + hex 해시 문자열) Block 리스트
+slots      : __slots__ + 32바이트 digest Block 리스트 (MemoryStore)
+blocktable : 열 단위 BlockTable
+append     : Blockchain.add_block 처리량 (해시 검증 포함, 블록/초) - slots(MemoryStore) 와 blocktable
+"""
+import hashlib
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import main
+
+SENDERS = ["System", "alice", "bob", "철수", "영희", "mallory"]
+WORDS = ["안녕하세요", "hello", "회의", "10분", "뒤에", "시작합니다", "ok", "👍", "file", "확인했습니다"]
+
+
+class LegacyBlock:
+    """변경 전 Block과 같은 레이아웃 (인스턴스 __dict__, hex 문자열 해시)"""
+    def __init__(self, index, timestamp, sender, sender_id, message, previous_hash, block_hash):
+        self.index = index
+        self.timestamp = timestamp
+        self.sender = sender
+        self.sender_id = sender_id
+        self.message = message
+        self.previous_hash = previous_hash
+        self.hash = block_hash
+
+
+def wire_lines(n):
+    """호스트가 보내는 것과 같은 블록 JSON 줄을 생성 (빌더가 매번 새 객체로 파싱하도록)"""
+    t0 = int(time.time()) - n
+    prev = "0"
+    for i in range(1, n + 1):
+        sender_id = i % len(SENDERS)
+        message = " ".join(WORDS[(i * k) % len(WORDS)] for k in range(1, 2 + i % 6))
+        d = {"index": i, "timestamp": time.ctime(t0 + i // 3), "sender": SENDERS[sender_id],
+             "sender_id": sender_id, "message": message, "previous_hash": prev}
+        d["hash"] = hashlib.sha256(json.dumps(d, sort_keys=True).encode()).hexdigest()
+        prev = d["hash"]
+        yield json.dumps(d).encode()
+
+
+def measure(build, n):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    holder = build(json.loads(line) for line in wire_lines(n))
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del holder
+    return used
+
+
+def build_legacy(dicts):
+    return [LegacyBlock(d["index"], d["timestamp"], d["sender"], d["sender_id"],
+                        d["message"], d["previous_hash"], d["hash"]) for d in dicts]
+
+
+def build_slots(dicts):
+    store = main.MemoryStore()
+    for d in dicts: store.append(main.Block.from_dict(d))
+    return store
+
+
+def build_table(dicts):
+    table = main.BlockTable()
+    for d in dicts: table.append(main.Block.from_dict(d))
+    return table
+
+
+def append_rate(make_store, n):
+    """같은 체인을 미리 만들어 두고 새 저장소의 Blockchain.add_block 으로 다시 넣는 속도 (블록/초)"""
+    src = main.Blockchain(main.MemoryStore())
+    t0 = int(time.time()) - n
+    for i in range(n):
+        main.seal_block(src, [(time.ctime(t0 + i // 3), SENDERS[i % len(SENDERS)], i % len(SENDERS), f"{WORDS[i % len(WORDS)]} {i}")])
+    blocks = [main.Block.restore(b.index, b.timestamp, b.sender, b.sender_id, b.message, b.prev_digest, b.digest, b.version)
+              for b in src.chain[1:]]
+    chain = main.Blockchain(make_store())
+    start = time.perf_counter()
+    for b in blocks: chain.add_block(b)
+    return round(n / (time.perf_counter() - start))
+
+
+def main_bench(sizes):
+    results = {}
+    for n in sizes:
+        row = {}
+        for name, build in (("legacy", build_legacy), ("slots", build_slots), ("blocktable", build_table)):
+            used = measure(build, n)
+            row[name] = {"bytes": used, "bytes_per_block": round(used / n, 1)}
+            print(f"{n:>9} blocks  {name:<10} {used / 2**20:9.1f} MiB  {used / n:7.1f} B/block", file=sys.stderr, flush=True)
+        for name, make_store in (("slots", main.MemoryStore), ("blocktable", main.BlockTable)):
+            row[name]["append_per_sec"] = append_rate(make_store, n)
+            print(f"{n:>9} blocks  {name:<10} add_block {row[name]['append_per_sec']:>9} blocks/s", file=sys.stderr, flush=True)
+        results[n] = row
+    return results
+
+
+if __name__ == "__main__":
+    sizes = [int(a) for a in sys.argv[1:]] or [10**5, 10**6]
+    json.dump(main_bench(sizes), sys.stdout, indent=2)
+    print()
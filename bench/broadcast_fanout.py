@@ -0,0 +1,97 @@
+"""방송 처리량 측정 (클라이언트 수별)
+
+    python bench/broadcast_fanout.py [블록 수] [클라이언트 수 ...]
+
+per_client  : 기존 방식. 클라이언트마다 json.dumps + encode + sendall
+encode_once : 한 번 직렬화한 bytes를 SocketWriter 로 전달 (묶음 sendmsg)
+chat / file 두 가지 패킷 크기(짧은 채팅, 1MB base64 파일)로 측정
+"""
+import base64
+import json
+import os
+import selectors
+import socket
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import main
+
+PACKETS = {
+    "chat": lambda i: {"type": "BLOCK", "data": main.Block(i, time.ctime(), "alice", 2, f"안녕하세요 {i}", "ab" * 32).to_dict()},
+    "file": lambda i: {"type": "FILE_RECV", "sender": "alice", "sender_id": 2, "filename": f"f{i}.bin",
+                       "content": base64.b64encode(os.urandom(768 * 1024)).decode(),
+                       "block_data": main.Block(i, time.ctime(), "alice", 2, f"FILE_TRANSFER:f{i}.bin", "ab" * 32).to_dict()},
+}
+
+
+class Drain:
+    """받는 쪽 소켓을 모두 읽어서 버리는 스레드 (받은 바이트 수만 셈)"""
+    def __init__(self, socks):
+        self.selector = selectors.DefaultSelector()
+        for s in socks:
+            s.setblocking(False)
+            self.selector.register(s, selectors.EVENT_READ)
+        self.received = 0
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while self.running:
+            for key, _ in self.selector.select(0.1):
+                try: self.received += len(key.fileobj.recv(1 << 20))
+                except BlockingIOError: pass
+
+    def wait_for(self, total):
+        while self.received < total: time.sleep(0.001)
+        self.running = False
+        self.thread.join()
+
+
+def per_client(clients, packets):
+    for packet in packets:
+        for c in clients:
+            c.sendall((json.dumps(packet) + "\n").encode('utf-8'))
+
+
+def encode_once(clients, packets):
+    writers = [main.SocketWriter(c) for c in clients]
+    for packet in packets:
+        data = main.encode_packet(packet)
+        for w in writers: w.send_wait(data)   # 벤치는 버리지 않고 전부 전달
+
+
+def run(strategy, n_clients, packets):
+    pairs = [socket.socketpair() for _ in range(n_clients)]
+    expected = sum(len(main.encode_packet(p)) for p in packets) * n_clients
+    drain = Drain([b for _, b in pairs])
+    start = time.perf_counter()
+    strategy([a for a, _ in pairs], packets)
+    drain.wait_for(expected)
+    elapsed = time.perf_counter() - start
+    for a, b in pairs:
+        a.close()
+        b.close()
+    return elapsed
+
+
+if __name__ == "__main__":
+    n_blocks = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    client_counts = [int(a) for a in sys.argv[2:]] or [1, 10, 50, 200]
+    results = {}
+    for kind, make in PACKETS.items():
+        count = n_blocks if kind == "chat" else max(1, n_blocks // 50)
+        packets = [make(i) for i in range(count)]
+        for n_clients in client_counts:
+            row = {}
+            for name, strategy in (("per_client", per_client), ("encode_once", encode_once)):
+                elapsed = run(strategy, n_clients, packets)
+                row[name] = {"seconds": round(elapsed, 4), "packets_per_sec": round(count / elapsed, 1),
+                             "deliveries_per_sec": round(count * n_clients / elapsed)}
+            results.setdefault(kind, {})[n_clients] = row
+            print(f"{kind:<5} {n_clients:>4} clients  per_client {row['per_client']['deliveries_per_sec']:>10,}/s"
+                  f"  encode_once {row['encode_once']['deliveries_per_sec']:>10,}/s", file=sys.stderr)
+    json.dump(results, sys.stdout, indent=2)
+    print()
@@ -0,0 +1,70 @@
+"""프레임 수신 처리량 (MB/s) 측정
+
+    python bench/frame_reader.py
+
+legacy      : 기존 방식 (recv(4096) + bytes 이어 붙이기 + split)
+framereader : FrameReader (bytearray + 검색 위치 유지 + 적응형 읽기 크기)
+chat 프레임 수만 개와 큰 파일 프레임 하나를 socketpair로 보내서 측정.
+legacy는 큰 프레임에서 제곱 시간이라 8MB까지만 측정
+"""
+import json
+import os
+import socket
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import main
+
+
+def legacy_frames(sock):
+    buffer = b""
+    while True:
+        data = sock.recv(4096)
+        if not data: return
+        buffer += data
+        while b"\n" in buffer:
+            line_bytes, buffer = buffer.split(b"\n", 1)
+            if line_bytes: yield line_bytes
+
+
+def reader_frames(sock):
+    return main.FrameReader(sock).frames()
+
+
+def run(frames_of, payload):
+    a, b = socket.socketpair()
+    sender = threading.Thread(target=lambda: (a.sendall(payload), a.close()))
+    start = time.perf_counter()
+    sender.start()
+    count = sum(1 for _ in frames_of(b))
+    elapsed = time.perf_counter() - start
+    sender.join()
+    b.close()
+    return count, elapsed
+
+
+def chat_payload(n):
+    return b"".join(main.encode_packet({"type": "CHAT", "sender": "alice", "sender_id": 2, "message": f"안녕하세요 {i}"})
+                    for i in range(n))
+
+
+def file_payload(mb):
+    return b'{"type": "FILE", "content": "' + b"A" * (mb * 1024 * 1024) + b'"}\n'
+
+
+if __name__ == "__main__":
+    cases = [("chat x100000", chat_payload(100000), True), ("file 8MB", file_payload(8), True),
+             ("file 50MB", file_payload(50), False)]
+    results = {}
+    for name, payload, with_legacy in cases:
+        row = {}
+        for label, frames_of in (("legacy", legacy_frames), ("framereader", reader_frames)):
+            if label == "legacy" and not with_legacy: continue
+            count, elapsed = run(frames_of, payload)
+            row[label] = {"frames": count, "seconds": round(elapsed, 3), "mb_per_sec": round(len(payload) / elapsed / 2**20, 1)}
+            print(f"{name:<14} {label:<12} {row[label]['mb_per_sec']:>8} MB/s", file=sys.stderr)
+        results[name] = row
+    json.dump(results, sys.stdout, indent=2)
+    print()
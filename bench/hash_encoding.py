@@ -0,0 +1,42 @@
+"""블록 해시 인코딩별 초당 해시 수 비교
+
+    python bench/hash_encoding.py [반복 횟수]
+
+legacy : 구버전 json.dumps(sort_keys=True) 인코딩 (version 0)
+v1     : 정규 바이너리 인코딩 (고정폭 헤더 + 길이 접두 UTF-8)
+"""
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import main
+
+MESSAGES = {
+    "short": "ok 👍",
+    "chat": "안녕하세요 10분 뒤에 회의 시작합니다. 자료는 공유 폴더에 올려 두었어요 @bob",
+    "long": "로그 " * 500,
+}
+
+
+def bench(version, message, rounds):
+    block = main.Block(123456, time.ctime(), "영희", 42, message, "ab" * 32, version=version)
+    start = time.perf_counter()
+    for _ in range(rounds):
+        block.calculate_digest()
+    elapsed = time.perf_counter() - start
+    return rounds / elapsed
+
+
+if __name__ == "__main__":
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    results = {}
+    for name, message in MESSAGES.items():
+        legacy = bench(0, message, rounds)
+        v1 = bench(1, message, rounds)
+        results[name] = {"legacy_hashes_per_sec": round(legacy), "v1_hashes_per_sec": round(v1),
+                         "speedup": round(v1 / legacy, 2)}
+        print(f"{name:<6} legacy {legacy:>10,.0f}/s   v1 {v1:>10,.0f}/s   x{v1 / legacy:.2f}", file=sys.stderr)
+    json.dump(results, sys.stdout, indent=2)
+    print()
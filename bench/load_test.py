@@ -0,0 +1,289 @@
+"""호스트 부하 테스트 (헤드리스 호스트 + 가상 게스트 N명)
+
+    python bench/load_test.py --guests 20 --rate 5 --duration 10 [--file-kb 256 --file-every 50]
+                              [--async | --workers 4] [--batch-ms 20] [--sync-lengths 1000,10000] [--out result.json]
+
+임시 디렉터리에서 `main.py --headless` 를 띄우고, 게스트마다 JOIN 후 초당 rate 개씩 CHAT(가끔 FILE)을 보냄.
+측정 항목
+  latency_ms  : 보낸 순간부터 모든 게스트가 그 메시지가 든 블록을 받을 때까지 (p50/p90/p99/max)
+  blocks/s    : 한 게스트가 받은 블록 수 / 측정 시간
+  host        : 호스트 프로세스 CPU 사용률, 최대 RSS (리눅스 /proc)
+  sync        : 체인 길이별로 새 게스트의 동기화 시간 (체크포인트 방식 / 구버전 전체 SYNC)
+결과는 JSON (릴리스 간 비교용)
+"""
+import argparse
+import base64
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import main
+
+MAIN_PY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "main.py")
+
+
+# --- 호스트 프로세스 ---
+def free_port():
+    s = socket.socket()
+    s.bind(("127.0.0.1", 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+def start_host(workdir, use_async, batch_ms, workers=0):
+    port = free_port()
+    env = dict(os.environ, CHAINCHAT_BATCH_MS=str(batch_ms))
+    cmd = [sys.executable, MAIN_PY, "--headless", "--port", str(port)] + (["--async"] if use_async else [])
+    if workers: cmd += ["--workers", str(workers)]
+    proc = subprocess.Popen(cmd, cwd=workdir, env=env, stdout=subprocess.PIPE, text=True)
+    for line in proc.stdout:
+        if line.startswith("ACCESS CODE:"): break
+    return proc, port
+
+
+class ProcessSampler:
+    """/proc 에서 호스트 CPU 시간과 RSS를 주기적으로 읽음 (리눅스 외에는 None)"""
+    def __init__(self, pid, interval=0.2):
+        self.pid = pid
+        self.interval = interval
+        self.max_rss_kb = 0
+        self.running = True
+        self.available = os.path.exists(f"/proc/{pid}/stat")
+        if self.available: threading.Thread(target=self.run, daemon=True).start()
+
+    def cpu_seconds(self):
+        if not self.available: return None
+        with open(f"/proc/{self.pid}/stat") as f: fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+    def run(self):
+        while self.running:
+            try:
+                with open(f"/proc/{self.pid}/status") as f:
+                    for line in f:
+                        if line.startswith("VmRSS:"): self.max_rss_kb = max(self.max_rss_kb, int(line.split()[1]))
+            except OSError: return
+            time.sleep(self.interval)
+
+
+# --- 가상 게스트 ---
+class Guest:
+    def __init__(self, port, name, tracker):
+        self.name = name
+        self.tracker = tracker
+        self.sock = socket.create_connection(("127.0.0.1", port))
+        self.reader = main.FrameReader(self.sock).frames()
+        self.lock = threading.Lock()
+        self.blocks = 0
+        self.sock.sendall(main.encode_packet({"type": "JOIN", "nickname": name, "have": None}))
+        self.my_id = None
+        for line in self.reader:
+            p = json.loads(line)
+            if p['type'] == 'WELCOME': self.my_id = p['assigned_id']
+            elif p['type'] == 'SYNC_DONE': break
+        threading.Thread(target=self.receive, daemon=True).start()
+
+    def send(self, packet):
+        data = main.encode_packet(packet)
+        with self.lock: self.sock.sendall(data)
+
+    def receive(self):
+        try:
+            for line in self.reader:
+                p = json.loads(line)
+                if p['type'] == 'BLOCK': data = p['data']
+                elif p['type'] == 'FILE_RECV': data = p['block_data']
+                else: continue
+                now = time.perf_counter()
+                self.blocks += 1
+                for _, _, _, message in main.block_entries(main.Block.from_dict(data)):
+                    self.tracker.arrived(message, now)
+        except (OSError, ValueError): pass
+
+    def close(self):
+        try: self.sock.close()
+        except OSError: pass
+
+
+class Tracker:
+    """메시지별로 보낸 시각과 도착한 게스트 수를 기록"""
+    def __init__(self, guests):
+        self.guests = guests
+        self.lock = threading.Lock()
+        self.sent = {}
+        self.seen = {}
+        self.done = {}
+
+    def tag(self, message):
+        # "lt <id>" 또는 파일 블록 "FILE_TRANSFER:lt-<id>.bin"
+        if message.startswith("lt "): return message[3:]
+        if message.startswith("FILE_TRANSFER:lt-"): return message[len("FILE_TRANSFER:lt-"):-4]
+        return None
+
+    def sending(self, msg_id):
+        with self.lock: self.sent[msg_id] = time.perf_counter()
+
+    def arrived(self, message, now):
+        msg_id = self.tag(message)
+        if msg_id is None: return
+        with self.lock:
+            count = self.seen.get(msg_id, 0) + 1
+            self.seen[msg_id] = count
+            if count == self.guests and msg_id in self.sent: self.done[msg_id] = now - self.sent[msg_id]
+
+    def complete(self):
+        with self.lock: return len(self.done) >= len(self.sent)
+
+
+def sender_loop(guest, tracker, rate, duration, file_kb, file_every, start_at):
+    payload = base64.b64encode(os.urandom(file_kb * 1024)).decode() if file_kb else None
+    seq = 0
+    while True:
+        at = start_at + seq / rate
+        if at - start_at >= duration: break
+        delay = at - time.perf_counter()
+        if delay > 0: time.sleep(delay)
+        msg_id = f"{guest.name}-{seq}"
+        tracker.sending(msg_id)
+        if payload and file_every and seq % file_every == file_every - 1:
+            guest.send({"type": "FILE", "sender": guest.name, "sender_id": guest.my_id,
+                        "filename": f"lt-{msg_id}.bin", "content": payload})
+        else:
+            guest.send({"type": "CHAT", "sender": guest.name, "sender_id": guest.my_id, "message": f"lt {msg_id}"})
+        seq += 1
+
+
+def run_load(port, sampler, args):
+    tracker = Tracker(args.guests)
+    guests = [Guest(port, f"g{i}", tracker) for i in range(args.guests)]
+    cpu_before = sampler.cpu_seconds()
+    start_at = time.perf_counter() + 0.2
+    senders = [threading.Thread(target=sender_loop, args=(g, tracker, args.rate, args.duration, args.file_kb,
+                                                          args.file_every, start_at)) for g in guests]
+    blocks_before = guests[0].blocks
+    for t in senders: t.start()
+    for t in senders: t.join()
+    deadline = time.perf_counter() + args.drain
+    while not tracker.complete() and time.perf_counter() < deadline: time.sleep(0.05)
+    elapsed = time.perf_counter() - start_at
+    cpu_after = sampler.cpu_seconds()
+    latencies = list(tracker.done.values())
+    result = {
+        "messages_sent": len(tracker.sent),
+        "messages_delivered_to_all": len(latencies),
+        "latency_ms": {f"p{p}": round(main.percentile(latencies, p) * 1000, 2) for p in (50, 90, 99)},
+        "blocks_per_sec": round((guests[0].blocks - blocks_before) / elapsed, 1),
+        "seconds": round(elapsed, 2),
+    }
+    result["latency_ms"]["max"] = round(max(latencies, default=0) * 1000, 2)
+    if cpu_before is not None:
+        result["host_cpu_percent"] = round((cpu_after - cpu_before) / elapsed * 100, 1)
+    for g in guests: g.close()
+    return result
+
+
+# --- 동기화 시간 ---
+def grow_chain(port, target):
+    """한 연결로 CHAT 을 몰아 보내서 체인을 늘리고 마지막 블록 index 반환 (묶음 모드면 블록 수는 더 적음)"""
+    s = socket.create_connection(("127.0.0.1", port))
+    s.sendall(main.encode_packet({"type": "JOIN", "nickname": "loader", "have": None}))
+    reader = main.FrameReader(s).frames()
+    latest = 0
+    for line in reader:
+        p = json.loads(line)
+        if p['type'] == 'SYNC_PAGE': latest = p['blocks'][-1]['index']
+        elif p['type'] == 'CHECKPOINT': latest = p['index']
+        elif p['type'] == 'SYNC_DONE': break
+    missing = target - latest
+    if missing > 0:
+        s.sendall(b"".join(main.encode_packet({"type": "CHAT", "sender": "loader", "sender_id": 0, "message": f"fill {i}"})
+                           for i in range(missing)))
+        last = f"fill {missing - 1}"
+        for line in reader:
+            p = json.loads(line)
+            if p['type'] != 'BLOCK': continue
+            latest = p['data']['index']
+            if any(e[3] == last for e in main.block_entries(main.Block.from_dict(p['data']))): break
+    s.close()
+    return latest
+
+
+def measure_sync(port, legacy):
+    s = socket.create_connection(("127.0.0.1", port))
+    start = time.perf_counter()
+    join = {"type": "JOIN", "nickname": "syncer"}
+    if not legacy: join["have"] = None
+    s.sendall(main.encode_packet(join))
+    received = 0
+    blocks = 0
+    for line in main.FrameReader(s).frames():
+        received += len(line)
+        p = json.loads(line)
+        if p['type'] == 'SYNC_PAGE': blocks += len(p['blocks'])
+        elif p['type'] == 'SYNC' and legacy:
+            blocks = len(p['chain'])
+            break
+        elif p['type'] == 'SYNC_DONE': break
+    elapsed = time.perf_counter() - start
+    s.close()
+    return {"seconds": round(elapsed, 4), "bytes": received, "blocks": blocks}
+
+
+def run_sync(port, lengths):
+    rows = []
+    for length in lengths:
+        latest = grow_chain(port, length)
+        rows.append({"chain_length": latest, "checkpoint": measure_sync(port, False), "legacy": measure_sync(port, True)})
+        print(f"sync @ {length:>8}  checkpoint {rows[-1]['checkpoint']['seconds']:>8}s  "
+              f"legacy {rows[-1]['legacy']['seconds']:>8}s", file=sys.stderr)
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="chainChat host load test")
+    parser.add_argument("--guests", type=int, default=20)
+    parser.add_argument("--rate", type=float, default=5, help="게스트당 초당 메시지 수")
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--drain", type=float, default=10, help="전송이 끝난 뒤 도착을 기다리는 최대 시간")
+    parser.add_argument("--file-kb", type=int, default=0, help="FILE 패킷 크기 (0이면 파일 없음)")
+    parser.add_argument("--file-every", type=int, default=50, help="메시지 몇 개마다 파일 하나")
+    parser.add_argument("--async", dest="use_async", action="store_true")
+    parser.add_argument("--workers", type=int, default=0, help="멀티 프로세스 호스트 워커 수 (0이면 한 프로세스)")
+    parser.add_argument("--batch-ms", type=float, default=0)
+    parser.add_argument("--sync-lengths", default="1000,10000")
+    parser.add_argument("--out")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="chainchat-load-")
+    proc, port = start_host(workdir, args.use_async, args.batch_ms, args.workers)
+    sampler = ProcessSampler(proc.pid)
+    try:
+        load = run_load(port, sampler, args)
+        print(f"latency p50 {load['latency_ms']['p50']}ms p99 {load['latency_ms']['p99']}ms  "
+              f"{load['blocks_per_sec']} blocks/s  delivered {load['messages_delivered_to_all']}/{load['messages_sent']}",
+              file=sys.stderr)
+        lengths = [int(x) for x in args.sync_lengths.split(",") if x]
+        sync = run_sync(port, lengths)
+    finally:
+        sampler.running = False
+        proc.terminate()
+        proc.wait(10)
+    results = {
+        "config": {k: v for k, v in vars(args).items() if k != "out"},
+        "environment": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "load": load,
+        "host_max_rss_kb": sampler.max_rss_kb or None,
+        "sync": sync,
+    }
+    if args.out:
+        with open(args.out, "w") as f: json.dump(results, f, indent=2)
+    json.dump(results, sys.stdout, indent=2)
+    print()
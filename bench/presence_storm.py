@@ -0,0 +1,112 @@
+"""대량 입장 시 접속자 목록 방송 비용 측정 (구버전 USER_LIST 전체 방송 / PRESENCE 델타)
+
+    python bench/presence_storm.py [--guests 1000] [--legacy-share 0] [--async]
+
+임시 디렉터리에서 호스트를 띄우고 게스트 N명이 한꺼번에 JOIN. 게스트 소켓은 selectors 스레드 하나가 모두 읽음.
+--legacy-share 만큼은 presence 없이 JOIN 하는 구버전 게스트 (1 이면 이전 동작과 같은 USER_LIST 방송).
+측정 항목: 모든 게스트가 전체 목록을 볼 때까지 걸린 시간, 게스트가 받은 접속자 목록 패킷 수/바이트 (채팅 블록 제외),
+호스트 프로세스 CPU 시간. 결과는 JSON
+"""
+import argparse
+import json
+import os
+import selectors
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import main
+
+
+def free_port():
+    s = socket.socket()
+    s.bind(("127.0.0.1", 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+class Guest:
+    def __init__(self, port, name, legacy):
+        self.sock = socket.create_connection(("127.0.0.1", port))
+        self.reader = main.FrameReader(None)
+        self.presence = main.Presence()
+        self.users = []
+        self.packets = 0
+        self.bytes = 0
+        join = {"type": "JOIN", "nickname": name, "have": None}
+        if not legacy: join["presence"] = 1
+        self.sock.sendall(main.encode_packet(join))
+
+    def feed(self, data):
+        for line in self.reader.feed(data):
+            if b'"USER_LIST"' not in line and b'"PRESENCE"' not in line: continue   # 블록은 파싱하지 않음
+            p = json.loads(line)
+            self.packets += 1
+            self.bytes += len(line)
+            if p['type'] == 'USER_LIST': self.users = p['users']
+            else:
+                if not self.presence.apply(p): self.sock.sendall(main.encode_packet({"type": "PRESENCE_REQ"}))
+                self.users = self.presence.names()
+
+
+def read_all(guests, stop):
+    sel = selectors.DefaultSelector()
+    for g in guests: sel.register(g.sock, selectors.EVENT_READ, g)
+    while not stop.is_set():
+        for key, _ in sel.select(0.1):
+            try: data = key.fileobj.recv(1 << 16)
+            except OSError: data = b""
+            if data: key.data.feed(data)
+            else: sel.unregister(key.fileobj)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="chainChat presence storm benchmark")
+    parser.add_argument("--guests", type=int, default=1000)
+    parser.add_argument("--legacy-share", type=float, default=0, help="구버전(USER_LIST) 게스트 비율 0~1")
+    parser.add_argument("--async", dest="use_async", action="store_true")
+    parser.add_argument("--timeout", type=float, default=120)
+    args = parser.parse_args()
+
+    os.chdir(tempfile.mkdtemp(prefix="chainchat-presence-"))
+    engine = main.AsyncChatHost if args.use_async else main.ThreadedChatHost
+    host = engine(None, blockchain=main.Blockchain(), room_key="bench", file_store=main.FileStore())
+    port = free_port()
+    host.open("127.0.0.1", port)
+    host.run_in_thread()
+
+    legacy = int(args.guests * args.legacy_share)
+    cpu_before = time.process_time()
+    start = time.perf_counter()
+    guests = [Guest(port, f"g{i}", i < legacy) for i in range(args.guests)]
+    stop = threading.Event()
+    reader = threading.Thread(target=read_all, args=(guests, stop), daemon=True)
+    reader.start()
+    deadline = time.time() + args.timeout
+    while time.time() < deadline and any(len(g.users) < args.guests for g in guests): time.sleep(0.05)
+    converge_s = time.perf_counter() - start
+    complete = all(len(g.users) == args.guests for g in guests)
+    cpu_s = time.process_time() - cpu_before    # 게스트 쪽 파싱도 포함 (같은 프로세스)
+    stop.set()
+    reader.join()
+    host.stop()
+
+    packets = sum(g.packets for g in guests)
+    total_bytes = sum(g.bytes for g in guests)
+    results = {
+        "config": vars(args),
+        "complete": complete,
+        "converge_seconds": round(converge_s, 2),
+        "process_cpu_seconds": round(cpu_s, 2),
+        "presence_packets": packets,
+        "presence_bytes": total_bytes,
+        "bytes_per_guest": total_bytes // max(1, args.guests),
+    }
+    print(f"{args.guests} guests ({legacy} legacy)  converged {converge_s:.2f}s complete={complete}  "
+          f"{packets} list packets  {total_bytes / 1e6:.1f}MB  cpu {cpu_s:.2f}s", file=sys.stderr)
+    json.dump(results, sys.stdout, indent=2)
+    print()
@@ -0,0 +1,155 @@
+"""게스트 중계 트리 사용 시 호스트 송신량 비교 (호스트가 모두에게 직접 / RELAY_FANOUT 트리)
+
+    python bench/relay_egress.py [--guests 30] [--fanout 0,3] [--messages 200] [--file-mb 5] [--async]
+
+fanout 값마다 임시 디렉터리에서 호스트를 띄우고 게스트 N명이 JOIN (WELCOME 에 relay 가 있으면 중계 포트(RelayNode)를 열고 RELAY_PORT).
+트리가 자리 잡은 뒤 게스트 하나가 CHAT 여러 개와 레거시 FILE 하나(FILE_RECV 로 방송)를 보내고,
+모든 게스트 체인이 마지막 블록까지 따라올 때까지의 시간과 그동안 호스트 -> 게스트 연결로 나간 바이트를 측정.
+중계로 놓친 블록은 앱과 같은 방식(HEAD -> RELAY_MISS + SYNC_REQ)으로 복구. 결과는 JSON
+"""
+import argparse
+import base64
+import json
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import main
+
+
+def free_port():
+    s = socket.socket()
+    s.bind(("127.0.0.1", 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+class Guest:
+    """BlockChatApp 의 수신/중계 부분만 (GUI 없음)"""
+    def __init__(self, port, name, room_key):
+        self.chain = main.Blockchain()
+        self.lock = threading.Lock()
+        self.room_key = room_key
+        self.node = None
+        self.host_bytes = 0
+        self.misses = 0
+        self.syncing = True
+        self.sock = socket.create_connection(("127.0.0.1", port))
+        self.sock.sendall(main.encode_packet({"type": "JOIN", "nickname": name, "have": None, "codecs": ["bin"],
+                                              "presence": 1}))
+        threading.Thread(target=self.receive, daemon=True).start()
+
+    def receive(self):
+        reader = main.FrameReader(self.sock)
+        try:
+            while True:
+                data = self.sock.recv(1 << 20)
+                if not data: return
+                self.host_bytes += len(data)
+                for frame in reader.feed(data):
+                    p = frame if isinstance(frame, dict) else json.loads(frame)
+                    with self.lock: self.handle(p)
+        except OSError: pass
+
+    def relayed(self, p):
+        with self.lock: self.broadcast(p)
+
+    def handle(self, p):
+        if p['type'] == 'WELCOME' and p.get('relay'):
+            self.node = main.RelayNode(self.room_key, self.relayed, host="127.0.0.1")
+            self.sock.sendall(main.encode_packet({"type": "RELAY_PORT", "port": self.node.port}))
+        elif p['type'] == 'SYNC_PAGE':
+            for b in p['blocks']: self.chain.add_block(main.wire_block(b))
+        elif p['type'] == 'SYNC_DONE': self.syncing = False
+        elif p['type'] in ('BLOCK', 'FILE_RECV'): self.broadcast(p)
+        elif p['type'] == 'RELAY_PEERS' and self.node: self.node.set_children(p['children'])
+        elif p['type'] == 'HEAD' and self.node:
+            if self.syncing or p['index'] <= self.chain.get_latest_block().index or self.node.receiving(): return
+            self.misses += 1
+            self.sync()
+            self.sock.sendall(main.encode_packet({"type": "RELAY_MISS"}))
+
+    def broadcast(self, p):
+        block = main.wire_block(p['data'] if p['type'] == 'BLOCK' else p['block_data'])
+        if self.node and self.node.seen(block.digest): return
+        extra = {k: v for k, v in p.items() if k not in ("type", "block_data")} if p['type'] == 'FILE_RECV' else None
+        if self.chain.add_block(block):
+            if self.node: self.node.forward(block, extra)
+        elif block.index > self.chain.get_latest_block().index and not self.syncing: self.sync()
+
+    def sync(self):
+        latest = self.chain.get_latest_block()
+        self.syncing = True
+        self.sock.sendall(main.encode_packet({"type": "SYNC_REQ", "have": {"index": latest.index, "hash": latest.hash},
+                                              "locator": self.chain.locator()}))
+
+    def close(self):
+        if self.node: self.node.close()
+        self.sock.close()
+
+
+def run(fanout, args):
+    os.chdir(tempfile.mkdtemp(prefix="chainchat-relay-"))
+    engine = main.AsyncChatHost if args.use_async else main.ThreadedChatHost
+    host = engine(None, blockchain=main.Blockchain(), room_key="bench", file_store=main.FileStore(), relay=fanout)
+    port = free_port()
+    host.open("127.0.0.1", port)
+    host.run_in_thread()
+    guests = [Guest(port, f"g{i}", "bench") for i in range(args.guests)]
+    time.sleep(main.RELAY_GRACE + 1)   # JOIN 블록 방송과 트리 유예 시간이 끝날 때까지
+
+    before = sum(g.host_bytes for g in guests)
+    start = time.perf_counter()
+    sender = guests[-1].sock
+    for i in range(args.messages):
+        sender.sendall(main.encode_packet({"type": "CHAT", "sender": "g", "sender_id": 2, "message": f"relay {i}"}))
+    if args.file_mb:
+        content = base64.b64encode(os.urandom(int(args.file_mb * 1024 * 1024))).decode()
+        sender.sendall(main.encode_packet({"type": "FILE", "sender": "g", "sender_id": 2, "filename": "bench.bin",
+                                           "content": content}))
+    else: sender.sendall(main.encode_packet({"type": "CHAT", "sender": "g", "sender_id": 2, "message": "relay end"}))
+    last = "FILE_TRANSFER:bench.bin" if args.file_mb else "relay end"
+    deadline = time.time() + args.timeout
+    while time.time() < deadline:
+        latest = host.blockchain.get_latest_block()
+        target = latest.index
+        done = any(e[3] == last for e in main.block_entries(latest))
+        if done and all(g.chain.get_latest_block().index >= target for g in guests): break
+        time.sleep(0.05)
+    elapsed = time.perf_counter() - start
+    target = host.blockchain.get_latest_block().index
+    result = {
+        "fanout": fanout,
+        "complete": all(g.chain.get_latest_block().index >= target for g in guests),
+        "seconds": round(elapsed, 2),
+        "host_egress_bytes": sum(g.host_bytes for g in guests) - before,
+        "relay_misses": sum(g.misses for g in guests),
+    }
+    for g in guests: g.close()
+    host.stop()
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="chainChat guest relay egress benchmark")
+    parser.add_argument("--guests", type=int, default=30)
+    parser.add_argument("--fanout", default="0,3", help="중계 트리 fanout 목록 (0 = 중계 없음)")
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--file-mb", type=float, default=5, help="레거시 FILE 크기 (0 이면 보내지 않음)")
+    parser.add_argument("--async", dest="use_async", action="store_true")
+    parser.add_argument("--timeout", type=float, default=60)
+    args = parser.parse_args()
+
+    rows = []
+    for fanout in [int(x) for x in args.fanout.split(",") if x]:
+        rows.append(run(fanout, args))
+        r = rows[-1]
+        print(f"fanout {fanout}  host egress {r['host_egress_bytes'] / 1e6:8.1f}MB  {r['seconds']:>6}s  "
+              f"complete={r['complete']}  misses {r['relay_misses']}", file=sys.stderr)
+    json.dump({"config": vars(args), "results": rows}, sys.stdout, indent=2)
+    print()
@@ -0,0 +1,112 @@
+"""한 포트에 방 여러 개를 띄웠을 때 방 하나당 메모리/스레드 비용 측정
+
+    python bench/room_density.py [--rooms 500] [--messages 20] [--async]
+
+임시 디렉터리에서 RoomHost 를 띄우고 방마다 게스트 하나가 JOIN 해서 메시지를 보낸 뒤 나감.
+측정 항목 (리눅스 /proc/self 기준)
+  loaded  : 모든 방 엔진이 메모리에 올라와 있을 때 RSS, 스레드 수
+  evicted : 유휴 방을 내린(sweep) 뒤 RSS, 스레드 수
+  per_room_kb : (loaded - 방 없음) / 방 수, (evicted - 방 없음) / 방 수
+결과는 JSON
+"""
+import argparse
+import json
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import main
+
+
+def rss_kb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"): return int(line.split()[1])
+    except OSError: return None
+
+
+def free_port():
+    s = socket.socket()
+    s.bind(("127.0.0.1", 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+def visit(port, room_id, messages):
+    """방에 JOIN 해서 메시지를 보내고 마지막 메시지가 블록으로 돌아오면 나감"""
+    s = socket.create_connection(("127.0.0.1", port))
+    s.sendall(main.encode_packet({"type": "JOIN", "nickname": "bench", "have": None, "room": room_id}))
+    reader = main.FrameReader(s).frames()
+    for line in reader:
+        if json.loads(line)['type'] == 'SYNC_DONE': break
+    s.sendall(b"".join(main.encode_packet({"type": "CHAT", "sender": "bench", "sender_id": 2, "message": f"m {i}"})
+                       for i in range(messages)))
+    last = f"m {messages - 1}"
+    for line in reader:
+        p = json.loads(line)
+        if p['type'] == 'BLOCK' and any(e[3] == last for e in main.block_entries(main.Block.from_dict(p['data']))): break
+    s.close()
+
+
+def snapshot(host):
+    return {"rss_kb": rss_kb(), "threads": threading.active_count(), "loaded_rooms": len(host.loaded_rooms())}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="chainChat multi-room density benchmark")
+    parser.add_argument("--rooms", type=int, default=500)
+    parser.add_argument("--messages", type=int, default=20, help="방마다 보내는 메시지 수")
+    parser.add_argument("--async", dest="use_async", action="store_true")
+    args = parser.parse_args()
+
+    os.chdir(tempfile.mkdtemp(prefix="chainchat-rooms-"))
+    host = main.RoomHost(main.AsyncChatHost if args.use_async else main.ThreadedChatHost, file_store=main.FileStore(),
+                         idle=3600)
+    port = free_port()
+    host.open("127.0.0.1", port)
+    host.run_in_thread()
+    empty = snapshot(host)
+
+    room_ids = [f"r{i}" for i in range(args.rooms)]
+    for room_id in room_ids: host.add_room(room_id)
+    registered = snapshot(host)
+
+    start = time.perf_counter()
+    for room_id in room_ids: visit(port, room_id, args.messages)
+    load_s = time.perf_counter() - start
+    time.sleep(0.2)     # 마지막 연결 정리 (release)
+    loaded = snapshot(host)
+
+    host.idle = 0
+    done = threading.Event()
+    host.call(lambda: (host.sweep(), done.set()))
+    done.wait(60)
+    evicted = snapshot(host)
+
+    start = time.perf_counter()
+    visit(port, room_ids[0], 1)
+    reload_ms = (time.perf_counter() - start) * 1000
+    host.stop()
+
+    def per_room(s): return round((s["rss_kb"] - empty["rss_kb"]) / args.rooms, 1) if s["rss_kb"] else None
+    results = {
+        "config": vars(args),
+        "empty": empty,
+        "registered": registered,
+        "loaded": loaded,
+        "evicted": evicted,
+        "per_room_kb": {"registered": per_room(registered), "loaded": per_room(loaded), "evicted": per_room(evicted)},
+        "visit_seconds": round(load_s, 2),
+        "reload_ms": round(reload_ms, 1),
+    }
+    print(f"{args.rooms} rooms  loaded {per_room(loaded)}KB/room, {loaded['threads']} threads, "
+          f"{loaded['loaded_rooms']} open  evicted {per_room(evicted)}KB/room, {evicted['threads']} threads, "
+          f"{evicted['loaded_rooms']} open  reload {reload_ms:.1f}ms", file=sys.stderr)
+    json.dump(results, sys.stdout, indent=2)
+    print()
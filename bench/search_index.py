@@ -0,0 +1,91 @@
+"""전문 검색 색인 측정 (색인 생성 시간, 검색 지연, 저장/불러오기)
+
+    python bench/search_index.py [--blocks 1000000] [--batch-every 0]
+
+메모리 체인(BlockTable)에 한글/영문이 섞인 채팅 블록을 만들고 SearchIndex 를 처음부터 만든 뒤,
+여러 검색어의 지연(p50/p99/max)과 색인 파일 크기, 다시 읽는 시간을 측정. 결과는 JSON
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import main
+
+WORDS = ["안녕하세요", "오늘", "회의는", "자료를", "확인", "부탁드립니다", "점심", "뭐", "먹을까요", "배포", "서버가",
+         "느려요", "ok", "lunch", "deploy", "ㅋㅋㅋ", "넵", "감사합니다", "내일", "일정", "공유", "버그", "고쳤어요"]
+QUERIES = ["회의", "점심 먹", "서버", "deploy", "감사", "고쳤", "ㅋ", "일정 공유", "user3", "없는검색어", "부탁드립니다",
+           "이슈 4242", "배포 이슈 31337"]
+
+
+def build_chain(blocks, batch_every, seed=1):
+    rnd = random.Random(seed)
+    chain = main.Blockchain()
+    for i in range(blocks):
+        message = " ".join(rnd.choice(WORDS) for _ in range(rnd.randint(1, 8)))
+        if i % 5 == 0: message += f" 이슈 {rnd.randint(0, 99999)}"   # 드문 토큰 (후보는 많고 실제 일치는 적은 경우)
+        entries = [(time.ctime(), f"user{i % 9}", 2 + i % 9, message)]
+        if batch_every and i % batch_every == 0:
+            entries += [(time.ctime(), f"user{k}", 2 + k, " ".join(rnd.choice(WORDS) for _ in range(3))) for k in range(4)]
+        main.seal_block(chain, entries)
+    return chain
+
+
+def query_latency(index, rounds):
+    samples = {}
+    for q in QUERIES:
+        times = []
+        for _ in range(rounds):
+            start = time.perf_counter()
+            hits = index.search(q)
+            times.append(time.perf_counter() - start)
+        samples[q] = {"hits": len(hits), "median_ms": round(sorted(times)[len(times) // 2] * 1000, 3)}
+    flat = [v["median_ms"] for v in samples.values()]
+    return samples, {"p50_ms": main.percentile(flat, 50), "p99_ms": main.percentile(flat, 99), "max_ms": max(flat)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="chainChat search index benchmark")
+    parser.add_argument("--blocks", type=int, default=200000)
+    parser.add_argument("--batch-every", type=int, default=0, help="블록 몇 개마다 묶음 블록 하나 (0이면 없음)")
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    chain = build_chain(args.blocks, args.batch_every)
+    print(f"chain built in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+
+    start = time.perf_counter()
+    index = chain.search_index()
+    build_s = time.perf_counter() - start
+    queries, summary = query_latency(index, args.rounds)
+
+    path = os.path.join(tempfile.mkdtemp(prefix="chainchat-search-"), "room.search")
+    start = time.perf_counter()
+    index.save(path)
+    save_s = time.perf_counter() - start
+    start = time.perf_counter()
+    loaded = main.SearchIndex(chain)
+    ok = loaded.load(path)
+    load_s = time.perf_counter() - start
+    same = ok and all(loaded.search(q) == index.search(q) for q in QUERIES)
+
+    results = {
+        "config": vars(args),
+        "tokens": len(index.postings),
+        "build_seconds": round(build_s, 2),
+        "query": summary,
+        "queries": queries,
+        "file_bytes": os.path.getsize(path),
+        "save_seconds": round(save_s, 3),
+        "load_seconds": round(load_s, 3),
+        "loaded_matches": same,
+    }
+    print(f"build {build_s:.1f}s  query p50 {summary['p50_ms']}ms max {summary['max_ms']}ms  "
+          f"file {results['file_bytes'] // 1024}KB load {load_s:.2f}s", file=sys.stderr)
+    json.dump(results, sys.stdout, indent=2, ensure_ascii=False)
+    print()
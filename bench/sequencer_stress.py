@@ -0,0 +1,88 @@
+"""동시 송신자 스트레스 테스트 (스레드 호스트의 블록 생성)
+
+    python bench/sequencer_stress.py [송신자 수] [송신자당 메시지 수]
+
+direct    : 기존 방식. 각 스레드가 get_latest_block() -> add_block() 을 직접 호출 (같은 index 경쟁으로 유실)
+sequencer : ChainSequencer 하나가 큐에서 꺼내 순서대로 생성
+sequencer 결과는 유실 0, 체인 검증 통과, 송신자별 순서 유지, 방송 순서 = 체인 순서 여야 하며 아니면 종료 코드 1
+"""
+import json
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import main
+
+
+def run_senders(senders, per_sender, send):
+    start_gate = threading.Barrier(senders)
+
+    def worker(sid):
+        start_gate.wait()
+        for i in range(per_sender): send(f"user{sid}", sid, f"{sid}:{i}")
+
+    threads = [threading.Thread(target=worker, args=(sid,)) for sid in range(2, senders + 2)]
+    start = time.perf_counter()
+    for t in threads: t.start()
+    for t in threads: t.join()
+    return start
+
+
+def direct(senders, per_sender):
+    chain = main.Blockchain()
+
+    errors = []
+
+    def send(sender, sender_id, msg):
+        last = chain.get_latest_block()
+        try: chain.add_block(main.Block(last.index + 1, time.ctime(), sender, sender_id, msg, last.hash))
+        except ValueError as e: errors.append(e)  # 검사와 추가 사이에 다른 스레드가 끼어듦
+
+    start = run_senders(senders, per_sender, send)
+    elapsed = time.perf_counter() - start
+    return {"sent": senders * per_sender, "mined": len(chain.chain) - 1, "store_errors": len(errors), "seconds": round(elapsed, 3)}
+
+
+def sequenced(senders, per_sender):
+    chain = main.Blockchain()
+    published = []
+    done = threading.Event()
+    total = senders * per_sender
+
+    def publish(mined):
+        published.extend(block for block, _ in mined)
+        if len(published) >= total: done.set()
+
+    seq = main.ChainSequencer(chain, publish).start()
+    start = run_senders(senders, per_sender, seq.submit)
+    done.wait(60)
+    elapsed = time.perf_counter() - start
+    seq.stop()
+
+    blocks = list(chain.chain)
+    last_seen = {}
+    in_order = True
+    for b in blocks[1:]:
+        sid, i = map(int, b.message.split(":"))
+        if last_seen.get(sid, -1) != i - 1: in_order = False
+        last_seen[sid] = i
+    valid = all(bad is None for _, _, bad in main.verify_chain([main.Block.from_dict(b.to_dict()) for b in blocks]))
+    return {"sent": total, "mined": len(blocks) - 1, "seconds": round(elapsed, 3),
+            "blocks_per_sec": round(total / elapsed), "chain_valid": valid, "per_sender_order": in_order,
+            "publish_matches_chain": [b.hash for b in published] == [b.hash for b in blocks[1:]]}
+
+
+if __name__ == "__main__":
+    senders = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    per_sender = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    sys.setswitchinterval(1e-6)  # 스레드 전환을 자주 일으켜 경쟁 상황을 재현
+    results = {"senders": senders, "per_sender": per_sender,
+               "direct": direct(senders, per_sender), "sequencer": sequenced(senders, per_sender)}
+    json.dump(results, sys.stdout, indent=2)
+    print()
+    r = results["sequencer"]
+    ok = r["mined"] == r["sent"] and r["chain_valid"] and r["per_sender_order"] and r["publish_matches_chain"]
+    print("OK" if ok else "FAILED", file=sys.stderr)
+    sys.exit(0 if ok else 1)
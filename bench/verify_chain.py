@@ -0,0 +1,37 @@
+"""verify_chain 처리량 측정 (프로세스 수별)
+
+    python bench/verify_chain.py [블록 수] [워커 수 ...]
+"""
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import main
+
+
+def build_chain(n):
+    chain = main.Blockchain().chain[:]
+    for i in range(1, n):
+        last = chain[-1]
+        chain.append(main.Block(i, time.ctime(), "alice", 2, f"message {i}", last.hash))
+    # 네트워크로 받은 것처럼 검증되지 않은 상태로 복원
+    return [main.Block.from_dict(b.to_dict()) for b in chain]
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10**6
+    worker_counts = [int(a) for a in sys.argv[2:]] or [1, os.cpu_count() or 1]
+    data = [b.to_dict() for b in build_chain(n)]
+    results = {}
+    for workers in worker_counts:
+        blocks = [main.Block.from_dict(d) for d in data]
+        start = time.perf_counter()
+        for checked, total, bad in main.verify_chain(blocks, workers=workers):
+            assert bad is None
+        elapsed = time.perf_counter() - start
+        results[workers] = {"seconds": round(elapsed, 3), "blocks_per_sec": round(n / elapsed)}
+        print(f"{workers:>3} workers  {elapsed:7.2f}s  {n / elapsed:>12,.0f} blocks/s", file=sys.stderr)
+    json.dump({"blocks": n, "workers": results}, sys.stdout, indent=2)
+    print()
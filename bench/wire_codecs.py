@@ -0,0 +1,59 @@
+"""히스토리 동기화 전송량 비교 (JSON 줄 / 바이너리 프레임 / 바이너리 + zlib 스트림)
+
+    python bench/wire_codecs.py [--blocks 20000] [--batch-every 10]
+
+메모리 체인에 채팅 블록(가끔 묶음 블록)을 만들고, 새 게스트 한 명에게 보내는 sync_packets 전체를
+WireCodec 별로 인코딩한 바이트 수와 인코딩/디코딩(FrameReader.feed) 시간을 측정. 결과는 JSON
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import main
+
+CODECS = {"json": [], "bin": ["bin"], "bin+zlib": ["bin", "zlib"]}
+WORDS = ["안녕하세요", "오늘", "회의", "자료", "확인", "부탁드립니다", "ok", "lunch?", "ㅋㅋㅋ", "넵", "https://example.com/doc"]
+
+
+def build_chain(blocks, batch_every):
+    chain = main.Blockchain()
+    for i in range(blocks):
+        entries = [(time.ctime(), f"user{i % 7}", 2 + i % 7, " ".join(WORDS[(i + k) % len(WORDS)] for k in range(1 + i % 6)))]
+        if batch_every and i % batch_every == 0:
+            entries += [(time.ctime(), f"user{k}", 2 + k, f"{WORDS[k % len(WORDS)]} {i}") for k in range(5)]
+        main.seal_block(chain, entries)
+    return chain
+
+
+def measure(chain, codecs):
+    start = time.perf_counter()
+    codec = main.WireCodec(codecs)
+    data = b"".join(codec.sync(p) for p in main.sync_packets(chain, {"index": 0, "hash": chain.chain[0].hash}, "key"))
+    encoded = time.perf_counter()
+    reader = main.FrameReader(None)
+    blocks = 0
+    for frame in reader.feed(data):
+        p = frame if isinstance(frame, dict) else json.loads(frame)
+        if p['type'] == 'SYNC_PAGE': blocks += sum(1 for d in p['blocks'] if main.wire_block(d))
+    decoded = time.perf_counter()
+    return {"bytes": len(data), "blocks": blocks, "encode_ms": round((encoded - start) * 1000, 1),
+            "decode_ms": round((decoded - encoded) * 1000, 1)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="chainChat wire codec comparison")
+    parser.add_argument("--blocks", type=int, default=20000)
+    parser.add_argument("--batch-every", type=int, default=10, help="블록 몇 개마다 묶음 블록 하나 (0이면 없음)")
+    args = parser.parse_args()
+
+    chain = build_chain(args.blocks, args.batch_every)
+    results = {name: measure(chain, codecs) for name, codecs in CODECS.items()}
+    for name, r in results.items():
+        r["ratio_vs_json"] = round(results["json"]["bytes"] / r["bytes"], 2)
+        print(f"{name:>9}  {r['bytes']:>10} bytes  x{r['ratio_vs_json']:<5}  "
+              f"encode {r['encode_ms']:>7}ms  decode {r['decode_ms']:>7}ms", file=sys.stderr)
+    json.dump({"config": vars(args), "results": results}, sys.stdout, indent=2)
+    print()
@@ -0,0 +1,123 @@
+"""멀티 프로세스 호스트 처리량 측정 (워커 수별 초당 메시지 수)
+
+    python bench/worker_scaling.py [--workers 0,1,2,4,8] [--guests 64] [--client-procs 4] [--duration 10]
+
+워커 수마다 `main.py --headless --workers N` 을 띄우고 (0 은 한 프로세스 호스트), 클라이언트 프로세스 여러 개에
+나눈 게스트가 최대 속도로 CHAT 을 보내고 받은 데이터는 읽고 버림 (TCP 가 막히면 보내는 쪽도 느려짐).
+관찰자 게스트 하나가 블록에 든 메시지 수를 세서 초당 처리량을 구하고, 호스트 CPU 는 부모 + 워커 프로세스 합계.
+클라이언트도 CPU 를 쓰므로 호스트와 다른 머신에서 돌리거나 코어 수를 넉넉히. 결과는 JSON
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import main
+import load_test
+
+
+def tree_cpu_seconds(pid):
+    """pid 와 그 자식 프로세스들의 CPU 시간 합 (리눅스 /proc, 아니면 None)"""
+    if not os.path.exists(f"/proc/{pid}/stat"): return None
+    total = 0
+    for name in os.listdir("/proc"):
+        if not name.isdigit(): continue
+        try:
+            with open(f"/proc/{name}/stat") as f: fields = f.read().rsplit(")", 1)[1].split()
+        except OSError: continue
+        if int(name) == pid or int(fields[1]) == pid: total += int(fields[11]) + int(fields[12])
+    return total / os.sysconf("SC_CLK_TCK")
+
+
+def blast(port, guests, duration, burst, start_at):
+    """클라이언트 프로세스 하나: 게스트마다 보내는 스레드 + 읽고 버리는 스레드"""
+    def guest(i):
+        s = socket.create_connection(("127.0.0.1", port))
+        s.sendall(main.encode_packet({"type": "JOIN", "nickname": f"w{os.getpid()}-{i}", "have": None, "codecs": ["bin"]}))
+        threading.Thread(target=drain, args=(s,), daemon=True).start()
+        delay = start_at - time.time()
+        if delay > 0: time.sleep(delay)
+        seq = 0
+        try:
+            while time.time() < start_at + duration:
+                s.sendall(b"".join(main.encode_packet({"type": "CHAT", "sender": "w", "sender_id": 2, "message": f"ws {seq + k}"})
+                                   for k in range(burst)))
+                seq += burst
+        except OSError: pass
+
+    def drain(s):
+        try:
+            while s.recv(1 << 20): pass
+        except OSError: pass
+
+    threads = [threading.Thread(target=guest, args=(i,)) for i in range(guests)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+
+
+def observe(port, start_at, duration):
+    """블록에 든 "ws " 메시지 수를 측정 구간 동안 셈"""
+    s = socket.create_connection(("127.0.0.1", port))
+    s.sendall(main.encode_packet({"type": "JOIN", "nickname": "observer", "have": None, "codecs": ["bin"]}))
+    s.settimeout(1)
+    reader = main.FrameReader(s)
+    count = 0
+    end = start_at + duration
+    while time.time() < end:
+        try: data = s.recv(1 << 20)
+        except socket.timeout: continue
+        if not data: break
+        for frame in reader.feed(data):
+            p = frame if isinstance(frame, dict) else json.loads(frame)
+            if p['type'] != 'BLOCK' or time.time() < start_at: continue
+            count += sum(1 for e in main.block_entries(main.wire_block(p['data'])) if e[3].startswith("ws "))
+    s.close()
+    return count
+
+
+def run(workers, args):
+    workdir = tempfile.mkdtemp(prefix="chainchat-workers-")
+    proc, port = load_test.start_host(workdir, False, args.batch_ms, workers)
+    try:
+        start_at = time.time() + 2
+        clients = [multiprocessing.Process(target=blast, args=(port, args.guests // args.client_procs, args.duration,
+                                                               args.burst, start_at)) for _ in range(args.client_procs)]
+        for c in clients: c.start()
+        while time.time() < start_at: time.sleep(0.01)
+        cpu_before = tree_cpu_seconds(proc.pid)
+        messages = observe(port, start_at, args.duration)
+        cpu_after = tree_cpu_seconds(proc.pid)
+        for c in clients: c.join(10)
+    finally:
+        proc.terminate()
+        proc.wait(10)
+    result = {"workers": workers, "messages_per_sec": round(messages / args.duration, 1)}
+    if cpu_before is not None: result["host_cpu_percent"] = round((cpu_after - cpu_before) / args.duration * 100, 1)
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="chainChat multi-process host scaling")
+    parser.add_argument("--workers", default="0,1,2,4,8", help="워커 수 목록 (0 = 한 프로세스 호스트)")
+    parser.add_argument("--guests", type=int, default=64)
+    parser.add_argument("--client-procs", type=int, default=4, help="게스트를 나눠 띄울 클라이언트 프로세스 수")
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--burst", type=int, default=20, help="게스트가 한 번에 이어 보내는 CHAT 수")
+    parser.add_argument("--batch-ms", type=float, default=0)
+    args = parser.parse_args()
+
+    rows = []
+    for workers in [int(x) for x in args.workers.split(",") if x]:
+        rows.append(run(workers, args))
+        print(f"workers {workers:>2}  {rows[-1]['messages_per_sec']:>10} msg/s  cpu {rows[-1].get('host_cpu_percent')}%",
+              file=sys.stderr)
+    base = rows[0]["messages_per_sec"] or 1
+    for row in rows: row["speedup"] = round(row["messages_per_sec"] / base, 2)
+    json.dump({"config": vars(args), "cpus": os.cpu_count(), "results": rows}, sys.stdout, indent=2)
+    print()
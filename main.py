@@ -1,15 +1,38 @@
-import tkinter as tk
-from tkinter import messagebox, scrolledtext, filedialog
+try:
+    import tkinter as tk
+    from tkinter import messagebox, scrolledtext, filedialog
+except ImportError:  # 헤드리스 호스트(--headless)는 Tk 없이 동작
+    tk = None
 import socket
 import threading
 import json
+import re
 import hashlib
 import time
 import base64
+import zlib
 import os
 import sys
+import shutil
 import textwrap
 import platform 
+import argparse
+import signal
+import hmac
+import secrets
+import mmap
+import struct
+from array import array
+import multiprocessing
+import multiprocessing.connection
+from multiprocessing import shared_memory
+import asyncio
+import queue
+import itertools
+from bisect import bisect_left, bisect_right
+from collections import deque, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
 # ----------------------------------------------------------
 # [0] OS 감지 및 환경 설정
@@ -32,6 +55,218 @@ if IS_WINDOWS:
         ctypes.windll.shcore.SetProcessDpiAwareness(1)
     except: pass
 
+# --- 계측: 카운터 / 시간 히스토그램 / 게이지 (기본은 꺼짐. 호출부는 `if METRICS.on:` 한 번만 확인) ---
+METRICS_FILE = os.environ.get("CHAINCHAT_METRICS_FILE")            # 통계 JSON 을 주기적으로 쓰는 파일
+METRICS_PORT = int(os.environ.get("CHAINCHAT_METRICS_PORT", "0"))  # 127.0.0.1 HTTP 통계 포트 (0 = 끔)
+PROFILE_ON = os.environ.get("CHAINCHAT_PROFILE") == "1"            # 샘플링 프로파일러를 처음부터 켬
+METRICS_ON = os.environ.get("CHAINCHAT_METRICS") == "1" or bool(METRICS_FILE or METRICS_PORT or PROFILE_ON)
+METRICS_DUMP_SECONDS = 10    # 통계 파일을 다시 쓰는 주기
+PROFILE_INTERVAL = 0.005     # 프로파일러가 모든 스레드 스택을 찍는 간격 (초)
+PROFILE_TOP = 30             # 통계에 넣는 많이 찍힌 함수 수
+
+class Histogram:
+    """시간 값을 2의 거듭제곱 µs 구간별 개수로 보관 (값을 저장하지 않아 메모리 일정, 백분위는 구간 상한으로 근사)"""
+    BUCKETS = 36
+
+    def __init__(self):
+        self.counts = [0] * self.BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        self.counts[min(int(seconds * 1e6).bit_length(), self.BUCKETS - 1)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max: self.max = seconds
+
+    def quantile(self, q):
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if n and seen >= rank: return min((1 << i) / 1e6, self.max)
+        return self.max
+
+    def summary(self):
+        ms = lambda v: round(v * 1000, 3)
+        return {"count": self.count, "mean_ms": ms(self.total / self.count) if self.count else 0,
+                "p50_ms": ms(self.quantile(0.5)), "p90_ms": ms(self.quantile(0.9)), "p99_ms": ms(self.quantile(0.99)),
+                "max_ms": ms(self.max)}
+
+class Span:
+    """with METRICS.span(이름): 블록 실행 시간을 히스토그램에 기록"""
+    __slots__ = ("metrics", "name", "start")
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.name, time.perf_counter() - self.start)
+
+class NullSpan:
+    """계측이 꺼져 있을 때 span() 이 돌려주는 빈 컨텍스트 (하나를 계속 재사용)"""
+    def __enter__(self): return self
+    def __exit__(self, *exc): pass
+
+NO_SPAN = NullSpan()
+
+class SamplingProfiler:
+    """PROFILE_INTERVAL 마다 모든 스레드의 스택을 찍어 함수별로 셈 (벽시계 기준이라 대기 중인 스레드도 잡힘).
+    cProfile 은 켠 스레드만 보므로 스레드가 많은 호스트/GUI 에는 샘플링을 씀. collapsed() 는 flamegraph 입력 형식"""
+    def __init__(self, interval=PROFILE_INTERVAL):
+        self.interval = interval
+        self.samples = 0
+        self.own = {}       # 스택 맨 위(실행 중)였던 횟수
+        self.total = {}     # 스택 어딘가에 있던 횟수
+        self.stacks = {}
+        self.lock = threading.Lock()
+        self.running = True
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def run(self):
+        me = threading.get_ident()
+        while self.running:
+            time.sleep(self.interval)
+            stacks = []
+            for ident, frame in sys._current_frames().items():
+                if ident == me: continue
+                names = []
+                while frame is not None:
+                    code = frame.f_code
+                    names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stacks.append(names)
+            with self.lock:
+                for names in stacks:
+                    self.samples += 1
+                    self.own[names[0]] = self.own.get(names[0], 0) + 1
+                    for name in set(names): self.total[name] = self.total.get(name, 0) + 1
+                    key = ";".join(reversed(names))
+                    self.stacks[key] = self.stacks.get(key, 0) + 1
+
+    def top(self, n=PROFILE_TOP):
+        with self.lock:
+            pick = lambda counts: sorted(counts.items(), key=lambda kv: -kv[1])[:n]
+            return {"samples": self.samples, "interval_ms": self.interval * 1000, "self": pick(self.own), "total": pick(self.total)}
+
+    def collapsed(self):
+        with self.lock: return "".join(f"{stack} {n}\n" for stack, n in self.stacks.items())
+
+    def stop(self):
+        self.running = False
+
+class Metrics:
+    """프로세스 전체 계측. on 이 False 면 아무것도 기록하지 않음.
+    count(이름, n): 누적 카운터, observe(이름, 초): 시간 히스토그램, gauge(이름, 값): 마지막/최대값,
+    span(이름): with 블록 시간, fail(이름): except 에서 넘긴 오류 개수 (errors.<이름>)"""
+    def __init__(self):
+        self.on = False
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.counters = {}
+        self.histograms = {}
+        self.gauges = {}
+        self.profiler = None
+        self.path = None    # start_metrics 의 통계 파일 (워커 프로세스는 <path>.worker<n>)
+
+    def enable(self):
+        self.started = time.time()
+        self.on = True
+
+    def count(self, name, n=1):
+        if not self.on: return
+        with self.lock: self.counters[name] = self.counters.get(name, 0) + n
+
+    def observe(self, name, seconds):
+        if not self.on: return
+        with self.lock:
+            hist = self.histograms.get(name) or self.histograms.setdefault(name, Histogram())
+            hist.add(seconds)
+
+    def gauge(self, name, value):
+        if not self.on: return
+        with self.lock:
+            peak = self.gauges.get(name, (value, value))[1]
+            self.gauges[name] = (value, max(peak, value))
+
+    def fail(self, name):
+        self.count("errors." + name)
+
+    def span(self, name):
+        return Span(self, name) if self.on else NO_SPAN
+
+    def start_profiler(self):
+        if self.profiler is None: self.profiler = SamplingProfiler()
+
+    def stop_profiler(self):
+        profiler, self.profiler = self.profiler, None
+        if profiler: profiler.stop()
+        return profiler
+
+    def snapshot(self):
+        with self.lock:
+            uptime = max(time.time() - self.started, 1e-9)
+            out = {"pid": os.getpid(), "uptime_s": round(uptime, 1), "counters": dict(self.counters),
+                   "per_sec": {k: round(v / uptime, 2) for k, v in self.counters.items()},
+                   "histograms": {k: h.summary() for k, h in self.histograms.items()},
+                   "gauges": {k: {"last": last, "max": peak} for k, (last, peak) in self.gauges.items()}}
+        if self.profiler: out["profile"] = self.profiler.top()
+        return out
+
+    def dump(self, path):
+        with open(path + ".tmp", "w") as f: json.dump(self.snapshot(), f, indent=1)
+        os.replace(path + ".tmp", path)
+
+METRICS = Metrics()
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """GET /metrics (JSON), /profile (접힌 스택), /profile/start, /profile/stop"""
+    def do_GET(self):
+        ctype = "text/plain; charset=utf-8"
+        if self.path == "/metrics":
+            body, ctype = json.dumps(METRICS.snapshot(), indent=1), "application/json"
+        elif self.path == "/profile/start":
+            METRICS.start_profiler()
+            body = "profiler started\n"
+        elif self.path == "/profile/stop":
+            profiler = METRICS.stop_profiler()
+            body = profiler.collapsed() if profiler else ""
+        elif self.path == "/profile":
+            body = METRICS.profiler.collapsed() if METRICS.profiler else ""
+        else:
+            return self.send_error(404)
+        data = body.encode('utf-8')
+        self.send_response(200)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args): pass
+
+def start_metrics(path=None, port=0, profile=False):
+    """계측을 켜고, path 가 있으면 METRICS_DUMP_SECONDS 마다 파일로, port 가 있으면 127.0.0.1 HTTP 로 공개"""
+    METRICS.enable()
+    METRICS.path = path
+    if profile: METRICS.start_profiler()
+    if port:
+        server = ThreadingHTTPServer(("127.0.0.1", port), MetricsHandler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    if path:
+        def dump_loop():
+            while True:
+                time.sleep(METRICS_DUMP_SECONDS)
+                try: METRICS.dump(path)
+                except OSError: pass
+        threading.Thread(target=dump_loop, daemon=True).start()
+
 # ----------------------------------------------------------
 # [1] 디자인 테마
 # ----------------------------------------------------------
@@ -48,69 +283,2381 @@ THEME = {
     "mention_fg": "#ff6b6b",    # 멘션 글자
     "toast_bg": "#333333",      # 알림창 배경
     "toast_fg": "#ffffff",      # 알림창 글자
+    "search_mark": "#d8a016",   # 검색으로 이동한 블록 테두리
     "btn_primary": "#0e639c",
     "btn_danger": "#c53030",
     "btn_pin_active": "#d8a016",
     "btn_pin_inactive": "#333333"
 }
+CHAT_OVERSCAN = 300   # 채팅 목록에서 화면 위아래로 미리 그려 두는 픽셀
+WHEEL_STEP = 40       # 마우스 휠 한 칸 스크롤 픽셀
+RENDER_BUDGET = 0.008 # 한 프레임에 렌더링 큐를 처리하는 최대 시간(초), 나머지는 다음 프레임으로
+RENDER_INTERVAL = 10  # 큐가 남았을 때 다음 프레임까지 간격(ms)
+LEDGER_PAGE = 50      # 원장 창 한 페이지에 보여 주는 블록 수
 
 # ----------------------------------------------------------
 # [2] 블록체인 백엔드
 # ----------------------------------------------------------
+SYNC_PAGE_SIZE = 500         # SYNC_PAGE 한 번에 보내는 최대 블록 수
+SYNC_HISTORY_BLOCKS = 2000   # 기록이 없는 클라이언트에게 체크포인트 이후로 보내는 블록 수
+CHAIN_DIR = "chains"         # 호스트 체인 세그먼트 파일 위치
+BLOCK_VERSION = int(os.environ.get("CHAINCHAT_BLOCK_VERSION", "0"))  # 새 블록 해시 인코딩 (0 = JSON: 구버전 클라이언트도 검증, 1 = 바이너리: 모두 업그레이드한 뒤)
+ACCEPT_LEGACY_HASH = True    # 호환 모드: JSON으로 해시된 구버전 블록도 검증 통과
+VERIFY_CHUNK_SIZE = 20000    # 체인 검증 시 작업 하나가 맡는 블록 수
+SEQUENCER_BATCH = 256        # 시퀀서가 큐에서 한 번에 꺼내 처리하는 최대 메시지 수
+BATCH_WINDOW = float(os.environ.get("CHAINCHAT_BATCH_MS", "0")) / 1000  # 0보다 크면 호스트가 이 시간 동안 들어온 메시지를 블록 하나로 묶음
+BATCH_MAX = 64               # 묶음 블록 하나에 들어가는 최대 메시지 수
+BATCH_VERSION = 2            # 묶음 블록의 해시 인코딩 버전 (해시는 머클 루트만 덮음)
+BATCH_PREFIX = "BATCH:"
+BATCH_SENDER = "Batch"
+VERIFY_PARALLEL_MIN = 100000 # 이 길이 이상일 때만 프로세스 풀로 나눠서 검증
+SYNC_VERIFY_BATCH = 200000   # 게스트가 SYNC_PAGE 블록을 모았다가 한 번에 검증하는 최대 수 (SYNC_DONE 에서도 검증)
+SEARCH_LIMIT = 100           # 검색 결과 최대 개수 (최신 블록부터)
+LOCATOR_MAX = 64             # 재접속 시 보내는 locator (index, hash) 최대 개수
+
+def to_digest(hex_hash):
+    """hex 해시 -> 32바이트 (제네시스의 "0" 같은 값은 그대로 bytes)"""
+    return bytes.fromhex(hex_hash) if len(hex_hash) == 64 else hex_hash.encode()
+
+def to_hex(digest):
+    return digest.hex() if len(digest) == 32 else digest.decode()
+
+# 해시용 정규 바이너리 인코딩 (v1)
+# [버전 1B][index 8B][sender_id 8B][이전 해시 길이 1B + 원본] + (4B 길이 + UTF-8) x timestamp/sender/message
+BLOCK_HEADER = struct.Struct("<BQqB")
+FIELD_LENGTH = struct.Struct("<I")
+
+def encode_block_fields(version, index, timestamp, sender, sender_id, message, prev_digest):
+    parts = [BLOCK_HEADER.pack(version, index, sender_id, len(prev_digest)), prev_digest]
+    for text in (timestamp, sender, message):
+        data = text.encode('utf-8')
+        parts.append(FIELD_LENGTH.pack(len(data)))
+        parts.append(data)
+    return b"".join(parts)
+
+def encode_block_v1(index, timestamp, sender, sender_id, message, prev_digest):
+    return encode_block_fields(1, index, timestamp, sender, sender_id, message, prev_digest)
+
+# --- 묶음 블록 (v2) ---
+# message = "BATCH:<머클 루트 hex>\n" + JSON [[timestamp, sender, sender_id, message], ...]
+# 블록 해시는 첫 줄(루트)까지만 덮고, 메시지 목록은 루트와 맞아야 검증 통과 -> 메시지 하나만으로 포함 증명 가능
+ENTRY_SENDER_ID = struct.Struct("<q")
+
+def entry_leaf(entry):
+    timestamp, sender, sender_id, message = entry
+    parts = [b"\x00", ENTRY_SENDER_ID.pack(sender_id)]
+    for text in (timestamp, sender, message):
+        data = text.encode('utf-8')
+        parts.append(FIELD_LENGTH.pack(len(data)))
+        parts.append(data)
+    return hashlib.sha256(b"".join(parts)).digest()
+
+def merkle_parent(left, right):
+    return hashlib.sha256(b"\x01" + left + right).digest()
+
+def merkle_root(leaves):
+    """홀수 개인 단계의 마지막 노드는 복제하지 않고 그대로 위로 올림"""
+    level = list(leaves)
+    if not level: return hashlib.sha256(b"").digest()
+    while len(level) > 1:
+        nxt = [merkle_parent(level[i], level[i + 1]) for i in range(0, len(level) - 1, 2)]
+        if len(level) % 2: nxt.append(level[-1])
+        level = nxt
+    return level[0]
+
+def merkle_path(leaves, pos):
+    """pos 번째 잎에서 루트까지의 형제 노드 [(hex, 형제가 왼쪽인지), ...]"""
+    level = list(leaves)
+    path = []
+    while len(level) > 1:
+        sibling = pos ^ 1
+        if sibling < len(level): path.append((level[sibling].hex(), sibling < pos))
+        nxt = [merkle_parent(level[i], level[i + 1]) for i in range(0, len(level) - 1, 2)]
+        if len(level) % 2: nxt.append(level[-1])
+        level = nxt
+        pos //= 2
+    return path
+
+def batch_message(entries):
+    root = merkle_root([entry_leaf(e) for e in entries])
+    return f"{BATCH_PREFIX}{root.hex()}\n" + json.dumps([list(e) for e in entries], ensure_ascii=False)
+
+def encode_block_v2(index, timestamp, sender, sender_id, message, prev_digest):
+    header, sep, body = message.partition("\n")
+    if not sep or not header.startswith(BATCH_PREFIX): raise ValueError("not a batch block")
+    if merkle_root([entry_leaf(e) for e in json.loads(body)]).hex() != header[len(BATCH_PREFIX):]:
+        raise ValueError("merkle root mismatch")
+    return encode_block_fields(2, index, timestamp, sender, sender_id, header, prev_digest)
+
+def encode_block_legacy(index, timestamp, sender, sender_id, message, prev_digest):
+    return json.dumps({
+        "index": index,
+        "timestamp": timestamp,
+        "sender": sender,
+        "sender_id": sender_id,
+        "message": message,
+        "previous_hash": to_hex(prev_digest)
+    }, sort_keys=True).encode()
+
+BLOCK_ENCODERS = {0: encode_block_legacy, 1: encode_block_v1, 2: encode_block_v2}
+
 class Block:
-    def __init__(self, index, timestamp, sender, sender_id, message, previous_hash):
+    # __dict__ 없이 슬롯만 사용하고, 해시는 hex 문자열 대신 32바이트 원본으로 보관
+    # verified: 해시를 이미 계산/검증했으면 True (add_block에서 다시 계산하지 않음)
+    __slots__ = ("index", "timestamp", "sender", "sender_id", "message", "prev_digest", "digest", "version", "verified")
+
+    def __init__(self, index, timestamp, sender, sender_id, message, previous_hash, version=None):
+        if version is None: version = BLOCK_VERSION     # 헤드리스 --block-version 으로 바뀔 수 있어서 호출할 때 읽음
         self.index = index
         self.timestamp = timestamp
-        self.sender = sender
+        self.sender = sys.intern(sender)
         self.sender_id = sender_id
         self.message = message
         self.previous_hash = previous_hash
-        self.hash = self.calculate_hash()
+        self.version = version
+        self.digest = self.calculate_digest()
+        self.verified = True
+
+    @property
+    def hash(self): return to_hex(self.digest)
+
+    @hash.setter
+    def hash(self, value): self.digest = to_digest(value)
+
+    @property
+    def previous_hash(self): return to_hex(self.prev_digest)
+
+    @previous_hash.setter
+    def previous_hash(self, value): self.prev_digest = to_digest(value)
+
+    def calculate_digest(self):
+        encoded = BLOCK_ENCODERS[self.version](self.index, self.timestamp, self.sender,
+                                               self.sender_id, self.message, self.prev_digest)
+        return hashlib.sha256(encoded).digest()
 
     def calculate_hash(self):
-        block_string = json.dumps({
-            "index": self.index,
-            "timestamp": self.timestamp,
-            "sender": self.sender,
-            "sender_id": self.sender_id,
-            "message": self.message,
-            "previous_hash": self.previous_hash
-        }, sort_keys=True).encode()
-        return hashlib.sha256(block_string).hexdigest()
+        return self.calculate_digest().hex()
+
+    def verify(self):
+        """저장된 해시가 내용과 맞는지 확인 (한 번 통과하면 결과를 캐시)"""
+        if self.verified: return True
+        if self.version == 0 and not ACCEPT_LEGACY_HASH: return False
+        try: self.verified = self.calculate_digest() == self.digest
+        except (KeyError, TypeError, ValueError, AttributeError, struct.error): return False
+        return self.verified
+
+    def to_dict(self):
+        return {"index": self.index, "timestamp": self.timestamp, "sender": self.sender,
+                "sender_id": self.sender_id, "message": self.message,
+                "previous_hash": self.previous_hash, "hash": self.hash, "version": self.version}
+
+    @classmethod
+    def restore(cls, index, timestamp, sender, sender_id, message, prev_digest, digest, version=0, verified=False):
+        """해시를 다시 계산하지 않고 저장된 값으로 블록 복원 (검증은 add_block 등에서)"""
+        block = cls.__new__(cls)
+        block.index = index
+        block.timestamp = timestamp
+        block.sender = sys.intern(sender)
+        block.sender_id = sender_id
+        block.message = message
+        block.prev_digest = prev_digest
+        block.digest = digest
+        block.version = version
+        block.verified = verified
+        return block
+
+    @classmethod
+    def from_dict(cls, d):
+        # version 키가 없으면 구버전 클라이언트/호스트가 만든 JSON 해시 블록
+        return cls.restore(d['index'], d['timestamp'], d['sender'], d['sender_id'], d['message'],
+                           to_digest(d['previous_hash']), to_digest(d['hash']), d.get('version', 0))
+
+def block_entries(block):
+    """블록에 든 메시지 목록 [(timestamp, sender, sender_id, message)]. 일반 블록은 자기 자신 하나"""
+    if block.version == BATCH_VERSION:
+        return [tuple(e) for e in json.loads(block.message.partition("\n")[2])]
+    return [(block.timestamp, block.sender, block.sender_id, block.message)]
+
+def valid_entry(sender, sender_id, message):
+    """블록에 넣을 수 있는 메시지인지 (패킷에서 온 값). 묶기 전에 걸러야 잘못된 메시지 하나가 같은 묶음을 다 버리지 않음"""
+    if not isinstance(sender, str) or not isinstance(message, str): return False
+    try:
+        ENTRY_SENDER_ID.pack(sender_id)
+        sender.encode('utf-8')
+        message.encode('utf-8')     # 짝 없는 서로게이트 (JSON \ud800) 는 해시 인코딩에서 실패
+    except (struct.error, UnicodeError): return False
+    return True
+
+def seal_block(chain, entries):
+    """메시지들을 다음 블록으로 만들어 체인에 추가 (하나면 일반 블록, 여럿이면 묶음 블록). 실패하면 None"""
+    last = chain.get_latest_block()
+    if len(entries) == 1:
+        timestamp, sender, sender_id, message = entries[0]
+        new_b = Block(last.index + 1, timestamp, sender, sender_id, message, last.hash)
+    else:
+        new_b = Block(last.index + 1, time.ctime(), BATCH_SENDER, 0, batch_message(entries), last.hash, version=BATCH_VERSION)
+    return new_b if chain.add_block(new_b) else None
+
+def inclusion_proof(block, pos):
+    """묶음 블록 안 pos 번째 메시지의 포함 증명 (블록 헤더 + 머클 경로, 다른 메시지 내용은 없음)"""
+    entries = block_entries(block)
+    return {"index": block.index, "timestamp": block.timestamp, "sender": block.sender, "sender_id": block.sender_id,
+            "header": block.message.partition("\n")[0], "previous_hash": block.previous_hash, "hash": block.hash,
+            "entry": list(entries[pos]), "path": merkle_path([entry_leaf(e) for e in entries], pos)}
+
+def verify_inclusion(proof):
+    """메시지 -> 머클 루트 -> 블록 해시까지 맞는지 확인 (블록 해시가 체인에 있는지는 따로 확인)"""
+    try:
+        node = entry_leaf(proof['entry'])
+        for sibling, is_left in proof['path']:
+            node = merkle_parent(bytes.fromhex(sibling), node) if is_left else merkle_parent(node, bytes.fromhex(sibling))
+        if proof['header'] != BATCH_PREFIX + node.hex(): return False
+        encoded = encode_block_fields(BATCH_VERSION, proof['index'], proof['timestamp'], proof['sender'],
+                                      proof['sender_id'], proof['header'], to_digest(proof['previous_hash']))
+        return hashlib.sha256(encoded).hexdigest() == proof['hash']
+    except (KeyError, TypeError, ValueError, struct.error): return False
+
+# --- 체인 전체 검증 ---
+def block_columns(blocks):
+    """프로세스 풀로 넘기기 위한 열 단위 리스트 (행 튜플보다 pickle 비용이 작음)"""
+    return ([b.index for b in blocks], [b.timestamp for b in blocks], [b.sender for b in blocks],
+            [b.sender_id for b in blocks], [b.message for b in blocks],
+            [b.prev_digest for b in blocks], [b.digest for b in blocks], [b.version for b in blocks])
+
+def find_bad_block(blocks):
+    """해시 재계산 + 청크 안 연결 검사 -> 첫 불량 위치 (없으면 -1)"""
+    prev = None
+    for pos, block in enumerate(blocks):
+        if not block.verify(): return pos
+        if prev is not None and (block.prev_digest != prev.digest or block.index != prev.index + 1): return pos
+        prev = block
+    return -1
+
+def find_bad_column(columns):
+    """(프로세스 풀 작업) 열 단위로 받은 청크 검증. Block 객체를 만들지 않고 바로 해시"""
+    indexes, timestamps, senders, sender_ids, messages, prevs, digests, versions = columns
+    for pos in range(len(indexes)):
+        version = versions[pos]
+        if version == 0 and not ACCEPT_LEGACY_HASH: return pos
+        if pos and (prevs[pos] != digests[pos - 1] or indexes[pos] != indexes[pos - 1] + 1): return pos
+        try:
+            encoded = BLOCK_ENCODERS[version](indexes[pos], timestamps[pos], senders[pos],
+                                              sender_ids[pos], messages[pos], prevs[pos])
+        except (KeyError, TypeError, ValueError, AttributeError, struct.error): return pos
+        if hashlib.sha256(encoded).digest() != digests[pos]: return pos
+    return -1
+
+def verify_chain(blocks, workers=None):
+    """체인 전체를 검증하며 청크마다 (검증한 블록 수, 전체 블록 수, 불량 블록 index 또는 None)을 순서대로 yield
+    긴 체인은 청크별 해시 재계산을 프로세스 풀에 나누고, 청크 경계의 연결은 여기서 확인.
+    불량 블록을 만나면 그 index를 알리고 멈춤"""
+    total = len(blocks)
+    chunks = [blocks[i:i + VERIFY_CHUNK_SIZE] for i in range(0, total, VERIFY_CHUNK_SIZE)]
+    pool = None
+    if total >= VERIFY_PARALLEL_MIN and workers != 1:
+        try: pool = ProcessPoolExecutor(workers)
+        except (OSError, NotImplementedError): pool = None
+    try:
+        if pool:
+            results = [pool.submit(find_bad_column, block_columns(chunk)) for chunk in chunks]
+        checked = 0
+        for k, chunk in enumerate(chunks):
+            bad = results[k].result() if pool else find_bad_block(chunk)
+            if bad < 0 and k > 0:
+                last = chunks[k - 1][-1]
+                if chunk[0].prev_digest != last.digest or chunk[0].index != last.index + 1: bad = 0
+            if bad >= 0:
+                yield checked + bad, total, chunk[bad].index
+                return
+            if pool:
+                for block in chunk: block.verified = True
+            checked += len(chunk)
+            yield checked, total, None
+    finally:
+        if pool: pool.shutdown(wait=False, cancel_futures=True)
+
+def sign_checkpoint(key, index, block_hash):
+    """체크포인트(index + hash)에 방 키로 HMAC 서명"""
+    return hmac.new(key.encode(), f"{index}:{block_hash}".encode(), hashlib.sha256).hexdigest()
+
+def verify_checkpoint(key, index, block_hash, sig):
+    return hmac.compare_digest(sign_checkpoint(key, index, block_hash), sig or "")
+
+def sync_packets(chain, have, room_key, locator=None):
+    """클라이언트가 가진 마지막 블록(have) 이후만 페이지 단위 패킷으로 생성
+    SYNC_PAGE 의 blocks 는 Block 객체 그대로 (WireCodec 이 연결 형식에 맞게 직렬화)"""
+    latest = chain.get_latest_block()
+    if have and chain.has_block(have.get('index'), have.get('hash')):
+        yield from page_packets(chain, have['index'] + 1)
+        return
+    fork = chain.fork_point(locator) if locator else None
+    if fork:
+        # 갈라진 클라이언트: 공통 블록을 찾아 그 뒤만 다시 보냄
+        yield from diverged_packets(chain, *fork)
+        return
+    # 기록이 없거나 공통 블록이 없는 클라이언트는 제네시스 대신 서명된 체크포인트에서 시작
+    cp = chain.get_block(max(chain.chain[0].index, latest.index - SYNC_HISTORY_BLOCKS))
+    yield {"type": "CHECKPOINT", "index": cp.index, "hash": cp.hash,
+           "sig": sign_checkpoint(room_key, cp.index, cp.hash), "block": cp.to_dict()}
+    yield from page_packets(chain, cp.index + 1)
+
+def page_packets(chain, start):
+    latest = chain.get_latest_block()
+    while start <= latest.index:
+        page = chain.get_blocks(start, SYNC_PAGE_SIZE)
+        if not page: break
+        yield {"type": "SYNC_PAGE", "blocks": page}
+        start = page[-1].index + 1
+    yield {"type": "SYNC_DONE", "index": latest.index, "hash": latest.hash}
+
+# --- 갈라진 지점 찾기 ---
+# 재접속한 클라이언트의 have 가 호스트 체인에 없으면 locator(최신부터 1, 2, 4, 8... 간격)로 범위를 좁힌 뒤
+#   DIVERGED {lo, hi}  : lo 는 공통 블록, hi 는 클라이언트 쪽이 다른 블록
+#   PROBE {index, hash, lo, hi} -> DIVERGED {좁힌 lo, hi}   (이진 탐색, 호스트는 상태 없음)
+# hi == lo + 1 이 되면 클라이언트는 lo 뒤를 잘라 내고, 호스트는 이어서 lo + 1 부터 SYNC_PAGE 전송
+def diverged_packets(chain, lo, hi):
+    yield {"type": "DIVERGED", "lo": lo, "hi": hi, "hash": chain.get_block(lo).hash}
+    if hi - lo <= 1: yield from page_packets(chain, lo + 1)
+
+def probe_packets(chain, p):
+    lo, hi, mid = int(p['lo']), int(p['hi']), int(p['index'])
+    if not lo < mid < hi or chain.get_block(lo) is None: raise ValueError("bad probe range")
+    if chain.has_block(mid, p['hash']): lo = mid
+    else: hi = mid
+    yield from diverged_packets(chain, lo, hi)
+
+# --- 체인 저장소 (Blockchain.chain 자리에 들어가는 리스트형 객체) ---
+class MemoryStore(list):
+    """Block 객체를 그대로 담는 메모리 리스트 저장소 (종료 시 사라짐)"""
+    def reset(self, blocks): self[:] = blocks
+    def truncate(self, count): del self[count:]
+    def close(self): pass
+
+class SegmentStore:
+    """추가 전용 세그먼트 파일 저장소
+    .seg: [4바이트 길이][블록 JSON] 레코드가 이어 붙음
+    .idx: 블록마다 8바이트 .seg 오프셋 (고정폭이라 n번째 블록을 바로 찾음)
+    읽기는 mmap으로 처리하고 마지막 블록만 메모리에 둠 -> 체인 길이와 무관하게 메모리 일정"""
+    LENGTH = struct.Struct("<I")
+    OFFSET = struct.Struct("<Q")
+
+    def __init__(self, path, read_only=False):
+        self.seg_path = path + ".seg"
+        self.idx_path = path + ".idx"
+        self.read_only = read_only  # 다른 프로세스가 쓰는 파일을 따라 읽기만 함 (append 는 쓰지 않고 개수만 늘림)
+        self.lock = threading.RLock()
+        self.seg = open(self.seg_path, "rb" if read_only else "a+b")
+        self.idx = open(self.idx_path, "rb" if read_only else "a+b")
+        self.seg_map = None
+        self.idx_map = None
+        if read_only: self.count = os.path.getsize(self.idx_path) // self.OFFSET.size
+        else: self._recover()
+        self.tail = self._read(self.count - 1) if self.count else None
+
+    def _recover(self):
+        """비정상 종료로 잘린 마지막 레코드 정리 (전체 재파싱 없음)"""
+        seg_size = os.path.getsize(self.seg_path)
+        self.count = os.path.getsize(self.idx_path) // self.OFFSET.size
+        self.seg_size = 0
+        while self.count:
+            offset = self._offset(self.count - 1)
+            # 마지막 오프셋은 직전 레코드 끝과 정확히 맞아야 하고, 레코드는 파일 안에 다 있어야 함
+            expected = self._record_end(self.count - 2, seg_size) if self.count > 1 else 0
+            end = self._record_end(self.count - 1, seg_size)
+            if offset == expected and end is not None:
+                self.seg_size = end
+                break
+            self.count -= 1
+        self._close_maps()
+        self.idx.truncate(self.count * self.OFFSET.size)
+        self.seg.truncate(self.seg_size)
+
+    def _record_end(self, i, seg_size):
+        offset = self._offset(i)
+        if offset + self.LENGTH.size > seg_size: return None
+        (length,) = self.LENGTH.unpack(self._pread(offset, self.LENGTH.size))
+        end = offset + self.LENGTH.size + length
+        return end if end <= seg_size else None
+
+    def _pread(self, offset, size):
+        self.seg.seek(offset)
+        return self.seg.read(size)
+
+    def _map(self, f):
+        f.flush()
+        if os.fstat(f.fileno()).st_size == 0: return None
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _close_maps(self):
+        for m in (self.seg_map, self.idx_map):
+            if m is not None: m.close()
+        self.seg_map = self.idx_map = None
+
+    def _offset(self, i):
+        end = (i + 1) * self.OFFSET.size
+        if self.idx_map is None or len(self.idx_map) < end:
+            if self.idx_map is not None: self.idx_map.close()
+            self.idx_map = self._map(self.idx)
+        return self.OFFSET.unpack_from(self.idx_map, i * self.OFFSET.size)[0]
+
+    def _read(self, i):
+        offset = self._offset(i)
+        if self.seg_map is None or len(self.seg_map) < offset + self.LENGTH.size:
+            if self.seg_map is not None: self.seg_map.close()
+            self.seg_map = self._map(self.seg)
+        (length,) = self.LENGTH.unpack_from(self.seg_map, offset)
+        start = offset + self.LENGTH.size
+        if len(self.seg_map) < start + length:
+            self.seg_map.close()
+            self.seg_map = self._map(self.seg)
+        return Block.from_dict(json.loads(self.seg_map[start:start + length]))
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        # 마지막 블록(get_latest_block)은 잠금 없이: tail 은 열을 다 쓴 뒤에 바뀜
+        tail = self.tail
+        if i == -1 and tail is not None: return tail
+        with self.lock:
+            if isinstance(i, slice):
+                return [self._read(j) for j in range(*i.indices(self.count))]
+            if i < 0: i += self.count
+            if not 0 <= i < self.count: raise IndexError("block index out of range")
+            if i == self.count - 1: return self.tail
+            return self._read(i)
+
+    def __iter__(self):
+        for i in range(self.count):
+            yield self[i]
+
+    def append(self, block):
+        if self.read_only:
+            # 쓰는 쪽이 이미 파일에 기록하고 flush 한 블록
+            with self.lock:
+                self.count += 1
+                self.tail = block
+            return
+        data = json.dumps(block.to_dict()).encode('utf-8')
+        with self.lock:
+            self.seg.write(self.LENGTH.pack(len(data)) + data)
+            self.idx.write(self.OFFSET.pack(self.seg_size))
+            self.seg.flush()
+            self.idx.flush()
+            self.seg_size += self.LENGTH.size + len(data)
+            self.count += 1
+            self.tail = block
+
+    def reset(self, blocks):
+        if self.read_only: raise ValueError("read-only segment store")
+        with self.lock:
+            self._close_maps()
+            self.seg.truncate(0)
+            self.idx.truncate(0)
+            self.seg_size = self.count = 0
+            self.tail = None
+            for block in blocks: self.append(block)
+
+    def truncate(self, count):
+        """앞의 count 블록만 남김"""
+        if self.read_only: raise ValueError("read-only segment store")
+        with self.lock:
+            if count >= self.count: return
+            self.seg_size = self._offset(count)
+            self._close_maps()
+            self.count = count
+            self.idx.truncate(count * self.OFFSET.size)
+            self.seg.truncate(self.seg_size)
+            self.tail = self._read(count - 1) if count else None
+
+    def close(self):
+        with self.lock:
+            self._close_maps()
+            self.seg.close()
+            self.idx.close()
+
+class BlockTable:
+    """열 단위(columnar) 블록 저장소
+    index는 연속이라 첫 값만, sender_id/보낸 사람 번호는 array에, 메시지는 하나의 UTF-8 arena에,
+    해시는 32바이트씩 이어 붙여 보관 (previous_hash는 직전 블록 해시라 따로 저장하지 않음).
+    timestamp는 문자열 그대로 두되 바로 앞 블록과 같으면 다시 저장하지 않음 (같은 초의 블록끼리 공유).
+    Block 객체는 꺼낼 때만 만들고 마지막 블록만 유지.
+    수신 스레드가 append 하는 동안 Tk 스레드가 읽으므로 열을 바꾸거나 읽는 것은 lock 안에서"""
+    DIGEST = 32
+
+    def __init__(self, blocks=()):
+        self.lock = threading.Lock()
+        self._reset(blocks)
+
+    def reset(self, blocks):
+        with self.lock: self._reset(blocks)
+
+    def _reset(self, blocks):
+        self.base = 0
+        self.stamps = []                 # 서로 다른 timestamp 문자열 (연속으로 같으면 하나)
+        self.stamp_refs = array('I')
+        self.sender_ids = array('q')
+        self.sender_refs = array('I')
+        self.versions = array('B')
+        self.names = []
+        self.name_refs = {}
+        self.arena = bytearray()
+        self.msg_offsets = array('Q', [0])
+        self.digests = bytearray()
+        self.first_prev = b""
+        self.tail = None
+        for block in blocks: self._append(block)
+
+    def append(self, block):
+        with self.lock: self._append(block)
+
+    def _append(self, block):
+        pos = len(self.sender_ids)
+        if len(block.digest) != self.DIGEST: raise ValueError("block hash must be a sha256 digest")
+        if pos == 0:
+            self.base = block.index
+            self.first_prev = block.prev_digest
+        elif block.prev_digest != self.tail.digest or block.index != self.base + pos:
+            raise ValueError("BlockTable only stores a linked chain")
+        ref = self.name_refs.get(block.sender)
+        if ref is None:
+            ref = self.name_refs[block.sender] = len(self.names)
+            self.names.append(block.sender)
+        stamps, arena = self.stamps, self.arena
+        if not stamps or stamps[-1] != block.timestamp: stamps.append(block.timestamp)
+        self.stamp_refs.append(len(stamps) - 1)
+        self.sender_ids.append(block.sender_id)
+        self.sender_refs.append(ref)
+        self.versions.append(block.version)
+        arena += block.message.encode('utf-8')
+        self.msg_offsets.append(len(arena))
+        self.digests += block.digest
+        self.tail = block
+
+    def _read(self, pos):
+        d = self.DIGEST
+        return Block.restore(
+            self.base + pos,
+            self.stamps[self.stamp_refs[pos]],
+            self.names[self.sender_refs[pos]], self.sender_ids[pos],
+            self.arena[self.msg_offsets[pos]:self.msg_offsets[pos + 1]].decode('utf-8'),
+            bytes(self.digests[(pos - 1) * d:pos * d]) if pos else self.first_prev,
+            bytes(self.digests[pos * d:(pos + 1) * d]),
+            self.versions[pos])
+
+    def __len__(self):
+        with self.lock: return len(self.sender_ids)
+
+    def __getitem__(self, i):
+        # 마지막 블록(get_latest_block)은 잠금 없이: tail 은 열을 다 쓴 뒤에 바뀜
+        tail = self.tail
+        if i == -1 and tail is not None: return tail
+        with self.lock:
+            n = len(self.sender_ids)
+            if isinstance(i, slice):
+                return [self._read(j) for j in range(*i.indices(n))]
+            if i < 0: i += n
+            if not 0 <= i < n: raise IndexError("block index out of range")
+            if i == n - 1: return self.tail
+            return self._read(i)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def truncate(self, count):
+        """앞의 count 블록만 남김 (열마다 뒷부분만 잘라 냄)"""
+        with self.lock:
+            if count >= len(self.sender_ids): return
+            if count == 0: return self._reset(())
+            for column in (self.stamp_refs, self.sender_ids, self.sender_refs, self.versions): del column[count:]
+            del self.stamps[self.stamp_refs[-1] + 1:]
+            del self.arena[self.msg_offsets[count]:]
+            del self.msg_offsets[count + 1:]
+            del self.digests[count * self.DIGEST:]
+            self.tail = self._read(count - 1)
+
+    def close(self): pass
+
+# --- 전문 검색 색인 ---
+SEARCH_WORD = re.compile(r"\w+")
+
+def search_tokens(text):
+    """단어마다 글자 2-gram (한 글자 단어는 그대로). 한글은 조사/어미가 붙어도 부분 일치로 찾음"""
+    tokens = set()
+    for word in SEARCH_WORD.findall(text):
+        if len(word) == 1: tokens.add(word)
+        else: tokens.update(word[i:i + 2] for i in range(len(word) - 1))
+    return tokens
+
+def search_text(sender, message):
+    # 파일 블록은 manifest 해시 대신 파일명만
+    if message.startswith(FILE_MANIFEST_PREFIX) or message.startswith("FILE_TRANSFER:"): message = file_block_info(message)[0]
+    return f"{sender}\n{message}".lower()
+
+def hash_key(digest):
+    return int.from_bytes(digest[:8], "little")
+
+def has_index(postings, index):
+    k = bisect_left(postings, index)
+    return k < len(postings) and postings[k] == index
+
+class SearchIndex:
+    """Block.message / sender 역색인: 토큰 -> 블록 index 오름차순 array.
+    add_block 마다 덧붙이고, 검색은 가장 짧은 목록을 최신부터 훑으며 나머지는 이진 탐색으로 교집합 ->
+    후보 블록만 읽어 실제 부분 문자열인지 확인. 체인 옆 파일로 저장해 두면 다음 실행에서 이어서 사용"""
+    MAGIC = b"CCSEARCH1\n"
+
+    def __init__(self, blockchain):
+        self.blockchain = blockchain
+        self.lock = threading.RLock()
+        self.reset()
+
+    def reset(self):
+        self.postings = {}
+        self.by_char = {}           # 글자 -> 그 글자가 든 토큰 (한 글자 검색어용)
+        self.upto = -1              # 마지막으로 색인한 블록 index
+
+    def attach(self, path=None):
+        """파일이 체인과 맞으면 읽고, 나머지 블록을 색인한 뒤 blockchain.search 로 연결"""
+        with self.lock:
+            self.blockchain.search = self   # 이후 add_block 은 잠금을 기다렸다가 이어서 색인
+            if path and not self.load(path): self.reset()
+            self.catch_up()
+
+    def catch_up(self):
+        chain = self.blockchain
+        start = max(self.upto + 1, chain.chain[0].index)
+        while True:
+            page = chain.get_blocks(start, SYNC_PAGE_SIZE)
+            if not page: break
+            for block in page: self.add(block)
+            start = page[-1].index + 1
+
+    def rebuild(self):
+        with self.lock:
+            self.reset()
+            self.catch_up()
+
+    def truncate(self, index):
+        """index 뒤의 블록을 색인에서 뺌 (목록 끝에서만 지우면 됨)"""
+        with self.lock:
+            for postings in self.postings.values():
+                while postings and postings[-1] > index: postings.pop()
+            self.upto = min(self.upto, index)
+
+    def add(self, block):
+        with self.lock:
+            if block.index <= self.upto: return
+            tokens = set()
+            for _, sender, _, message in block_entries(block): tokens |= search_tokens(search_text(sender, message))
+            for token in tokens:
+                postings = self.postings.get(token)
+                if postings is None:
+                    postings = self.postings[token] = array('I')
+                    for ch in token: self.by_char.setdefault(ch, set()).add(token)
+                postings.append(block.index)
+            self.upto = block.index
+
+    def candidates(self, word):
+        if len(word) > 1: return [self.postings.get(word[i:i + 2]) for i in range(len(word) - 1)]
+        tokens = self.by_char.get(word, ())
+        if len(tokens) == 1: return [self.postings[next(iter(tokens))]]
+        return [array('I', sorted(set().union(*(self.postings[t] for t in tokens))))] if tokens else [None]
+
+    def search(self, query, limit=SEARCH_LIMIT):
+        """검색어의 모든 단어가 들어 있는 메시지 -> [(블록 index, (timestamp, sender, sender_id, message))] 최신순"""
+        words = SEARCH_WORD.findall(query.lower())
+        if not words: return []
+        with self.lock:
+            lists = [p for word in words for p in self.candidates(word)]
+            if any(p is None for p in lists): return []
+            lists.sort(key=len)
+            first, rest = lists[0], lists[1:]
+            hits = []
+            for k in range(len(first) - 1, -1, -1):
+                index = first[k]
+                if not all(has_index(p, index) for p in rest): continue
+                block = self.blockchain.get_block(index)
+                if block is None: continue
+                for entry in block_entries(block):
+                    text = search_text(entry[1], entry[3])
+                    if all(w in text for w in words):
+                        hits.append((index, entry))
+                        break
+                if len(hits) >= limit: break
+            return hits
+
+    def save(self, path):
+        """[MAGIC][헤더 JSON 한 줄][토큰별 array 바이트] -> 임시 파일에 쓰고 교체"""
+        with self.lock:
+            if self.upto < 0: return
+            tip = self.blockchain.get_block(self.upto)
+            if tip is None: return
+            tokens = list(self.postings)
+            header = {"upto": self.upto, "tip": tip.hash, "byteorder": sys.byteorder,
+                      "tokens": [[t, len(self.postings[t])] for t in tokens]}
+            with open(path + ".tmp", "wb") as f:
+                f.write(self.MAGIC + json.dumps(header).encode('utf-8') + b"\n")
+                for t in tokens: f.write(self.postings[t].tobytes())
+            os.replace(path + ".tmp", path)
+
+    def load(self, path):
+        """저장된 색인이 지금 체인과 같은 블록까지 만든 것이면 읽고 True"""
+        try:
+            with open(path, "rb") as f:
+                if f.read(len(self.MAGIC)) != self.MAGIC: return False
+                header = json.loads(f.readline())
+                if not self.blockchain.has_block(header['upto'], header['tip']): return False
+                data = f.read()
+        except (OSError, ValueError, KeyError, TypeError): return False
+        pos = 0
+        for token, count in header['tokens']:
+            postings = array('I')
+            size = count * postings.itemsize
+            postings.frombytes(data[pos:pos + size])
+            pos += size
+            if header['byteorder'] != sys.byteorder: postings.byteswap()
+            self.postings[token] = postings
+            for ch in token: self.by_char.setdefault(ch, set()).add(token)
+        self.upto = header['upto']
+        return True
+
+class Blockchain:
+    def __init__(self, store=None, index_path=None):
+        self.chain = BlockTable() if store is None else store
+        self.bad_block_index = None
+        self.index_path = index_path  # 검색 색인 저장 위치 (None 이면 메모리에만)
+        self.search = None            # 처음 검색할 때 search_index() 가 만듦
+        self.hashes = None            # 해시 앞 8바이트 -> index (처음 해시로 찾을 때 만듦)
+        self.hash_lock = threading.Lock()
+        if not len(self.chain): self.chain.append(self.create_genesis_block())
+
+    def create_genesis_block(self):
+        # 제네시스는 구버전과 같은 해시를 유지하도록 JSON 인코딩(v0) 사용
+        return Block(0, "2024-01-01", "System", 0, "Genesis Block", "0", version=0)
+
+    def get_latest_block(self):
+        return self.chain[-1]
+
+    # 체크포인트에서 시작한 체인은 chain[0].index 가 0이 아닐 수 있음
+    def get_block(self, index):
+        pos = index - self.chain[0].index
+        if 0 <= pos < len(self.chain): return self.chain[pos]
+        return None
+
+    def has_block(self, index, block_hash):
+        block = self.get_block(index)
+        return block is not None and block.hash == block_hash
+
+    def get_blocks(self, start, count):
+        pos = max(0, start - self.chain[0].index)
+        return self.chain[pos:pos + count]
+
+    def find_hash(self, block_hash):
+        """해시(hex)로 블록 index 찾기 (없으면 None). 해시 맵으로 O(1), 맵은 처음 부를 때 체인을 한 번 훑어서 만듦"""
+        try: digest = to_digest(block_hash)
+        except ValueError: return None
+        with self.hash_lock:
+            if self.hashes is None:
+                self.hashes = {}
+                start = self.chain[0].index
+                while True:
+                    page = self.get_blocks(start, SYNC_PAGE_SIZE)
+                    if not page: break
+                    for block in page: self.hashes[hash_key(block.digest)] = block.index
+                    start = page[-1].index + 1
+            index = self.hashes.get(hash_key(digest))
+        # 앞 8바이트만 키로 쓰므로 실제 블록 해시와 한 번 더 비교
+        block = None if index is None else self.get_block(index)
+        return index if block is not None and block.digest == digest else None
+
+    def locator(self):
+        """최신 블록부터 1, 2, 4, 8... 간격으로 고른 [index, hash] 목록 + 첫 블록 (O(log n) 개)"""
+        first = self.chain[0].index
+        index = self.get_latest_block().index
+        step = 1
+        out = []
+        while index > first and len(out) < LOCATOR_MAX - 1:
+            out.append([index, self.get_block(index).hash])
+            index -= step
+            step *= 2
+        out.append([first, self.chain[0].hash])
+        return out
+
+    def fork_point(self, locator):
+        """상대의 locator 중 우리도 가진 가장 최근 블록 lo 와, 그 바로 앞(더 최신) 항목 hi -> (lo, hi).
+        갈라진 지점은 lo 와 hi 사이. 공통 블록이 없거나 상대가 갈라지지 않았으면 None"""
+        hi = None
+        for index, block_hash in locator[:LOCATOR_MAX]:
+            if self.has_block(index, block_hash):
+                if hi is None: return None
+                return index, min(hi, self.get_latest_block().index + 1)
+            hi = index
+        return None
+
+    def truncate(self, index):
+        """index 블록까지만 남기고 뒤를 버림 (갈라진 뒷부분만 다시 받을 때). 바뀐 게 없으면 False"""
+        pos = index - self.chain[0].index
+        if not 0 <= pos < len(self.chain) - 1: return False
+        self.chain.truncate(pos + 1)
+        with self.hash_lock: self.hashes = None
+        if self.search: self.search.truncate(index)
+        return True
+
+    def reset_to_checkpoint(self, block):
+        if not block.verify(): return False
+        self.chain.reset([block])
+        with self.hash_lock: self.hashes = None
+        if self.search: self.search.rebuild()
+        return True
+
+    def add_block(self, new_block):
+        if new_block.previous_hash != self.get_latest_block().hash: return False
+        if not new_block.verify(): return False
+        self.chain.append(new_block)
+        if self.hashes is not None:
+            with self.hash_lock:
+                if self.hashes is not None: self.hashes[hash_key(new_block.digest)] = new_block.index
+        if self.search: self.search.add(new_block)
+        return True
+      
+    def extend(self, blocks, progress=None):
+        """동기화 페이지로 받은 연속 블록을 verify_chain 으로 한꺼번에 검증한 뒤 이어 붙임 (긴 구간은 프로세스 풀).
+        불량 블록이 있으면 그 앞까지만 붙이고 bad_block_index에 index. 붙인 블록 수 반환"""
+        self.bad_block_index = None
+        good = len(blocks)
+        with METRICS.span("extend"):
+            for checked, total, bad in verify_chain(blocks):
+                if progress: progress(checked, total)
+                if bad is not None:
+                    self.bad_block_index = bad
+                    good = checked
+                    if progress: progress(total, total)
+                    break
+            added = 0
+            for block in blocks[:good]:
+                if not self.add_block(block): break  # 해시는 이미 검증됨 (캐시), 여기서는 연결만 확인
+                added += 1
+        return added
+
+    def replace_chain(self, new_chain_data, progress=None):
+        """받은 체인을 전부 검증한 뒤에만 교체. 실패하면 bad_block_index에 불량 블록 index"""
+        with METRICS.span("replace_chain"):
+            temp_chain = [Block.from_dict(b_data) for b_data in new_chain_data]
+            self.bad_block_index = None
+            if not temp_chain: return False
+            for checked, total, bad in verify_chain(temp_chain):
+                if progress: progress(checked, total)
+                if bad is not None:
+                    self.bad_block_index = bad
+                    return False
+            self.chain.reset(temp_chain)
+            with self.hash_lock: self.hashes = None
+            if self.search: self.search.rebuild()
+            return True
+
+    def search_index(self):
+        """전문 검색 색인. 처음 부를 때 저장된 파일을 읽거나 체인을 훑어서 만들고, 이후는 add_block 마다 갱신"""
+        if self.search is None: SearchIndex(self).attach(self.index_path)
+        return self.search
+
+    def close(self):
+        if self.search and self.index_path:
+            try: self.search.save(self.index_path)
+            except OSError: pass
+        self.chain.close()
+
+class ChainSequencer:
+    """체인에 쓰는 스레드는 이것 하나뿐 (single writer).
+    여러 스레드가 submit 한 메시지를 큐에서 한꺼번에 꺼내 들어온 순서대로 블록으로 만들고 publish(blocks) 호출.
+    post(func) 는 같은 순서 안에서 실행할 작업 (예: 접속자 목록 방송).
+    window > 0 이면 그 시간 동안 모인 메시지(파일 제외)를 BATCH_MAX 개씩 묶음 블록으로 만듦"""
+    def __init__(self, blockchain, publish, batch=SEQUENCER_BATCH, window=BATCH_WINDOW):
+        self.blockchain = blockchain
+        self.publish = publish
+        self.batch = batch
+        self.window = window
+        self.queue = queue.SimpleQueue()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def submit(self, sender, sender_id, message, extra=None):
+        """아무 스레드에서나 호출. extra 는 publish 로 블록과 함께 넘어감. 블록에 넣을 수 없는 메시지는 버림"""
+        if not valid_entry(sender, sender_id, message): return METRICS.fail("entry")
+        self.queue.put((sender, sender_id, message, extra))
+
+    def post(self, func):
+        self.queue.put(func)
+
+    def stop(self, timeout=None):
+        # 큐에 남은 메시지를 모두 블록으로 만들 때까지 기다림 (그 뒤에 체인을 닫아야 함)
+        self.queue.put(None)
+        if self.thread.is_alive() and self.thread is not threading.current_thread(): self.thread.join(timeout)
+
+    def collect(self):
+        items = [self.queue.get()]
+        deadline = time.monotonic() + self.window
+        try:
+            while len(items) < self.batch:
+                wait = deadline - time.monotonic()
+                items.append(self.queue.get(timeout=wait) if wait > 0 else self.queue.get_nowait())
+        except queue.Empty: pass
+        return items
+
+    def seal(self, entries, extra, mined):
+        start = time.perf_counter() if METRICS.on else None
+        new_b = None
+        try:
+            new_b = seal_block(self.blockchain, entries)
+            if new_b: mined.append((new_b, extra))
+        except Exception: METRICS.fail("seal")  # 방을 닫는 중 (저장소가 닫힘)
+        if start is not None:
+            METRICS.observe("seal", time.perf_counter() - start)   # 해시 + 저장
+            METRICS.count("messages", len(entries))
+            if new_b: METRICS.count("blocks")
+
+    def run(self):
+        while True:
+            mined, entries = [], []
+            for item in self.collect():
+                if self.window > 0 and isinstance(item, tuple) and item[3] is None:
+                    entries.append((time.ctime(), item[0], item[1], item[2]))
+                    if len(entries) >= BATCH_MAX:
+                        self.seal(entries, None, mined)
+                        entries = []
+                    continue
+                if entries:
+                    self.seal(entries, None, mined)
+                    entries = []
+                if item is None:
+                    if mined: self.publish(mined)
+                    return
+                if callable(item):
+                    # 앞서 만든 블록을 먼저 내보내야 순서가 유지됨
+                    if mined: self.publish(mined)
+                    mined = []
+                    try: item()
+                    except Exception: pass
+                    continue
+                sender, sender_id, message, extra = item
+                self.seal([(time.ctime(), sender, sender_id, message)], extra, mined)
+            if entries: self.seal(entries, None, mined)
+            if mined:
+                try:
+                    with METRICS.span("publish"): self.publish(mined)
+                except Exception: METRICS.fail("publish")
+
+# ----------------------------------------------------------
+# [3] 호스트 네트워크 엔진 (GUI 없음: asyncio / 클라이언트별 스레드)
+# ----------------------------------------------------------
+USE_ASYNC_HOST = os.environ.get("CHAINCHAT_ASYNC_HOST") == "1"  # 1이면 클라이언트별 스레드 대신 asyncio 호스트
+OUTBOUND_QUEUE_LIMIT = 256         # 클라이언트별 송신 대기 패킷 수 상한
+SLOW_CLIENT_POLICY = "drop"        # 큐가 차면 "drop"(패킷 버림, 클라이언트가 SYNC_REQ로 복구) / "disconnect"
+MAX_FRAME_BYTES = 80 * 1024 * 1024  # 한 줄(프레임) 최대 크기 (50MB 파일의 base64 포함)
+READ_SIZE_MIN = 4096               # 소켓 읽기 크기 (큰 프레임을 받는 동안 READ_SIZE_MAX 까지 늘어남)
+READ_SIZE_MAX = 1024 * 1024
+LATENCY_SAMPLES = 10000            # 방송 지연 통계에 보관하는 최근 샘플 수
+WRITE_BATCH_MAX = 64               # 한 번의 writev/sendmsg 로 묶어 보내는 최대 패킷 수
+PRESENCE_WINDOW = 0.05             # 이 시간 동안 생긴 입장/퇴장은 PRESENCE 델타 하나로 묶어서 방송
+HOST_WORKERS = int(os.environ.get("CHAINCHAT_WORKERS", "0"))  # 1 이상이면 헤드리스 호스트를 워커 프로세스 N개 + 시퀀서로 (0 = 한 프로세스)
+REUSE_PORT = sys.platform.startswith("linux") and hasattr(socket, "SO_REUSEPORT")  # 워커마다 같은 포트 소켓 (아니면 부모 소켓 공유)
+FANOUT_RING_BYTES = 8 * 1024 * 1024   # 시퀀서 -> 워커 방송용 공유 메모리 링 크기 (더 큰 레코드는 나눠서 흘려 보냄)
+FANOUT_WAIT = 0.1                     # 링이 비었거나 찼을 때 다시 확인하는 간격 (초)
+WORKER_START_TIMEOUT = 30             # 워커 프로세스가 포트를 열 때까지 기다리는 최대 시간 (초)
+FANOUT_BLOCKS, FANOUT_USERS, FANOUT_STOP = 1, 2, 3   # 링 레코드 종류
+RELAY_FANOUT = int(os.environ.get("CHAINCHAT_RELAY", "0"))  # 1 이상이면 게스트끼리 중계: 호스트는 이만큼에게만 블록을 보내고 각자 자식 이만큼에게 전달
+GUEST_RELAY = os.environ.get("CHAINCHAT_GUEST_RELAY", "1") == "1"  # 호스트가 WELCOME 에서 중계를 켰다고 알리면 게스트가 중계 포트를 열고 RELAY_PORT 로 알림
+RELAY_GRACE = 2.0                  # 중계 트리에서 부모가 정해지거나 바뀐 게스트에게 호스트도 직접 보내는 시간 (초, 중복은 해시로 버림)
+RELAY_HEAD_SECONDS = 1.0           # 중계로 받는 게스트에게 이만큼 전에 방송한 최신 블록을 HEAD 로 알림 (누락 확인용)
+RELAY_CONNECT_TIMEOUT = 3          # 자식 게스트 연결 제한 시간 (실패하면 이만큼 동안 그 자식에게 보낼 것은 버림)
+RELAY_SEEN = 4096                  # 중복 확인용으로 기억하는 최근 블록 해시 수
+
+WIRE_CODECS = ("bin", "zlib")     # 지원하는 전송 형식 (JOIN 의 codecs 와 교집합을 WELCOME 으로 알림, 없으면 JSON 줄만)
+WIRE_MAGIC = 0x01                  # 바이너리 프레임 시작 바이트 (json.dumps 는 제어 문자를 이스케이프하므로 JSON 줄에는 없음)
+FRAME_HEADER = struct.Struct("<BBI")  # magic, kind, payload 길이
+WIRE_JSON, WIRE_PAGE, WIRE_BLOCK, WIRE_FILE = 1, 2, 3, 4  # kind: JSON 패킷 / SYNC_PAGE / BLOCK / FILE_RECV
+WIRE_STREAM = 0x80                 # kind 플래그: 연결별 zlib 스트림으로 압축한 payload
+WIRE_ZLIB_LEVEL = 6
+DIGEST_LENGTH = struct.Struct("<B")
+
+def encode_packet(packet):
+    return (json.dumps(packet) + "\n").encode('utf-8')
+
+def negotiate_codecs(offered):
+    """JOIN 의 codecs 중 이 버전이 지원하는 것만 (zlib 는 bin 프레임 안에서만 사용)"""
+    if not isinstance(offered, list): return []
+    codecs = [c for c in WIRE_CODECS if c in offered]
+    return codecs if "bin" in codecs else []
+
+def binary_frame(kind, payload):
+    return FRAME_HEADER.pack(WIRE_MAGIC, kind, len(payload)) + payload
+
+def pack_blocks(blocks):
+    """블록 목록 -> 바이너리 (해시 인코딩과 같은 필드 배치 + 해시 원본, hex/JSON 없이)"""
+    parts = []
+    for b in blocks:
+        parts.append(encode_block_fields(b.version, b.index, b.timestamp, b.sender, b.sender_id, b.message, b.prev_digest))
+        parts.append(DIGEST_LENGTH.pack(len(b.digest)))
+        parts.append(b.digest)
+    return b"".join(parts)
+
+def unpack_blocks(data):
+    """pack_blocks 의 역. 해시는 다시 계산하지 않은 Block 목록 (검증은 add_block 에서)"""
+    blocks = []
+    pos = 0
+    while pos < len(data):
+        version, index, sender_id, prev_len = BLOCK_HEADER.unpack_from(data, pos)
+        pos += BLOCK_HEADER.size
+        prev_digest = data[pos:pos + prev_len]
+        pos += prev_len
+        texts = []
+        for _ in range(3):
+            (n,) = FIELD_LENGTH.unpack_from(data, pos)
+            pos += FIELD_LENGTH.size
+            texts.append(data[pos:pos + n].decode('utf-8'))
+            pos += n
+        (n,) = DIGEST_LENGTH.unpack_from(data, pos)
+        digest = data[pos + 1:pos + 1 + n]
+        pos += 1 + n
+        if len(prev_digest) != prev_len or len(digest) != n: raise ValueError("truncated block")
+        blocks.append(Block.restore(index, texts[0], texts[1], sender_id, texts[2], prev_digest, digest, version))
+    return blocks
+
+def wire_block(data):
+    """패킷 안의 블록 (JSON 이면 dict, 바이너리 프레임이면 이미 Block) -> Block"""
+    return data if isinstance(data, Block) else Block.from_dict(data)
+
+def block_packet(block, extra=None):
+    """방송용 BLOCK / FILE_RECV (JSON 줄)"""
+    if extra: return encode_packet(dict(extra, type="FILE_RECV", block_data=block.to_dict()))
+    return encode_packet({"type": "BLOCK", "data": block.to_dict()})
+
+def block_frame(block, extra=None):
+    """block_packet 의 바이너리 프레임 (FILE_RECV 내용은 base64 대신 원본 바이트)"""
+    packed = pack_blocks([block])
+    if not extra: return binary_frame(WIRE_BLOCK, packed)
+    header = json.dumps({k: v for k, v in extra.items() if k not in ("content", "raw")}).encode('utf-8')
+    content = extra['raw'] if 'raw' in extra else base64.b64decode(extra['content'])   # raw: 바이너리 프레임으로 받은 것을 중계
+    return binary_frame(WIRE_FILE, b"".join([FIELD_LENGTH.pack(len(header)), header, FIELD_LENGTH.pack(len(packed)), packed,
+                                             content]))
+
+def decode_frame(kind, payload):
+    """바이너리 프레임 payload -> 패킷 dict (JSON 줄로 받은 것과 같은 모양, 블록만 Block 객체)"""
+    if kind == WIRE_JSON: return json.loads(payload)
+    if kind == WIRE_PAGE: return {"type": "SYNC_PAGE", "blocks": unpack_blocks(payload)}
+    if kind == WIRE_BLOCK: return {"type": "BLOCK", "data": unpack_blocks(payload)[0]}
+    if kind == WIRE_FILE:
+        (n,) = FIELD_LENGTH.unpack_from(payload)
+        pos = FIELD_LENGTH.size + n
+        header = json.loads(payload[FIELD_LENGTH.size:pos])
+        (m,) = FIELD_LENGTH.unpack_from(payload, pos)
+        pos += FIELD_LENGTH.size
+        return dict(header, type="FILE_RECV", block_data=unpack_blocks(payload[pos:pos + m])[0], raw=payload[pos + m:])
+    raise ValueError(f"unknown frame kind {kind}")
+
+class WireCodec:
+    """연결 하나의 송신 형식. 합의한 codecs 가 없으면 JSON 줄, 있으면 바이너리 프레임.
+    동기화 패킷은 연결별 zlib 스트림 하나로 압축 (앞 페이지 내용을 사전으로 이어 써서 페이지별 압축보다 작음)"""
+    def __init__(self, codecs=()):
+        self.codecs = list(codecs)
+        self.binary = "bin" in self.codecs
+        self.deflate = zlib.compressobj(WIRE_ZLIB_LEVEL) if self.binary and "zlib" in self.codecs else None
+
+    def sync(self, packet):
+        """sync_packets 의 패킷 하나 -> bytes (한 연결에서 보내는 순서대로 호출해야 함)"""
+        if not self.binary:
+            if packet['type'] == 'SYNC_PAGE': packet = dict(packet, blocks=[b.to_dict() for b in packet['blocks']])
+            return encode_packet(packet)
+        if packet['type'] == 'SYNC_PAGE': kind, payload = WIRE_PAGE, pack_blocks(packet['blocks'])
+        else: kind, payload = WIRE_JSON, json.dumps(packet).encode('utf-8')
+        if self.deflate:
+            kind |= WIRE_STREAM
+            payload = self.deflate.compress(payload) + self.deflate.flush(zlib.Z_SYNC_FLUSH)
+        return binary_frame(kind, payload)
+
+def send_buffers(sock, buffers):
+    """여러 패킷을 합치지 않고 sendmsg(writev)로 한 번에 전송 (지원하지 않으면 합쳐서 sendall)"""
+    if len(buffers) == 1: return sock.sendall(buffers[0])
+    if not hasattr(sock, "sendmsg"): return sock.sendall(b"".join(buffers))
+    views = deque(memoryview(b) for b in buffers)
+    while views:
+        sent = sock.sendmsg(list(views)[:WRITE_BATCH_MAX])
+        while sent:
+            if sent >= len(views[0]): sent -= len(views.popleft())
+            else:
+                views[0] = views[0][sent:]
+                sent = 0
+
+class FrameReader:
+    """호스트/게스트 공용 프레임 리더: 줄(\n) 단위 JSON + WIRE_MAGIC 으로 시작하는 길이 접두 바이너리 프레임
+    bytearray에 이어 붙이고 \n 검색을 마지막 위치부터 이어서 하므로 큰 프레임도 선형 시간.
+    읽기 크기는 데이터가 가득 차서 들어오면 두 배로 늘리고, 적게 들어오면 다시 줄임"""
+    def __init__(self, sock, max_frame=MAX_FRAME_BYTES):
+        self.sock = sock
+        self.max_frame = max_frame
+        self.buffer = bytearray()
+        self.scan = 0
+        self.read_size = READ_SIZE_MIN
+        self.inflate = None         # WIRE_STREAM 프레임용 zlib 스트림 (처음 받을 때 생성)
+
+    def feed(self, data):
+        """받은 데이터를 넣고 완성된 프레임 목록 반환 (JSON 줄은 bytes, 바이너리 프레임은 패킷 dict, 빈 줄은 건너뜀)"""
+        buf = self.buffer
+        buf += data
+        frames = []
+        while buf:
+            if buf[0] == WIRE_MAGIC:
+                if len(buf) < FRAME_HEADER.size: break
+                _, kind, length = FRAME_HEADER.unpack_from(buf)
+                if length > self.max_frame: raise ValueError("frame exceeds MAX_FRAME_BYTES")
+                end = FRAME_HEADER.size + length
+                if len(buf) < end: break
+                frames.append(self.decode(kind, bytes(buf[FRAME_HEADER.size:end])))
+                del buf[:end]
+                self.scan = 0
+                continue
+            # 바이너리 프레임 앞까지의 줄만 자름 (scan 앞쪽에는 \n 도 WIRE_MAGIC 도 없음)
+            magic = buf.find(WIRE_MAGIC, self.scan)
+            nl = buf.rfind(b"\n", self.scan, len(buf) if magic < 0 else magic)
+            if nl >= 0:
+                frames.extend(f for f in bytes(buf[:nl]).split(b"\n") if f)
+                del buf[:nl + 1]    # bytearray 앞부분 삭제는 복사 없이 시작 위치만 이동
+            if magic < 0:
+                self.scan = len(buf)    # 남은 데이터에는 \n 이 없으므로 다음엔 끝에서부터 검색
+                break
+            if magic != nl + 1: raise ValueError("binary frame inside a line")
+            self.scan = 0
+        if len(buf) > self.max_frame + FRAME_HEADER.size: raise ValueError("frame exceeds MAX_FRAME_BYTES")
+        if METRICS.on:
+            METRICS.count("bytes_in", len(data))
+            METRICS.count("frames_in", len(frames))
+        return frames
+
+    def decode(self, kind, payload):
+        try:
+            if kind & WIRE_STREAM:
+                if self.inflate is None: self.inflate = zlib.decompressobj()
+                payload = self.inflate.decompress(payload, self.max_frame)
+                if self.inflate.unconsumed_tail: raise ValueError("frame exceeds MAX_FRAME_BYTES")
+            return decode_frame(kind & ~WIRE_STREAM, payload)
+        except (zlib.error, struct.error, IndexError, KeyError, TypeError) as e:
+            raise ValueError(f"bad binary frame: {e}")
+
+    def frames(self):
+        """소켓이 닫힐 때까지 프레임(JSON 줄 bytes 또는 바이너리 프레임의 패킷 dict)을 yield"""
+        while True:
+            data = self.sock.recv(self.read_size)
+            if not data: return
+            if len(data) == self.read_size: self.read_size = min(self.read_size * 2, READ_SIZE_MAX)
+            elif len(data) < self.read_size // 4: self.read_size = max(self.read_size // 2, READ_SIZE_MIN)
+            yield from self.feed(data)
+
+class SocketWriter:
+    """스레드 방식 호스트의 소켓별 writer: 전용 writer 스레드 + 크기가 제한된 송신 큐 (HostClient 의 스레드 판)
+    쌓인 패킷은 시스템 콜 하나로 묶어 전송. 보내는 쪽(시퀀서 등)은 소켓 쓰기를 기다리지 않으므로
+    읽지 않는 클라이언트 하나가 방 전체를 멈추지 않음. writer 스레드는 처음 보낼 때 시작"""
+    def __init__(self, sock):
+        self.sock = sock
+        self.queue = queue.Queue(OUTBOUND_QUEUE_LIMIT)
+        self.thread = None
+        self.lock = threading.Lock()
+        self.closed = False
+        self.dropped = 0
+
+    def start(self):
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+
+    def send(self, data):
+        """방송용: 기다리지 않음. 큐가 차면 정책에 따라 버리거나 (클라이언트가 SYNC_REQ 로 복구) 끊음"""
+        if self.thread is None: self.start()
+        try: self.queue.put_nowait((data, time.perf_counter()))
+        except queue.Full:
+            self.dropped += 1
+            if METRICS.on: METRICS.count("dropped")
+            if SLOW_CLIENT_POLICY == "disconnect": self.close()
+
+    def send_wait(self, data):
+        """SYNC 페이지, WELCOME, 게스트의 CHAT 처럼 빠지면 안 되는 패킷은 큐에 자리가 날 때까지 호출한 스레드가 대기"""
+        if self.thread is None: self.start()
+        while not self.closed:
+            try: return self.queue.put((data, time.perf_counter()), timeout=1)   # 1초마다 닫혔는지 확인
+            except queue.Full: pass
+        raise ConnectionError("writer closed")
+
+    def run(self):
+        try:
+            while not self.closed:
+                batch = [self.queue.get()]
+                try:
+                    while len(batch) < WRITE_BATCH_MAX: batch.append(self.queue.get_nowait())
+                except queue.Empty: pass
+                if None in batch: return
+                send_buffers(self.sock, [data for data, _ in batch])
+                if METRICS.on:
+                    now = time.perf_counter()
+                    for data, queued_at in batch:
+                        METRICS.observe("send", now - queued_at)
+                        METRICS.count("bytes_out", len(data))
+        except OSError: METRICS.fail("send")
+        finally: self.close()
+
+    def close(self):
+        """writer 를 멈추고 소켓 양방향을 닫음 (수신 스레드가 끊김을 보고 정리)"""
+        if self.closed: return
+        self.closed = True
+        try: self.queue.put_nowait(None)
+        except queue.Full: pass
+        try: self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError: pass
+
+def relay_tree(members, fanout):
+    """중계 트리 (k진 트리): 호스트는 앞의 fanout 명에게 보내고, i 번째는 (i+1)*fanout 번째부터 fanout 명에게 전달 -> [(부모, [자식])]"""
+    return [(c, members[(i + 1) * fanout:(i + 2) * fanout]) for i, c in enumerate(members)]
+
+def relay_signature(key, nonce):
+    return hmac.new(key.encode(), f"relay:{nonce}".encode(), hashlib.sha256).hexdigest()
+
+def valid_port(port):
+    return isinstance(port, int) and 0 < port < 65536
+
+def percentile(samples, pct):
+    if not samples: return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+class Presence:
+    """접속자 목록 (사용자 ID -> 닉네임, 입장 순서) + 버전. 같은 닉네임이 여럿이어도 ID 로 구분.
+    호스트: join/leave 로 바뀐 것을 쌓아 두었다가 flush() 로 델타 하나 (버전 +1).
+      PRESENCE {"version", "joined": [[id, 이름]...], "left": [id...]} 또는 스냅샷 {"version", "users": [[id, 이름]...]}
+    게스트(와 멀티 프로세스 워커): apply() 로 반영. 델타는 바로 다음 버전일 때만 적용하고 아니면 False (PRESENCE_REQ 로 스냅샷 요청).
+    스냅샷에는 아직 방송 안 한 변경도 들어 있지만 같은 델타를 다시 적용해도 결과가 같아서 상관없음"""
+    def __init__(self):
+        self.users = {}
+        self.version = 0
+        self.joined = {}    # 아직 방송하지 않은 입장
+        self.left = []      # 아직 방송하지 않은 퇴장
+
+    def join(self, user_id, name):
+        self.users[user_id] = name
+        self.joined[user_id] = name
+
+    def leave(self, user_id):
+        if user_id not in self.users: return False
+        del self.users[user_id]
+        # 묶는 중에 들어왔다 나간 사용자는 입장도 보내지 않음 (스냅샷으로 이미 본 클라이언트를 위해 퇴장은 보냄)
+        self.joined.pop(user_id, None)
+        self.left.append(user_id)
+        return True
+
+    def flush(self):
+        """쌓인 변경을 PRESENCE 델타로 (없으면 None)"""
+        if not self.joined and not self.left: return None
+        self.version += 1
+        delta = {"type": "PRESENCE", "version": self.version, "joined": list(self.joined.items()), "left": self.left}
+        self.joined, self.left = {}, []
+        return delta
+
+    def snapshot(self):
+        return {"type": "PRESENCE", "version": self.version, "users": list(self.users.items())}
+
+    def names(self):
+        return list(self.users.values())
+
+    def apply(self, p):
+        if 'users' in p:
+            self.users = {user_id: name for user_id, name in p['users']}
+            self.version = p['version']
+            return True
+        if p['version'] <= self.version: return True     # 이미 스냅샷에 들어 있던 변경
+        if p['version'] != self.version + 1: return False
+        for user_id in p['left']: self.users.pop(user_id, None)
+        for user_id, name in p['joined']: self.users[user_id] = name
+        self.version = p['version']
+        return True
+
+class HostClient:
+    """asyncio 호스트에 연결된 클라이언트 하나: 전용 writer 태스크 + 크기가 제한된 송신 큐"""
+    def __init__(self, host, writer):
+        self.host = host
+        self.writer = writer
+        self.queue = asyncio.Queue(OUTBOUND_QUEUE_LIMIT)
+        self.name = None
+        self.user_id = None
+        self.legacy_users = False   # PRESENCE 를 모르는 구버전 (USER_LIST 로 보냄)
+        self.relay_addr = None      # 중계 포트를 알린 게스트 (ip, port)
+        self.relay_parent = None    # 중계 트리에서 이 게스트에게 전달하는 게스트 (없으면 호스트가 직접)
+        self.relay_children = []    # RELAY_PEERS 로 알려 준 자식 주소
+        self.relayed_until = None   # 이 시각까지는 호스트도 직접 보냄 (부모가 연결하는 동안)
+        self.codec = WireCodec()    # JOIN 에서 합의하기 전까지는 JSON 줄
+        self.dropped = 0
+        self.task = asyncio.get_running_loop().create_task(self.write_loop())
+
+    def send(self, data):
+        """방송용: 기다리지 않음. 큐가 차면 정책에 따라 버리거나 끊어서 다른 클라이언트를 막지 않음"""
+        try: self.queue.put_nowait((data, time.perf_counter()))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            if METRICS.on: METRICS.count("dropped")
+            if SLOW_CLIENT_POLICY == "disconnect": self.close()
+
+    async def send_wait(self, data):
+        """SYNC 페이지처럼 빠지면 안 되는 패킷은 큐에 자리가 날 때까지 대기"""
+        await self.queue.put((data, time.perf_counter()))
+
+    async def write_loop(self):
+        try:
+            while True:
+                # 같은 틱에 쌓인 패킷은 writelines 한 번 + drain 한 번으로 묶어서 전송
+                batch = [await self.queue.get()]
+                while not self.queue.empty() and len(batch) < WRITE_BATCH_MAX:
+                    batch.append(self.queue.get_nowait())
+                self.writer.writelines([data for data, _ in batch])
+                await self.writer.drain()
+                now = time.perf_counter()
+                self.host.latencies.extend(now - queued_at for _, queued_at in batch)
+                if METRICS.on:
+                    for data, queued_at in batch:
+                        METRICS.observe("send", now - queued_at)
+                        METRICS.count("bytes_out", len(data))
+        except (ConnectionError, OSError): METRICS.fail("send")
+        finally: self.close()
+
+    def close(self):
+        if not self.writer.is_closing(): self.writer.close()
+
+class AsyncChatHost:
+    """asyncio 기반 호스트 엔진 (GUI 없음). 이벤트 루프 하나가 모든 클라이언트를 처리하고
+    JOIN/SYNC_REQ/CHAT/FILE 을 받아 BLOCK/FILE_RECV 로 방송.
+    on_block(block), on_users(users) 콜백은 루프 스레드에서 호출됨"""
+    def __init__(self, nickname, blockchain=None, room_key=None, file_cache=None, file_store=None, on_block=None, on_users=None,
+                 batch_window=BATCH_WINDOW, relay=RELAY_FANOUT):
+        self.blockchain = blockchain
+        self.room_key = room_key
+        self.file_cache = FileCache(file_store) if file_cache is None else file_cache
+        self.file_store = file_store
+        self.on_block = on_block
+        self.on_users = on_users
+        self.clients = []
+        self.presence = Presence()
+        if nickname: self.presence.join(1, nickname)  # 헤드리스 호스트는 참여자가 아님
+        self.presence_timer = None
+        self.relay_fanout = relay
+        self.head = None            # 마지막으로 방송한 블록 (index, hash)
+        self.head_pending = None    # 다음 HEAD 로 알릴 블록
+        self.head_timer = None
+        self.next_user_id = 2
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+        self.batch_window = batch_window
+        self.pending = []           # 묶음 블록으로 봉인을 기다리는 메시지
+        self.flush_timer = None
+        self.loop = None
+        self.server = None
+
+    # --- 실행 제어 (다른 스레드에서 호출) ---
+    def open(self, host, port):
+        """포트만 열고 아직 처리는 시작하지 않음 (사용 중이면 OSError)"""
+        self.loop = asyncio.new_event_loop()
+        try:
+            self.server = self.loop.run_until_complete(asyncio.start_server(
+                self.handle_client, host, port, limit=MAX_FRAME_BYTES, reuse_address=True, backlog=1024))
+        except OSError:
+            self.loop.close()
+            raise
+
+    def run_in_thread(self):
+        threading.Thread(target=self.loop.run_forever, daemon=True).start()
+
+    def call(self, func, *args):
+        self.loop.call_soon_threadsafe(func, *args)
+
+    def stop(self):
+        if self.loop is None or self.loop.is_closed(): return
+        try: asyncio.run_coroutine_threadsafe(self.shutdown(), self.loop).result(timeout=2)
+        except Exception: pass
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+    async def shutdown(self):
+        if self.server: self.server.close()
+        for client in list(self.clients): client.close()
+
+    def broadcast_latency(self):
+        """방송 패킷이 큐에 들어가서 전송(drain)될 때까지 걸린 시간 통계 (ms)"""
+        samples = list(self.latencies)
+        return {"samples": len(samples), "p50_ms": percentile(samples, 50) * 1000,
+                "p99_ms": percentile(samples, 99) * 1000, "max_ms": max(samples, default=0) * 1000}
+
+    # --- 이하 루프 스레드 ---
+    def broadcast(self, packet):
+        data = encode_packet(packet)
+        for client in self.clients: client.send(data)
+
+    def publish(self, block, extra=None):
+        """BLOCK / FILE_RECV 방송. JSON 줄과 바이너리 프레임은 필요한 쪽만 한 번씩 직렬화"""
+        with METRICS.span("publish"): self.publish_to_clients(block, extra)
+
+    def publish_to_clients(self, block, extra):
+        encoded = {}
+        now = time.monotonic()
+        for client in self.clients:
+            if client.relayed_until is not None and client.relayed_until <= now: continue   # 중계 트리로 받음
+            binary = client.codec.binary
+            if binary not in encoded: encoded[binary] = (block_frame if binary else block_packet)(block, extra)
+            client.send(encoded[binary])
+        self.head = (block.index, block.hash)
+        if self.relay_fanout: self.schedule_head()
+
+    # --- 게스트 중계 트리 ---
+    def rebuild_relay(self):
+        """중계 포트를 알린 게스트들로 트리를 다시 만들고 자식이 바뀐 게스트에게만 RELAY_PEERS 전송"""
+        if not self.relay_fanout: return
+        now = time.monotonic()
+        children_of = dict(relay_tree([c for c in self.clients if c.relay_addr], self.relay_fanout))
+        parent_of = {child: c for c, children in children_of.items() for child in children}
+        for client in self.clients:
+            parent = parent_of.get(client)
+            if parent is None: client.relayed_until = None
+            elif parent is not client.relay_parent: client.relayed_until = now + RELAY_GRACE
+            client.relay_parent = parent
+            children = [list(child.relay_addr) for child in children_of.get(client, ())]
+            if children != client.relay_children:
+                client.relay_children = children
+                client.send(encode_packet({"type": "RELAY_PEERS", "children": children}))
+
+    def schedule_head(self):
+        if self.head_timer is None:
+            self.head_pending = self.head
+            self.head_timer = self.loop.call_later(RELAY_HEAD_SECONDS, self.publish_head)
+
+    def publish_head(self):
+        """중계로 받는 게스트에게 RELAY_HEAD_SECONDS 전의 최신 블록을 알림 (그때까지 못 받았으면 게스트가 RELAY_MISS)"""
+        self.head_timer = None
+        now = time.monotonic()
+        data = encode_packet({"type": "HEAD", "index": self.head_pending[0], "hash": self.head_pending[1]})
+        for client in self.clients:
+            if client.relayed_until is not None and client.relayed_until <= now: client.send(data)
+        if self.head != self.head_pending: self.schedule_head()
+
+    def users_changed(self):
+        # PRESENCE_WINDOW 동안 생긴 입장/퇴장은 델타 하나로
+        if self.presence_timer is None: self.presence_timer = self.loop.call_later(PRESENCE_WINDOW, self.publish_users)
+
+    def publish_users(self):
+        self.presence_timer = None
+        self.rebuild_relay()
+        delta = self.presence.flush()
+        if delta is None: return
+        encoded = {}
+        for client in self.clients:
+            if client.user_id is None: continue
+            legacy = client.legacy_users
+            if legacy not in encoded:
+                encoded[legacy] = encode_packet({"type": "USER_LIST", "users": self.presence.names()} if legacy else delta)
+            client.send(encoded[legacy])
+        if self.on_users: self.on_users(self.presence.names())
+
+    def seal(self, entries):
+        with METRICS.span("seal"): new_b = seal_block(self.blockchain, entries)
+        if METRICS.on:
+            METRICS.count("messages", len(entries))
+            if new_b: METRICS.count("blocks")
+        if new_b and self.on_block: self.on_block(new_b)
+        return new_b
+
+    def mine(self, sender, sender_id, msg):
+        self.flush_batch()  # 묶는 중인 메시지가 먼저
+        return self.seal([(time.ctime(), sender, sender_id, msg)])
+
+    def mine_and_broadcast(self, sender, sender_id, msg):
+        if not valid_entry(sender, sender_id, msg): return METRICS.fail("entry")   # 묶음에 섞이기 전에
+        if self.batch_window <= 0:
+            new_b = self.mine(sender, sender_id, msg)
+            if new_b: self.publish(new_b)
+            return
+        self.pending.append((time.ctime(), sender, sender_id, msg))
+        if len(self.pending) >= BATCH_MAX: self.flush_batch()
+        elif len(self.pending) == 1: self.flush_timer = self.loop.call_later(self.batch_window, self.flush_batch)
+
+    def flush_batch(self):
+        if self.flush_timer:
+            self.flush_timer.cancel()
+            self.flush_timer = None
+        entries, self.pending = self.pending, []
+        if not entries: return
+        new_b = self.seal(entries)
+        if new_b: self.publish(new_b)
+
+    def mine_and_broadcast_file(self, sender, sender_id, filename, encoded):
+        if not valid_entry(sender, sender_id, f"FILE_TRANSFER:{filename}"): return METRICS.fail("entry")
+        self.file_cache[filename] = encoded
+        new_b = self.mine(sender, sender_id, f"FILE_TRANSFER:{filename}")
+        if new_b: self.publish(new_b, {"sender": sender, "sender_id": sender_id, "filename": filename, "content": encoded})
+
+    async def send_sync(self, client, have, locator=None):
+        with METRICS.span("sync"):
+            await self.send_packets(client, sync_packets(self.blockchain, have, self.room_key, locator))
+
+    async def send_packets(self, client, packets):
+        for packet in packets:
+            await client.send_wait(client.codec.sync(packet))
+
+    async def handle_client(self, reader, writer, first=None):
+        # 첫 줄이 FILE_PUT/FILE_GET 이면 파일 연결, 아니면 채팅 연결 (RoomHost 는 이미 읽은 첫 줄을 넘김)
+        if first is None:
+            try: first = json.loads(await reader.readline() or b"null")
+            except (ConnectionError, OSError, ValueError): first = None
+        if isinstance(first, dict) and first.get('type') in FILE_CHANNEL_TYPES:
+            try: await self.serve_file_channel(reader, writer, first)
+            except (ConnectionError, OSError, ValueError, KeyError, TypeError, asyncio.IncompleteReadError): pass
+            finally: writer.close()
+            return
+        client = HostClient(self, writer)
+        self.clients.append(client)
+        try:
+            line = None
+            while True:
+                try: await self.handle_packet(client, first if line is None else json.loads(line))
+                except (ValueError, KeyError, TypeError): METRICS.fail("packet")
+                line = await reader.readline()
+                if not line: break
+                if METRICS.on:
+                    METRICS.count("bytes_in", len(line))
+                    METRICS.count("frames_in")
+        except (ConnectionError, OSError, ValueError): pass  # 연결 끊김 / MAX_FRAME_BYTES 초과
+        finally:
+            self.clients.remove(client)
+            client.close()
+            client.task.cancel()
+            if client.user_id is not None and self.presence.leave(client.user_id): self.users_changed()
+            if client.name: self.mine_and_broadcast("System", 0, f"'{client.name}' left.")
+
+    async def serve_file_channel(self, reader, writer, p):
+        store = self.file_store
+        if p['type'] == 'FILE_GET':
+            manifest = store.load_manifest(p['manifest_hash'])
+            if manifest is None:
+                writer.write(encode_packet({"type": "FILE_ERROR", "reason": "not found"}))
+                return await writer.drain()
+            writer.write(encode_packet({"type": "MANIFEST", "manifest": manifest}))
+            for chunk_hash in manifest['chunks']:
+                path = store.chunk_path(chunk_hash)
+                writer.write(encode_packet({"type": "CHUNK", "hash": chunk_hash, "size": os.path.getsize(path)}))
+                with open(path, "rb") as f: await self.loop.sendfile(writer.transport, f)
+            return await writer.drain()
+        manifest = check_manifest(p['manifest'])
+        need = store.missing(manifest)
+        writer.write(encode_packet({"type": "FILE_NEED", "chunks": need}))
+        await writer.drain()
+        expected = {manifest['chunks'][i] for i in need}
+        for _ in need:
+            header = await read_header_async(reader)
+            if header['hash'] not in expected or not 0 < header['size'] <= FILE_CHUNK_SIZE: raise ValueError("unexpected chunk")
+            # 청크 하나(최대 FILE_CHUNK_SIZE)만 메모리에 올림
+            if not store.put_chunk(header['hash'], await reader.readexactly(header['size'])): raise ValueError("chunk hash mismatch")
+        if store.missing(manifest): raise ValueError("upload incomplete")
+        manifest_hash = store.save_manifest(manifest)
+        writer.write(encode_packet({"type": "FILE_DONE", "manifest_hash": manifest_hash}))
+        await writer.drain()
+        self.mine_and_broadcast(p['sender'], p['sender_id'], file_block_message(manifest_hash, manifest['name']))
+
+    async def handle_packet(self, client, p):
+        if p['type'] == 'JOIN':
+            if client.user_id is not None: return
+            client.name = p['nickname']
+            client.user_id = assigned_id = self.next_user_id
+            self.next_user_id += 1
+            self.presence.join(assigned_id, client.name)
+            # 접속자 목록: 새 클라이언트는 버전이 붙은 스냅샷, 구버전은 닉네임 목록 (이후는 델타 / 목록 방송)
+            client.legacy_users = not p.get('presence')
+            if client.legacy_users: client.send(encode_packet({"type": "USER_LIST", "users": self.presence.names()}))
+            else: client.send(encode_packet(self.presence.snapshot()))
+            client.codec = WireCodec(negotiate_codecs(p.get('codecs')))
+            welcome = {"type": "WELCOME", "assigned_id": assigned_id, "codecs": client.codec.codecs}
+            if self.relay_fanout: welcome["relay"] = 1     # 게스트는 이걸 보고서야 중계 포트를 엶
+            await client.send_wait(encode_packet(welcome))
+            if 'have' in p: await self.send_sync(client, p['have'], p.get('locator'))
+            else: await client.send_wait(encode_packet({"type": "SYNC", "chain": [b.to_dict() for b in self.blockchain.chain]}))
+            self.users_changed()
+            self.mine_and_broadcast("System", 0, f"'{client.name}' joined.")
+        elif p['type'] == 'PRESENCE_REQ':
+            client.send(encode_packet(self.presence.snapshot()))
+        elif p['type'] == 'RELAY_PORT':
+            if self.relay_fanout and client.user_id is not None and valid_port(p.get('port')):
+                client.relay_addr = (client.writer.get_extra_info("peername")[0], p['port'])
+                self.rebuild_relay()
+        elif p['type'] == 'RELAY_MISS':
+            # 중계로 블록을 놓친 게스트는 트리에서 빼고 직접 보냄
+            if METRICS.on: METRICS.count("relay_miss")
+            client.relay_addr = None
+            self.rebuild_relay()
+        elif p['type'] == 'SYNC_REQ':
+            await self.send_sync(client, p.get('have'), p.get('locator'))
+        elif p['type'] == 'PROBE':
+            await self.send_packets(client, probe_packets(self.blockchain, p))
+        elif p['type'] == 'CHAT':
+            self.mine_and_broadcast(p['sender'], p['sender_id'], p['message'])
+        elif p['type'] == 'FILE':
+            self.mine_and_broadcast_file(p['sender'], p['sender_id'], p['filename'], p['content'])
+
+class ThreadedChatHost:
+    """클라이언트마다 스레드 하나인 호스트 엔진 (GUI 없음, 기본값). 체인에 쓰는 것은 ChainSequencer 하나.
+    AsyncChatHost 와 같은 사용법: open() -> run_in_thread() -> call()/stop(),
+    on_block(block), on_users(users) 콜백은 시퀀서 스레드에서 호출됨"""
+    def __init__(self, nickname, blockchain=None, room_key=None, file_cache=None, file_store=None, on_block=None, on_users=None,
+                 relay=RELAY_FANOUT):
+        self.blockchain = blockchain
+        self.room_key = room_key
+        self.file_cache = FileCache(file_store) if file_cache is None else file_cache
+        self.file_store = file_store
+        self.on_block = on_block
+        self.on_users = on_users
+        self.clients = []
+        self.writers = {}           # 소켓 -> SocketWriter
+        self.codecs = {}            # 소켓 -> WireCodec (JOIN 에서 합의)
+        self.legacy_users = set()   # PRESENCE 를 모르는 구버전 클라이언트 소켓 (USER_LIST 로 보냄)
+        self.presence = Presence()
+        if nickname: self.presence.join(1, nickname)
+        self.presence_timer = None
+        self.relay_fanout = relay
+        self.relay_ports = {}       # 소켓 -> 중계 포트를 알린 게스트 (ip, port)
+        self.relay_parent = {}      # 소켓 -> 중계 트리의 부모 소켓
+        self.relay_children = {}    # 소켓 -> RELAY_PEERS 로 알려 준 자식 주소
+        self.relayed = {}           # 중계로 받는 소켓 -> 이 시각까지는 호스트도 직접 보냄
+        self.head = None            # 마지막으로 방송한 블록 (index, hash)
+        self.head_pending = None
+        self.head_timer = None
+        self.next_user_id = 2
+        self.state_lock = threading.Lock()   # clients / writers / codecs / presence / relay_* / next_user_id
+        self.sequencer = None
+        self.socket = None
+        self.running = False
+
+    # --- 실행 제어 ---
+    def open(self, host, port, reuse_port=False):
+        """포트만 열고 아직 접속은 받지 않음 (사용 중이면 OSError).
+        reuse_port: 같은 포트를 여는 프로세스끼리 커널이 접속을 나눠 줌 (ProcessChatHost 워커)"""
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if reuse_port: sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        try:
+            sock.bind((host, port))
+            sock.listen(128)
+        except OSError:
+            sock.close()
+            raise
+        self.socket = sock
+
+    def run_in_thread(self):
+        self.running = True
+        self.sequencer = ChainSequencer(self.blockchain, self.publish_blocks).start()
+        # RoomHost 안의 방 엔진은 수신 소켓 없이 시퀀서만 돌림
+        if self.socket: threading.Thread(target=self.accept_clients, daemon=True).start()
+
+    def call(self, func, *args):
+        # 시퀀서 큐가 스레드 안전하므로 바로 호출
+        func(*args)
+
+    def stop(self):
+        self.running = False
+        try: self.socket.close()
+        except Exception: pass
+        with self.state_lock: clients = list(self.clients)
+        for c in clients:
+            try: c.close()
+            except Exception: pass
+        if self.sequencer: self.sequencer.stop()
+
+    # --- 접속 처리 ---
+    def accept_clients(self):
+        while self.running:
+            try:
+                c, a = self.socket.accept()
+                # 채팅/파일 연결 구분과 체인 동기화는 해당 클라이언트 스레드에서 처리 (accept 루프를 막지 않음)
+                threading.Thread(target=self.handle_client, args=(c,), daemon=True).start()
+            except: break
+
+    def handle_client(self, c, frames=None):
+        # frames: RoomHost 가 첫 프레임을 읽고 넘긴 프레임 (없으면 여기서 읽음)
+        client_name = None
+        user_id = None
+        try:
+            for line_bytes in frames or FrameReader(c).frames():
+                if not self.running: break
+                try:
+                    p = json.loads(line_bytes)
+                    if p['type'] in FILE_CHANNEL_TYPES:
+                        # 이후 데이터는 원본 바이트가 섞인 파일 연결이므로 프레임 읽기를 끝냄
+                        try: self.serve_file_channel(c, p)
+                        except: pass
+                        break
+                    if p['type'] == 'JOIN':
+                        if user_id is not None: continue
+                        with self.state_lock:
+                            codec = self.codecs[c] = WireCodec(negotiate_codecs(p.get('codecs')))
+                            self.clients.append(c)
+                            client_name = p['nickname']
+                            user_id = self.join_user(client_name)
+                            # 접속자 목록: 새 클라이언트는 버전이 붙은 스냅샷, 구버전은 닉네임 목록
+                            # (잠금 안에서 보내야 이후 델타보다 먼저 도착)
+                            if p.get('presence'): self.safe_send(c, self.presence.snapshot())
+                            else:
+                                self.legacy_users.add(c)
+                                self.safe_send(c, {"type": "USER_LIST", "users": self.presence.names()})
+                        welcome = {"type": "WELCOME", "assigned_id": user_id, "codecs": codec.codecs}
+                        if self.relay_fanout: welcome["relay"] = 1     # 게스트는 이걸 보고서야 중계 포트를 엶
+                        self.safe_send(c, welcome, wait=True)
+                        if 'have' in p: self.send_sync(c, p['have'], p.get('locator'))
+                        else: self.safe_send(c, {"type": "SYNC", "chain": [b.to_dict() for b in self.blockchain.chain]}, wait=True)  # 구버전 클라이언트
+                        self.users_changed()
+                        self.mine_and_broadcast("System", 0, f"'{client_name}' joined.")
+                    elif p['type'] == 'SYNC_REQ':
+                        self.send_sync(c, p.get('have'), p.get('locator'))
+                    elif p['type'] == 'PRESENCE_REQ':
+                        with self.state_lock: self.safe_send(c, self.presence.snapshot())
+                    elif p['type'] == 'RELAY_PORT':
+                        if self.relay_fanout and user_id is not None and valid_port(p.get('port')):
+                            with self.state_lock: self.relay_ports[c] = (c.getpeername()[0], p['port'])
+                            self.rebuild_relay()
+                    elif p['type'] == 'RELAY_MISS':
+                        # 중계로 블록을 놓친 게스트는 트리에서 빼고 직접 보냄
+                        if METRICS.on: METRICS.count("relay_miss")
+                        with self.state_lock: self.relay_ports.pop(c, None)
+                        self.rebuild_relay()
+                    elif p['type'] == 'PROBE':
+                        self.send_packets(c, probe_packets(self.blockchain, p))
+                    elif p['type'] == 'CHAT':
+                        self.mine_and_broadcast(p['sender'], p['sender_id'], p['message'])
+                    elif p['type'] == 'FILE':
+                        self.mine_and_broadcast_file(p['sender'], p['sender_id'], p['filename'], p['content'])
+                except: METRICS.fail("packet")
+        except: METRICS.fail("client")
+        finally:
+            with self.state_lock:
+                if c in self.clients: self.clients.remove(c)
+                writer = self.writers.pop(c, None)
+                self.codecs.pop(c, None)
+                self.legacy_users.discard(c)
+                for relay_map in (self.relay_ports, self.relay_parent, self.relay_children, self.relayed): relay_map.pop(c, None)
+                left = user_id is not None and self.leave_user(user_id)
+            if left: self.users_changed()
+            if writer: writer.close()
+            c.close()
+            if client_name: self.mine_and_broadcast("System", 0, f"'{client_name}' left.")
+
+    def serve_file_channel(self, c, p):
+        if p['type'] == 'FILE_GET': return serve_file_download(c, p, self.file_store)
+        manifest_hash = serve_file_upload(c, c.makefile("rb"), p, self.file_store)
+        self.mine_and_broadcast(p['sender'], p['sender_id'], file_block_message(manifest_hash, p['manifest']['name']))
+
+    # --- 송신 / 방송 ---
+    def safe_send(self, sock, data, wait=False):
+        self.send_raw(sock, encode_packet(data), wait)
+
+    def send_raw(self, sock, data, wait=False):
+        """wait=False (방송): 큐에 넣기만 함. wait=True: 이 클라이언트의 스레드에서 보내는 빠지면 안 되는 응답"""
+        try:
+            writer = self.writers.get(sock) or self.writers.setdefault(sock, SocketWriter(sock))
+            if wait: writer.send_wait(data)
+            else: writer.send(data)
+        except: METRICS.fail("send")
+
+    def send_sync(self, c, have, locator=None):
+        with METRICS.span("sync"): self.send_packets(c, sync_packets(self.blockchain, have, self.room_key, locator))
+
+    def send_packets(self, c, packets):
+        codec = self.codecs.get(c) or WireCodec()
+        for packet in packets:
+            self.send_raw(c, codec.sync(packet), wait=True)
+
+    def broadcast(self, packet):
+        """패킷은 한 번만 직렬화하고 같은 bytes를 모든 클라이언트에 전달"""
+        self.broadcast_raw(encode_packet(packet))
+
+    def broadcast_raw(self, data):
+        with self.state_lock: clients = list(self.clients)
+        for c in clients: self.send_raw(c, data)
+
+    def publish_blocks(self, mined):
+        """시퀀서 스레드에서 호출. 한 묶음의 블록을 순서대로 한 번에 방송
+        (JSON 줄과 바이너리 프레임은 그 형식을 쓰는 클라이언트가 있을 때만 한 번씩 직렬화)"""
+        if self.on_block:
+            for block, _ in mined: self.on_block(block)
+        with self.state_lock: clients = self.direct_clients()
+        encoded = {}
+        for c, binary in clients:
+            if binary not in encoded:
+                encoded[binary] = b"".join((block_frame if binary else block_packet)(block, extra) for block, extra in mined)
+            self.send_raw(c, encoded[binary])
+        self.head = (mined[-1][0].index, mined[-1][0].hash)
+        if self.relay_fanout: self.schedule_head()
+
+    # --- 게스트 중계 트리 ---
+    def direct_clients(self):
+        """호스트가 블록을 직접 보낼 (소켓, 바이너리 여부) 목록. 중계로 받는 게스트는 유예 시간이 지나면 빠짐 (state_lock 안에서)"""
+        now = time.monotonic()
+        return [(c, self.codecs[c].binary) for c in self.clients if self.relayed.get(c, now) >= now]
+
+    def rebuild_relay(self):
+        """중계 포트를 알린 게스트들로 트리를 다시 만들고 자식이 바뀐 게스트에게만 RELAY_PEERS 전송"""
+        if not self.relay_fanout: return
+        now = time.monotonic()
+        with self.state_lock:
+            children_of = dict(relay_tree([c for c in self.clients if c in self.relay_ports], self.relay_fanout))
+            parent_of = {child: c for c, children in children_of.items() for child in children}
+            # 부모가 그대로면 유예 시간도 그대로, 새로 정해졌거나 바뀌었으면 다시 유예
+            self.relayed = {child: self.relayed[child] if child in self.relayed and self.relay_parent.get(child) is c
+                            else now + RELAY_GRACE for child, c in parent_of.items()}
+            self.relay_parent = parent_of
+            for c in self.clients:
+                children = [list(self.relay_ports[child]) for child in children_of.get(c, ())]
+                if children != self.relay_children.get(c, []):
+                    self.relay_children[c] = children
+                    self.safe_send(c, {"type": "RELAY_PEERS", "children": children})
+
+    def schedule_head(self):
+        with self.state_lock:
+            if self.head_timer or not self.running: return
+            self.head_pending = self.head
+            timer = self.head_timer = threading.Timer(RELAY_HEAD_SECONDS, self.publish_head)
+        timer.daemon = True
+        timer.start()
+
+    def publish_head(self):
+        """중계로 받는 게스트에게 RELAY_HEAD_SECONDS 전의 최신 블록을 알림 (그때까지 못 받았으면 게스트가 RELAY_MISS)"""
+        now = time.monotonic()
+        with self.state_lock:
+            self.head_timer = None
+            index, block_hash = head = self.head_pending
+            clients = [c for c, until in self.relayed.items() if until <= now]
+        data = encode_packet({"type": "HEAD", "index": index, "hash": block_hash})
+        for c in clients: self.send_raw(c, data)
+        if self.head != head: self.schedule_head()
+
+    def publish_users(self):
+        """쌓인 입장/퇴장을 PRESENCE 델타 하나로 방송 (구버전 클라이언트에게는 USER_LIST 전체). 중계 트리도 여기서 다시 만듦"""
+        self.rebuild_relay()
+        with self.state_lock:
+            self.presence_timer = None
+            delta = self.presence.flush()
+            names = self.presence.names()
+            clients = [(c, c in self.legacy_users) for c in self.clients]
+        if delta is None: return
+        self.send_presence(clients, delta, names)
+        if self.on_users: self.on_users(names)
+
+    def send_presence(self, clients, delta, names):
+        encoded = {}
+        for c, legacy in clients:
+            if legacy not in encoded: encoded[legacy] = encode_packet({"type": "USER_LIST", "users": names} if legacy else delta)
+            self.send_raw(c, encoded[legacy])
+
+    # --- 접속자 목록 (state_lock 안에서 호출) ---
+    def join_user(self, name):
+        """접속자 목록에 넣고 새 사용자 ID 반환"""
+        user_id = self.next_user_id
+        self.next_user_id += 1
+        self.presence.join(user_id, name)
+        return user_id
+
+    def leave_user(self, user_id):
+        return self.presence.leave(user_id)
+
+    def users_changed(self):
+        # PRESENCE_WINDOW 동안 생긴 입장/퇴장은 델타 하나로 (방송은 시퀀서 순서대로)
+        with self.state_lock:
+            if self.presence_timer or not self.running: return
+            timer = self.presence_timer = threading.Timer(PRESENCE_WINDOW, lambda: self.sequencer.post(self.publish_users))
+        timer.daemon = True
+        timer.start()
+
+    # --- 블록 생성 (아무 스레드에서나) ---
+    def mine_and_broadcast(self, sender, sender_id, msg):
+        # 블록 생성은 시퀀서 스레드만 (동시에 같은 index 블록을 만들어 메시지가 버려지는 일 방지)
+        self.sequencer.submit(sender, sender_id, msg)
+
+    def mine_and_broadcast_file(self, sender, sender_id, filename, encoded):
+        self.file_cache[filename] = encoded
+        extra = {"sender": sender, "sender_id": sender_id, "filename": filename, "content": encoded}
+        self.sequencer.submit(sender, sender_id, f"FILE_TRANSFER:{filename}", extra)
+
+# --- 멀티 프로세스 호스트 (워커 프로세스 N개 + 체인을 가진 시퀀서 프로세스 하나) ---
+class FanoutRing:
+    """시퀀서 프로세스 하나가 쓰고 워커 프로세스들이 각자 읽는 공유 메모리 바이트 링.
+    머리: [쓴 위치][쓰는 쪽 대기 중][워커별 읽은 위치...], 위치는 계속 늘어나는 바이트 수 (데이터 칸은 size 로 나눈 나머지).
+    위치는 cond 잠금 안에서만 읽고 쓰고, 가장 느린 워커가 아직 읽지 않은 칸은 덮어쓰지 않음 (쓰는 쪽이 기다림)"""
+    POS = struct.Struct("<Q")
+    RECORD = struct.Struct("<BII")  # 종류, JSON 줄 길이, 바이너리 프레임 길이
+
+    def __init__(self, readers, cond, size=FANOUT_RING_BYTES, name=None):
+        self.readers = readers
+        self.cond = cond
+        self.size = size
+        self.base = self.POS.size * (2 + readers)
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=self.base + size)
+            self.shm.buf[:self.base] = bytes(self.base)
+            return
+        # 지우는 것은 만든 쪽 (spawn 으로 띄운 워커는 부모의 resource tracker 를 같이 쓰므로 3.12 이하도 안전)
+        try: self.shm = shared_memory.SharedMemory(name=name, track=False)   # 3.13+
+        except TypeError: self.shm = shared_memory.SharedMemory(name=name)
+
+    def _pos(self, slot):
+        return self.POS.unpack_from(self.shm.buf, slot * self.POS.size)[0]
+
+    def _set(self, slot, value):
+        self.POS.pack_into(self.shm.buf, slot * self.POS.size, value)
+
+    def write(self, data, alive=None):
+        """data 를 이어 씀. 자리가 없으면 워커가 읽을 때까지 기다림 (alive(r) 가 False 인 워커는 기다리지 않음)"""
+        view = memoryview(data)
+        while view:
+            with self.cond:
+                head = self._pos(0)
+                tails = [self._pos(2 + r) for r in range(self.readers) if alive is None or alive(r)]
+                free = self.size - (head - min(tails, default=head))
+                if not free:
+                    self._set(1, 1)
+                    self.cond.wait(FANOUT_WAIT)
+                    self._set(1, 0)
+                    continue
+            n = min(free, len(view))
+            off = head % self.size
+            first = min(n, self.size - off)
+            self.shm.buf[self.base + off:self.base + off + first] = view[:first]
+            if n > first: self.shm.buf[self.base:self.base + n - first] = view[first:n]
+            with self.cond:
+                self._set(0, head + n)
+                self.cond.notify_all()
+            view = view[n:]
+
+    def read(self, slot, n, stop=None):
+        """slot 워커 위치에서 n 바이트 (올 때까지 기다림, stop() 이 참이면 EOFError)"""
+        out = bytearray()
+        while len(out) < n:
+            with self.cond:
+                tail = self._pos(2 + slot)
+                avail = self._pos(0) - tail
+                if not avail:
+                    if stop and stop(): raise EOFError("fanout ring closed")
+                    self.cond.wait(FANOUT_WAIT)
+                    continue
+            k = min(avail, n - len(out))
+            off = tail % self.size
+            first = min(k, self.size - off)
+            out += self.shm.buf[self.base + off:self.base + off + first]
+            if k > first: out += self.shm.buf[self.base:self.base + k - first]
+            with self.cond:
+                self._set(2 + slot, tail + k)
+                if self._pos(1): self.cond.notify_all()  # 자리를 기다리는 시퀀서
+        return out
+
+    def write_record(self, kind, json_data, bin_data, alive=None):
+        self.write(self.RECORD.pack(kind, len(json_data), len(bin_data)) + json_data + bin_data, alive)
+
+    def read_record(self, slot, stop=None):
+        kind, json_len, bin_len = self.RECORD.unpack(self.read(slot, self.RECORD.size, stop))
+        data = bytes(self.read(slot, json_len + bin_len, stop))
+        return kind, data[:json_len], data[json_len:]
+
+    def close(self, unlink=False):
+        try: self.shm.close()
+        except Exception: pass
+        if unlink:
+            try: self.shm.unlink()
+            except Exception: pass
+
+class SequencerLink:
+    """워커 -> 시퀀서 프로세스 파이프. 여러 스레드가 넣은 메시지를 모아서 한 번에 보냄 (pickle/시스템 콜 한 번).
+    워커 안에서 ChainSequencer 자리에 들어감 (submit / stop)"""
+    def __init__(self, conn):
+        self.conn = conn
+        self.queue = queue.SimpleQueue()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def submit(self, sender, sender_id, message, extra=None):
+        self.queue.put(("submit", sender, sender_id, message, extra))
+
+    def send(self, *item):
+        self.queue.put(item)
+
+    def stop(self, timeout=None):
+        # 남은 메시지(퇴장 등)를 시퀀서에 다 보낸 뒤 워커가 끝나도록
+        self.queue.put(None)
+        self.thread.join(timeout)
+
+    def run(self):
+        while True:
+            items = [self.queue.get()]
+            try:
+                while len(items) < SEQUENCER_BATCH: items.append(self.queue.get_nowait())
+            except queue.Empty: pass
+            done = None in items
+            items = [item for item in items if item is not None]
+            try:
+                if items: self.conn.send(items)
+            except (OSError, ValueError): return
+            if done: return
+
+class WorkerChatHost(ThreadedChatHost):
+    """ProcessChatHost 워커 프로세스 안의 엔진. 접속/파싱/동기화/방송 전송은 여기서 하고,
+    블록 생성과 접속자 목록은 시퀀서 프로세스에 맡김 (체인은 시퀀서가 쓰는 세그먼트 파일을 읽기 전용으로 따라감)"""
+    def __init__(self, slot, chain_path, room_key, link, ring, user_ids, file_root, relay=RELAY_FANOUT):
+        super().__init__(None, blockchain=Blockchain(SegmentStore(chain_path, read_only=True)), room_key=room_key,
+                         file_cache={}, file_store=FileStore(file_root), relay=relay)
+        self.slot = slot
+        self.sequencer = link
+        self.ring = ring
+        self.user_ids = user_ids    # 프로세스 공유 카운터 (multiprocessing.Value)
+
+    def run_in_thread(self):
+        self.running = True
+        threading.Thread(target=self.accept_clients, daemon=True).start()
+
+    def join_user(self, name):
+        with self.user_ids.get_lock():
+            user_id = self.user_ids.value
+            self.user_ids.value += 1
+        # 로컬 목록(링에서 받는 델타의 사본)에도 바로 넣어서 JOIN 스냅샷에 자기 자신이 보이게 (델타가 오면 같은 값으로 덮어씀)
+        self.presence.users[user_id] = name
+        self.sequencer.send("join", user_id, name)
+        return user_id
+
+    def leave_user(self, user_id):
+        self.presence.users.pop(user_id, None)
+        self.sequencer.send("leave", user_id)
+        return True
+
+    def users_changed(self):
+        pass    # 시퀀서 프로세스가 모아서 PRESENCE 델타를 링으로 방송
+
+    def mine_and_broadcast(self, sender, sender_id, msg):
+        # 잘못된 패킷은 시퀀서까지 보내지 않음
+        if valid_entry(sender, sender_id, msg): self.sequencer.submit(sender, sender_id, msg)
+
+    def mine_and_broadcast_file(self, sender, sender_id, filename, encoded):
+        if isinstance(filename, str) and isinstance(encoded, str):
+            extra = {"sender": sender, "sender_id": sender_id, "filename": filename, "content": encoded}
+            self.sequencer.submit(sender, sender_id, f"FILE_TRANSFER:{filename}", extra)
+
+    def fanout_loop(self, stop):
+        """링에서 시퀀서의 방송을 읽어 로컬 체인에 반영하고 이 워커의 클라이언트에게 전달 (STOP 까지)"""
+        frames = FrameReader(None)
+        while True:
+            kind, json_data, bin_data = self.ring.read_record(self.slot, stop)
+            if kind == FANOUT_STOP: return
+            if kind == FANOUT_USERS:
+                # json_data: PRESENCE 델타, bin_data: 구버전용 USER_LIST
+                with self.state_lock:
+                    self.presence.apply(json.loads(json_data))
+                    clients = [(c, c in self.legacy_users) for c in self.clients]
+                for c, legacy in clients: self.send_raw(c, bin_data if legacy else json_data)
+                self.rebuild_relay()    # 이 워커의 게스트끼리 중계 트리
+                continue
+            for p in frames.feed(bin_data):
+                self.blockchain.add_block(p['data'] if p['type'] == 'BLOCK' else p['block_data'])
+            with self.state_lock: clients = self.direct_clients()
+            for c, binary in clients: self.send_raw(c, bin_data if binary else json_data)
+            latest = self.blockchain.get_latest_block()
+            self.head = (latest.index, latest.hash)
+            if self.relay_fanout: self.schedule_head()
+
+def run_worker(slot, sock, address, chain_path, room_key, conn, ring_name, readers, cond, user_ids, file_root, relay=0, metrics=None):
+    """워커 프로세스 본체 (spawn 으로 띄우므로 모듈 최상위 함수). metrics: 부모가 계측 중이면 그 통계 파일 경로 ("" = 파일 없음)"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl+C 는 부모가 받아서 STOP 으로 정리
+    if metrics is not None: start_metrics(metrics and f"{metrics}.worker{slot}")
+    ring = FanoutRing(readers, cond, name=ring_name)
+    host = WorkerChatHost(slot, chain_path, room_key, SequencerLink(conn), ring, user_ids, file_root, relay)
+    if sock is None: host.open(*address, reuse_port=True)
+    else: host.socket = sock
+    host.run_in_thread()
+    host.sequencer.send("ready")
+    parent = multiprocessing.parent_process()
+    try: host.fanout_loop(lambda: not parent.is_alive())
+    except EOFError: pass
+    finally:
+        host.stop()
+        host.blockchain.close()
+        ring.close()
+        if METRICS.path: METRICS.dump(METRICS.path)
+
+class ProcessChatHost:
+    """워커 프로세스 N개가 접속/JSON 파싱/동기화/전송을 나눠 맡고, 이 프로세스는 체인을 가진 시퀀서만 돌리는 호스트 (GUI 없음).
+    워커 -> 시퀀서는 파이프(SequencerLink 묶음), 시퀀서 -> 워커는 공유 메모리 링(FanoutRing)으로
+    블록 묶음을 JSON 줄 / 바이너리 프레임으로 한 번씩만 직렬화해서 전달.
+    리눅스는 워커마다 SO_REUSEPORT 소켓 (커널이 접속을 나눔), 그 외는 부모가 연 소켓을 넘겨받아 함께 accept.
+    체인은 SegmentStore 여야 함 (워커가 같은 파일을 읽기 전용으로 따라감). ThreadedChatHost 와 같은 사용법"""
+    def __init__(self, nickname, blockchain=None, room_key=None, file_cache=None, file_store=None, on_block=None, on_users=None,
+                 workers=HOST_WORKERS, relay=RELAY_FANOUT):
+        self.blockchain = blockchain
+        self.room_key = room_key
+        self.file_root = os.path.dirname(file_store.chunk_dir) if file_store else FILE_STORE_DIR
+        self.on_block = on_block
+        self.on_users = on_users
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        self.relay_fanout = relay   # 중계 트리는 워커마다 그 워커의 게스트끼리
+        self.presence = Presence()
+        if nickname: self.presence.join(1, nickname)
+        self.presence_timer = None
+        self.state_lock = threading.Lock()
+        self.reuse_port = REUSE_PORT
+        self.socket = None
+        self.address = None
+        self.ring = None
+        self.processes = []
+        self.sequencer = None
+        self.running = False
+
+    # --- 실행 제어 ---
+    def open(self, host, port):
+        """포트만 열고 아직 접속은 받지 않음 (사용 중이면 OSError). reuse_port 면 자리만 잡고 listen 은 워커가"""
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if self.reuse_port: sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        try:
+            sock.bind((host, port))
+            if not self.reuse_port: sock.listen(128)
+        except OSError:
+            sock.close()
+            raise
+        self.socket = sock
+        self.address = (host, port)
+
+    def run_in_thread(self):
+        store = self.blockchain.chain
+        if not isinstance(store, SegmentStore): raise ValueError("ProcessChatHost needs a SegmentStore chain")
+        ctx = multiprocessing.get_context("spawn")
+        self.running = True
+        cond = ctx.Condition()
+        self.ring = FanoutRing(self.workers, cond)
+        user_ids = ctx.Value('q', 2)
+        self.sequencer = ChainSequencer(self.blockchain, self.publish_blocks).start()
+        conns = []
+        for slot in range(self.workers):
+            receiver, sender = ctx.Pipe(duplex=False)
+            proc = ctx.Process(target=run_worker, daemon=True, args=(
+                slot, None if self.reuse_port else self.socket, self.address, store.seg_path[:-len(".seg")], self.room_key,
+                sender, self.ring.shm.name, self.workers, cond, user_ids, self.file_root, self.relay_fanout,
+                (METRICS.path or "") if METRICS.on else None))
+            proc.start()
+            sender.close()
+            self.processes.append(proc)
+            conns.append(receiver)
+        # 모든 워커가 포트를 열 때까지 기다림 (접속 코드를 알리기 전에)
+        for conn in conns:
+            if not conn.poll(WORKER_START_TIMEOUT): raise OSError("host worker did not start")
+            for item in conn.recv(): self.dispatch(item)
+        threading.Thread(target=self.receive_loop, args=(conns,), daemon=True).start()
+        self.users_changed()    # 호스트 닉네임 (워커의 접속자 목록 사본은 비어서 시작)
+
+    def call(self, func, *args):
+        func(*args)
+
+    def stop(self):
+        if not self.running: return
+        self.running = False
+        # 워커가 클라이언트를 닫으며 보낸 퇴장 메시지까지 블록으로 만든 뒤 시퀀서를 멈춤
+        self.ring.write_record(FANOUT_STOP, b"", b"", self.alive)
+        for proc in self.processes:
+            proc.join(2)
+            if proc.is_alive(): proc.terminate()
+        self.sequencer.stop()
+        try: self.socket.close()
+        except Exception: pass
+        self.ring.close(unlink=True)
+
+    def alive(self, slot):
+        return self.processes[slot].is_alive()
+
+    # --- 워커 메시지 (수신 스레드) ---
+    def receive_loop(self, conns):
+        while conns:
+            for conn in multiprocessing.connection.wait(conns):
+                try: items = conn.recv()
+                except (EOFError, OSError):
+                    conns.remove(conn)
+                    continue
+                for item in items: self.dispatch(item)
+
+    def dispatch(self, item):
+        if item[0] == "submit":
+            self.sequencer.submit(*item[1:])
+            return
+        if item[0] == "ready": return
+        with self.state_lock:
+            if item[0] == "join": self.presence.join(item[1], item[2])
+            else: self.presence.leave(item[1])
+        self.users_changed()
+
+    def users_changed(self):
+        with self.state_lock:
+            if self.presence_timer or not self.running: return
+            timer = self.presence_timer = threading.Timer(PRESENCE_WINDOW, lambda: self.sequencer.post(self.publish_users))
+        timer.daemon = True
+        timer.start()
+
+    # --- 방송 (시퀀서 스레드) ---
+    def publish_blocks(self, mined):
+        if self.on_block:
+            for block, _ in mined: self.on_block(block)
+        json_data = b"".join(block_packet(block, extra) for block, extra in mined)
+        bin_data = b"".join(block_frame(block, extra) for block, extra in mined)
+        self.ring.write_record(FANOUT_BLOCKS, json_data, bin_data, self.alive)
+
+    def publish_users(self):
+        with self.state_lock:
+            self.presence_timer = None
+            delta = self.presence.flush()
+            names = self.presence.names()
+        if delta is None: return
+        self.ring.write_record(FANOUT_USERS, encode_packet(delta), encode_packet({"type": "USER_LIST", "users": names}), self.alive)
+        if self.on_users: self.on_users(names)
+
+# --- 게스트 중계 (호스트가 RELAY_PEERS 로 정해 준 트리를 따라 게스트끼리 블록 전달) ---
+# 호스트가 중계를 켰으면 WELCOME {relay: 1} -> 게스트가 중계 포트를 열고 RELAY_PORT {port} (꺼져 있으면 포트를 열지 않음)
+# 부모 게스트가 자식의 중계 포트로 접속 -> 자식: RELAY_CHALLENGE {nonce} -> 부모: RELAY_AUTH {sig: 방 키 HMAC}
+# 이후 부모 -> 자식 방향으로 BLOCK / FILE_RECV 바이너리 프레임만 흐름 (자식은 add_block 으로 검증하고 해시로 중복을 버림)
+class RelayChild:
+    """자식 게스트 하나로 가는 연결. 전용 스레드가 큐에서 꺼내 전송 (느린 자식이 부모의 수신을 막지 않음).
+    연결이 안 되거나 큐가 차면 버림 (자식은 HEAD 로 누락을 알고 호스트에게 다시 받음)"""
+    def __init__(self, addr, room_key):
+        self.addr = addr
+        self.room_key = room_key
+        self.queue = queue.Queue(OUTBOUND_QUEUE_LIMIT)
+        self.sock = None
+        self.retry_at = 0
+        self.closed = False
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def send(self, data):
+        try: self.queue.put_nowait(data)
+        except queue.Full: METRICS.fail("relay")
+
+    def close(self):
+        self.closed = True
+        try: self.queue.put_nowait(None)
+        except queue.Full: pass
+
+    def connect(self):
+        sock = socket.create_connection(self.addr, timeout=RELAY_CONNECT_TIMEOUT)
+        try:
+            challenge = read_header(sock.makefile("rb"))
+            if challenge['type'] != 'RELAY_CHALLENGE': raise ConnectionError("not a relay port")
+            sock.sendall(encode_packet({"type": "RELAY_AUTH", "sig": relay_signature(self.room_key, challenge['nonce'])}))
+            sock.settimeout(None)
+            return sock
+        except:
+            sock.close()
+            raise
+
+    def run(self):
+        while not self.closed:
+            batch = [self.queue.get()]
+            try:
+                while len(batch) < WRITE_BATCH_MAX: batch.append(self.queue.get_nowait())
+            except queue.Empty: pass
+            if None in batch or self.closed: break
+            if self.sock is None:
+                if time.monotonic() < self.retry_at: continue
+                try: self.sock = self.connect()
+                except (OSError, ValueError, KeyError, TypeError):
+                    METRICS.fail("relay")
+                    self.retry_at = time.monotonic() + RELAY_CONNECT_TIMEOUT
+                    continue
+            try: send_buffers(self.sock, batch)
+            except OSError:
+                METRICS.fail("relay")
+                self.sock.close()
+                self.sock = None
+        if self.sock: self.sock.close()
+
+class RelayNode:
+    """게스트 쪽 중계 노드: 중계 포트를 열어 부모의 연결을 받고 (on_packet 으로 넘김), 받은 블록을 자식들에게 전달"""
+    def __init__(self, room_key, on_packet, host="0.0.0.0"):
+        self.room_key = room_key
+        self.on_packet = on_packet
+        self.children = {}          # (ip, port) -> RelayChild
+        self.parents = set()        # 인증된 부모 연결의 FrameReader
+        self.seen_order = deque()
+        self.seen_set = set()
+        self.lock = threading.Lock()
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            self.socket.bind((host, 0))
+            self.socket.listen(8)
+        except OSError:
+            self.socket.close()
+            raise
+        self.port = self.socket.getsockname()[1]
+        self.running = True
+        threading.Thread(target=self.accept_loop, daemon=True).start()
+
+    def accept_loop(self):
+        while self.running:
+            try: c, _ = self.socket.accept()
+            except OSError: break
+            threading.Thread(target=self.serve_parent, args=(c,), daemon=True).start()
+
+    def serve_parent(self, c):
+        reader = FrameReader(c)
+        try:
+            nonce = secrets.token_hex(16)
+            c.sendall(encode_packet({"type": "RELAY_CHALLENGE", "nonce": nonce}))
+            frames = reader.frames()
+            auth = json.loads(next(frames))
+            if auth['type'] != 'RELAY_AUTH' or not hmac.compare_digest(str(auth['sig']), relay_signature(self.room_key, nonce)): return
+            self.parents.add(reader)
+            for frame in frames:
+                if not self.running: break
+                p = frame if isinstance(frame, dict) else json.loads(frame)
+                if p['type'] in ('BLOCK', 'FILE_RECV'): self.on_packet(p)
+        except (OSError, ValueError, KeyError, TypeError, StopIteration): METRICS.fail("relay")
+        finally:
+            self.parents.discard(reader)
+            c.close()
+
+    def receiving(self):
+        """부모에게서 프레임을 받는 중인지 (큰 FILE_RECV 가 오는 동안은 HEAD 로 누락을 판단하지 않음)"""
+        return any(reader.buffer for reader in list(self.parents))
 
-class Blockchain:
-    def __init__(self):
-        self.chain = [self.create_genesis_block()]
+    def seen(self, digest):
+        """이미 받은 블록이면 True, 아니면 기억하고 False"""
+        with self.lock:
+            if digest in self.seen_set: return True
+            self.seen_set.add(digest)
+            self.seen_order.append(digest)
+            if len(self.seen_order) > RELAY_SEEN: self.seen_set.discard(self.seen_order.popleft())
+            return False
 
-    def create_genesis_block(self):
-        return Block(0, "2024-01-01", "System", 0, "Genesis Block", "0")
+    def set_children(self, addrs):
+        wanted = {(ip, port) for ip, port in addrs}
+        with self.lock:
+            for addr in list(self.children):
+                if addr not in wanted: self.children.pop(addr).close()
+            for addr in wanted:
+                if addr not in self.children: self.children[addr] = RelayChild(addr, self.room_key)
 
-    def get_latest_block(self):
-        return self.chain[-1]
+    def forward(self, block, extra=None):
+        """검증을 통과한 블록을 자식들에게 (바이너리 프레임은 한 번만 만듦)"""
+        with self.lock: children = list(self.children.values())
+        if not children: return
+        data = block_frame(block, extra)
+        for child in children: child.send(data)
 
-    def add_block(self, new_block):
-        if new_block.previous_hash != self.get_latest_block().hash: return False
-        if new_block.calculate_hash() != new_block.hash: return False
-        self.chain.append(new_block)
-        return True
-      
-    def replace_chain(self, new_chain_data):
-        temp_chain = []
-        for b_data in new_chain_data:
-            block = Block(
-                b_data['index'], b_data['timestamp'],
-                b_data['sender'], b_data['sender_id'],
-                b_data['message'],
-                b_data['previous_hash']
-            )
-            block.hash = b_data['hash']
-            temp_chain.append(block)
-        self.chain = temp_chain
-        return True
+    def close(self):
+        self.running = False
+        try: self.socket.close()
+        except OSError: pass
+        with self.lock:
+            for child in self.children.values(): child.close()
+            self.children = {}
 
-# ----------------------------------------------------------
-# [3] GUI & Application
-# ----------------------------------------------------------
 def get_local_ip():
     try:
         s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
@@ -120,6 +2667,936 @@ def get_local_ip():
         return ip
     except: return "127.0.0.1"
 
+def load_room_key(path, default):
+    try:
+        with open(path) as f: return f.read().strip() or default
+    except OSError:
+        with open(path, "w") as f: f.write(default)
+        return default
+
+def open_room(engine, port, scan=True):
+    """호스트 엔진으로 포트를 열고 방 체인/키를 연결한 뒤 실제 포트 반환.
+    scan이면 사용 중인 포트는 건너뜀. 같은 포트로 다시 열면 디스크의 체인과 방 키를 그대로 이어서 사용"""
+    while True:
+        try:
+            engine.open('0.0.0.0', port)
+            break
+        except OSError:
+            if not scan: raise
+            port += 1
+    if not os.path.exists(CHAIN_DIR): os.makedirs(CHAIN_DIR)
+    room_path = os.path.join(CHAIN_DIR, f"room_{port}")
+    engine.room_key = load_room_key(room_path + ".key", secrets.token_hex(4))
+    engine.blockchain = Blockchain(SegmentStore(room_path), index_path=room_path + ".search")
+    return port
+
+# --- 한 포트에서 여러 방 ---
+ROOM_IDLE_SECONDS = 300            # 접속이 없는 방을 메모리에서 내리기까지 시간
+ROOM_SWEEP_SECONDS = 30            # 유휴 방 확인 주기
+ROOM_ID_PATTERN = re.compile(r"[A-Za-z0-9_-]{1,32}\Z")
+DEFAULT_ROOM = ""                  # room 없이 JOIN 한 클라이언트 (구버전 / 기존 단일 방 체인)
+
+class RoomSlot:
+    """레지스트리의 방 하나. engine 이 None 이면 디스크에만 있는 방 (메모리에는 키와 이름만)"""
+    __slots__ = ("room_id", "key", "engine", "active", "last_used")
+
+    def __init__(self, room_id, key):
+        self.room_id = room_id
+        self.key = key
+        self.engine = None
+        self.active = 0             # 이 방을 쓰고 있는 연결 수
+        self.last_used = time.monotonic()
+
+class RoomHost:
+    """포트 하나로 여러 방을 호스팅 (GUI 없음). 첫 줄(JOIN / FILE_PUT / FILE_GET)의 room 으로 방 엔진에 연결을 넘김.
+    방마다 체인/시퀀서/접속자는 따로, 수신 스레드(ThreadedChatHost)나 이벤트 루프(AsyncChatHost)는 공유.
+    접속이 없는 방은 idle 초 뒤 체인을 닫고 엔진을 버림 (디스크에 남고 다음 접속 때 다시 엶)"""
+    def __init__(self, engine=ThreadedChatHost, file_store=None, on_block=None, idle=ROOM_IDLE_SECONDS, relay=RELAY_FANOUT):
+        self.engine = engine
+        self.is_async = engine is AsyncChatHost
+        self.file_store = file_store
+        self.on_block = on_block    # on_block(room_id, block)
+        self.idle = idle
+        self.relay = relay          # 방 엔진의 게스트 중계 (RELAY_FANOUT)
+        self.rooms = {}             # room_id -> RoomSlot
+        self.lock = threading.Lock()
+        self.port = None
+        self.socket = None
+        self.loop = None
+        self.server = None
+        self.running = False
+
+    # --- 방 목록 ---
+    def room_path(self, room_id):
+        return os.path.join(CHAIN_DIR, f"room_{self.port}" + (f"_{room_id}" if room_id else ""))
+
+    def add_room(self, room_id):
+        """방을 레지스트리에 등록 (키 파일이 없으면 새로 만듦). 체인은 처음 접속할 때 엶"""
+        if room_id and not ROOM_ID_PATTERN.match(room_id): raise ValueError(f"bad room id: {room_id!r}")
+        with self.lock:
+            slot = self.rooms.get(room_id)
+            if slot is None:
+                slot = self.rooms[room_id] = RoomSlot(room_id, load_room_key(self.room_path(room_id) + ".key", secrets.token_hex(4)))
+            return slot
+
+    def access_code(self, room_id=DEFAULT_ROOM):
+        code = f"{get_local_ip()}:{self.port}:{self.rooms[room_id].key}"
+        return f"{code}:{room_id}" if room_id else code
+
+    def loaded_rooms(self):
+        with self.lock: return [slot.room_id for slot in self.rooms.values() if slot.engine]
+
+    # --- 실행 제어 ---
+    def open(self, host, port):
+        """포트를 열고 디스크에 있는 방(room_<port>_<id>.key)을 등록 (사용 중이면 OSError)"""
+        if self.is_async:
+            self.loop = asyncio.new_event_loop()
+            try:
+                self.server = self.loop.run_until_complete(asyncio.start_server(
+                    self.handle_async, host, port, limit=MAX_FRAME_BYTES, reuse_address=True, backlog=1024))
+            except OSError:
+                self.loop.close()
+                raise
+        else:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            try:
+                sock.bind((host, port))
+                sock.listen(128)
+            except OSError:
+                sock.close()
+                raise
+            self.socket = sock
+        self.port = port
+        if not os.path.exists(CHAIN_DIR): os.makedirs(CHAIN_DIR)
+        prefix = f"room_{port}"
+        for name in os.listdir(CHAIN_DIR):
+            rest = name[len(prefix):-len(".key")]
+            if name.startswith(prefix) and name.endswith(".key") and rest.startswith("_") and ROOM_ID_PATTERN.match(rest[1:]):
+                self.add_room(rest[1:])
+        self.add_room(DEFAULT_ROOM)
+
+    def run_in_thread(self):
+        self.running = True
+        if self.is_async: threading.Thread(target=self.loop.run_forever, daemon=True).start()
+        else: threading.Thread(target=self.accept_clients, daemon=True).start()
+        threading.Thread(target=self.sweep_loop, daemon=True).start()
+
+    def call(self, func, *args):
+        if self.is_async: self.loop.call_soon_threadsafe(func, *args)
+        else: func(*args)
+
+    def stop(self):
+        self.running = False
+        if self.is_async:
+            if self.loop is None or self.loop.is_closed(): return
+            try: asyncio.run_coroutine_threadsafe(self.shutdown(), self.loop).result(timeout=5)
+            except Exception: pass
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            return
+        try: self.socket.close()
+        except Exception: pass
+        with self.lock: slots = [slot for slot in self.rooms.values() if slot.engine]
+        for slot in slots:
+            engine, slot.engine = slot.engine, None
+            engine.stop()
+            engine.blockchain.close()
+
+    async def shutdown(self):
+        self.server.close()
+        slots = [slot for slot in self.rooms.values() if slot.engine]
+        for slot in slots: await slot.engine.shutdown()
+        for _ in range(100):    # 닫힌 연결의 핸들러가 퇴장 메시지를 남기고 release 할 때까지
+            if not any(slot.active for slot in slots): break
+            await asyncio.sleep(0.01)
+        for slot in slots:
+            engine, slot.engine = slot.engine, None
+            self.unload(engine)
+
+    # --- 방 엔진 열기/닫기 ---
+    def acquire(self, room_id):
+        """방 엔진을 (필요하면 디스크에서 열어) 돌려주고 사용 중으로 표시. 없는 방이면 None"""
+        with self.lock:
+            slot = self.rooms.get(room_id)
+            if slot is None or not self.running: return None
+            if slot.engine is None: slot.engine = self.load(slot)
+            slot.active += 1
+            return slot
+
+    def release(self, slot):
+        with self.lock:
+            slot.active -= 1
+            slot.last_used = time.monotonic()
+
+    def load(self, slot):
+        on_block = (lambda b, room_id=slot.room_id: self.on_block(room_id, b)) if self.on_block else None
+        engine = self.engine(None, room_key=slot.key, file_store=self.file_store, on_block=on_block, relay=self.relay)
+        path = self.room_path(slot.room_id)
+        engine.blockchain = Blockchain(SegmentStore(path), index_path=path + ".search")
+        if self.is_async: engine.loop = self.loop
+        else: engine.run_in_thread()    # 시퀀서만
+        return engine
+
+    def unload(self, engine):
+        if self.is_async: engine.flush_batch()
+        else:
+            engine.stop()               # 시퀀서에 남은 메시지까지 블록으로 만든 뒤 멈춤 (끝날 때까지 기다림)
+            if engine.sequencer.thread.is_alive(): return   # 아직 쓰는 중이면 체인을 닫지 않음
+        engine.blockchain.close()
+
+    def sweep(self):
+        """연결이 없고 idle 초 동안 쓰이지 않은 방의 엔진을 닫음.
+        잠금을 쥔 채로 닫아서, 그 사이 들어온 접속이 같은 세그먼트 파일을 다시 열지 않게 함"""
+        now = time.monotonic()
+        with self.lock:
+            for slot in self.rooms.values():
+                if slot.engine and not slot.active and now - slot.last_used >= self.idle:
+                    engine, slot.engine = slot.engine, None
+                    self.unload(engine)
+
+    def sweep_loop(self):
+        while self.running:
+            time.sleep(min(ROOM_SWEEP_SECONDS, self.idle))
+            if self.running: self.call(self.sweep)
+
+    # --- 연결 배정 ---
+    def reject(self, sock_or_writer):
+        data = encode_packet({"type": "ERROR", "reason": "unknown room"})
+        try:
+            if self.is_async: sock_or_writer.write(data)
+            else: sock_or_writer.sendall(data)
+        except OSError: pass
+        sock_or_writer.close()
+
+    def accept_clients(self):
+        while self.running:
+            try:
+                c, a = self.socket.accept()
+                threading.Thread(target=self.route_client, args=(c,), daemon=True).start()
+            except: break
+
+    def route_client(self, c):
+        frames = FrameReader(c).frames()
+        try:
+            first = next(frames)
+            room_id = json.loads(first).get('room', DEFAULT_ROOM)
+        except Exception:
+            c.close()
+            return
+        slot = self.acquire(room_id) if isinstance(room_id, str) else None
+        if slot is None: return self.reject(c)
+        try: slot.engine.handle_client(c, itertools.chain([first], frames))
+        finally: self.release(slot)
+
+    async def handle_async(self, reader, writer):
+        try: first = json.loads(await reader.readline() or b"null")
+        except (ConnectionError, OSError, ValueError): first = None
+        room_id = first.get('room', DEFAULT_ROOM) if isinstance(first, dict) else None
+        slot = self.acquire(room_id) if isinstance(room_id, str) else None
+        if slot is None: return self.reject(writer)
+        try: await slot.engine.handle_client(reader, writer, first)
+        finally: self.release(slot)
+
+# ----------------------------------------------------------
+# [4] 파일 전송 (채팅과 분리된 연결, 청크 단위로 디스크에서 디스크로)
+# ----------------------------------------------------------
+# 파일 연결은 같은 포트로 새로 접속해서 첫 줄로 FILE_PUT / FILE_GET 을 보냄
+#   FILE_PUT {manifest, sender, sender_id} -> FILE_NEED {chunks: [없는 청크 번호]}
+#            -> (CHUNK {hash, size} 줄 + 원본 바이트) x N -> FILE_DONE {manifest_hash}
+#   FILE_GET {manifest_hash} -> MANIFEST {manifest} -> (CHUNK 줄 + 원본 바이트) x N
+# 체인 블록에는 파일 내용 대신 "FILE_MANIFEST:<manifest 해시>:<파일명>" 만 기록
+FILE_CHUNK_SIZE = 1024 * 1024
+FILE_MAX_CHUNKS = 65536            # 파일 하나의 최대 청크 수 (= 64GB). MANIFEST 줄 크기가 여기에 비례
+FILE_NAME_MAX = 255                # manifest 의 파일명 최대 길이
+FILE_STORE_DIR = os.path.join("downloads", "store")
+FILE_MANIFEST_PREFIX = "FILE_MANIFEST:"
+
+def file_block_info(message):
+    """파일 블록 메시지 -> (파일명, manifest 해시). 예전 형식은 해시 없음"""
+    if message.startswith(FILE_MANIFEST_PREFIX):
+        manifest_hash, _, filename = message[len(FILE_MANIFEST_PREFIX):].partition(":")
+        return filename, manifest_hash
+    return message.replace("FILE_TRANSFER:", "").replace("📎 파일 전송: ", ""), None
+FILE_CHANNEL_TYPES = ("FILE_PUT", "FILE_GET")
+FILE_HEADER_MAX = 64 * 1024        # 파일 연결의 JSON 줄 최대 크기 (manifest 포함)
+MANIFEST_MAX = FILE_HEADER_MAX + 68 * FILE_MAX_CHUNKS   # MANIFEST 줄 / manifest 파일 최대 크기 (청크 해시 하나에 '"hex", ' 68바이트)
+COPY_BUFFER = 64 * 1024
+FILE_CACHE_BUDGET = 64 * 1024 * 1024   # 레거시 파일 캐시가 메모리에 두는 최대 바이트 (넘으면 디스크로)
+
+def file_block_message(manifest_hash, filename):
+    return f"{FILE_MANIFEST_PREFIX}{manifest_hash}:{filename}"
+
+def manifest_bytes(manifest):
+    return json.dumps(manifest, sort_keys=True, separators=(",", ":")).encode('utf-8')
+
+def manifest_hash_of(manifest):
+    return hashlib.sha256(manifest_bytes(manifest)).hexdigest()
+
+HEX_DIGEST = re.compile(r"[0-9a-f]{64}")
+
+def is_digest(h):
+    """SHA-256 hex 문자열(소문자 64자)인지. 네트워크에서 받은 해시로 파일 경로를 만들기 전에 확인"""
+    return isinstance(h, str) and HEX_DIGEST.fullmatch(h) is not None
+
+def check_manifest(manifest):
+    """받은 manifest 형식 확인 (청크 해시는 64자리 hex, 크기는 청크 수와 맞아야 함)"""
+    chunks = manifest['chunks']
+    if not isinstance(manifest['name'], str) or not isinstance(manifest['size'], int): raise ValueError("bad manifest")
+    if len(manifest['name']) > FILE_NAME_MAX: raise ValueError("file name too long")
+    if manifest['chunk_size'] != FILE_CHUNK_SIZE: raise ValueError("unsupported chunk size")
+    if len(chunks) > FILE_MAX_CHUNKS: raise ValueError("file too large")   # 받아도 MANIFEST 로 내려줄 수 없음
+    if len(chunks) != -(-manifest['size'] // FILE_CHUNK_SIZE): raise ValueError("chunk count mismatch")
+    if not all(is_digest(h) for h in chunks): raise ValueError("bad chunk hash")
+    return manifest
+
+def check_file(path, name):
+    """보내기 전에 확인: 호스트가 받지 않거나 MANIFEST 로 내려줄 수 없는 파일은 거절"""
+    if os.path.getsize(path) > FILE_MAX_CHUNKS * FILE_CHUNK_SIZE: raise ValueError("file too large")
+    if len(name) > FILE_NAME_MAX: raise ValueError("file name too long")
+
+def scan_file(path, name):
+    """로컬 파일을 청크 단위로 읽으며 해시만 계산해 manifest 생성 (내용은 메모리에 남기지 않음)"""
+    chunks = []
+    size = 0
+    with open(path, "rb") as f:
+        while True:
+            data = f.read(FILE_CHUNK_SIZE)
+            if not data: break
+            chunks.append(hashlib.sha256(data).hexdigest())
+            size += len(data)
+    return {"name": name, "size": size, "chunk_size": FILE_CHUNK_SIZE, "chunks": chunks}
+
+def copy_verified(read, size, out, expected_hash):
+    """read(n)으로 size 바이트를 받아 out에 쓰면서 SHA-256 확인"""
+    digest = hashlib.sha256()
+    remaining = size
+    while remaining:
+        data = read(min(remaining, COPY_BUFFER))
+        if not data: raise ConnectionError("stream ended mid chunk")
+        digest.update(data)
+        out.write(data)
+        remaining -= len(data)
+    return digest.hexdigest() == expected_hash
+
+def read_header(stream, limit=FILE_HEADER_MAX):
+    line = stream.readline(limit)
+    if not line.endswith(b"\n"): raise ConnectionError("file channel closed")
+    return json.loads(line)
+
+async def read_header_async(reader):
+    """read_header 의 asyncio 판. 스트림 한도(MAX_FRAME_BYTES)가 아니라 FILE_HEADER_MAX 까지만 모음
+    (헤더는 짧고 뒤따르는 청크 바이트를 남겨야 해서 한 바이트씩 읽음)"""
+    line = bytearray()
+    while not line.endswith(b"\n"):
+        if len(line) >= FILE_HEADER_MAX: raise ConnectionError("file header too long")
+        byte = await reader.read(1)
+        if not byte: raise ConnectionError("file channel closed")
+        line += byte
+    return json.loads(line)
+
+class FileStore:
+    """내용 주소(content-addressed) 파일 저장소
+    chunks/<sha256>    : 최대 FILE_CHUNK_SIZE 바이트 청크 (같은 내용은 한 번만 저장)
+    manifests/<sha256> : {"name", "size", "chunk_size", "chunks"} JSON, 이 내용의 해시가 파일 이름"""
+    def __init__(self, root=FILE_STORE_DIR):
+        self.chunk_dir = os.path.join(root, "chunks")
+        self.manifest_dir = os.path.join(root, "manifests")
+        os.makedirs(self.chunk_dir, exist_ok=True)
+        os.makedirs(self.manifest_dir, exist_ok=True)
+
+    def chunk_path(self, chunk_hash):
+        return os.path.join(self.chunk_dir, chunk_hash)
+
+    def has_chunk(self, chunk_hash):
+        return os.path.exists(self.chunk_path(chunk_hash))
+
+    def missing(self, manifest):
+        return [i for i, h in enumerate(manifest['chunks']) if not self.has_chunk(h)]
+
+    def _commit(self, chunk_hash, write):
+        """임시 파일에 쓰고 검증되면 제자리로 이동 (중간에 끊겨도 깨진 청크가 남지 않음)"""
+        tmp = f"{self.chunk_path(chunk_hash)}.{os.getpid()}.{threading.get_ident()}.tmp"  # 워커 프로세스끼리도 겹치지 않게
+        try:
+            with open(tmp, "wb") as f: ok = write(f)
+            if ok: os.replace(tmp, self.chunk_path(chunk_hash))
+            return ok
+        finally:
+            if os.path.exists(tmp): os.remove(tmp)
+
+    def write_chunk(self, chunk_hash, read, size):
+        return self._commit(chunk_hash, lambda f: copy_verified(read, size, f, chunk_hash))
+
+    def put_chunk(self, chunk_hash, data):
+        if hashlib.sha256(data).hexdigest() != chunk_hash: return False
+        return self._commit(chunk_hash, lambda f: f.write(data) >= 0)
+
+    def save_manifest(self, manifest):
+        manifest_hash = manifest_hash_of(manifest)
+        path = os.path.join(self.manifest_dir, manifest_hash)
+        if not os.path.exists(path):
+            with open(path + ".tmp", "wb") as f: f.write(manifest_bytes(manifest))
+            os.replace(path + ".tmp", path)
+        return manifest_hash
+
+    def load_manifest(self, manifest_hash):
+        if not is_digest(manifest_hash): return None   # 경로를 벗어나는 이름 (../ 등) 차단
+        try:
+            with open(os.path.join(self.manifest_dir, manifest_hash), "rb") as f: data = f.read(MANIFEST_MAX + 1)
+        except (OSError, ValueError): return None
+        if len(data) > MANIFEST_MAX or hashlib.sha256(data).hexdigest() != manifest_hash: return None
+        return json.loads(data)
+
+    def import_chunks(self, pieces, name):
+        """FILE_CHUNK_SIZE 단위 조각들을 저장하고 manifest 해시 반환"""
+        chunks = []
+        size = 0
+        for data in pieces:
+            chunk_hash = hashlib.sha256(data).hexdigest()
+            if not self.has_chunk(chunk_hash): self.put_chunk(chunk_hash, data)
+            chunks.append(chunk_hash)
+            size += len(data)
+        return self.save_manifest({"name": name, "size": size, "chunk_size": FILE_CHUNK_SIZE, "chunks": chunks})
+
+    def import_file(self, path, name):
+        """로컬 파일을 청크로 나눠 저장 (메모리는 청크 하나만 사용)"""
+        check_file(path, name)
+        with open(path, "rb") as f:
+            return self.import_chunks(iter(lambda: f.read(FILE_CHUNK_SIZE), b""), name)
+
+    def import_bytes(self, data, name):
+        view = memoryview(data)
+        return self.import_chunks((view[i:i + FILE_CHUNK_SIZE] for i in range(0, len(data), FILE_CHUNK_SIZE)), name)
+
+    def read_bytes(self, manifest_hash):
+        manifest = self.load_manifest(manifest_hash)
+        if manifest is None: raise FileNotFoundError(manifest_hash)
+        parts = []
+        for chunk_hash in manifest['chunks']:
+            with open(self.chunk_path(chunk_hash), "rb") as f: parts.append(f.read())
+        return b"".join(parts)
+
+    def export(self, manifest_hash, dest):
+        manifest = self.load_manifest(manifest_hash)
+        if manifest is None: raise FileNotFoundError(manifest_hash)
+        with open(dest + ".part", "wb") as out:
+            for chunk_hash in manifest['chunks']:
+                with open(self.chunk_path(chunk_hash), "rb") as f: shutil.copyfileobj(f, out, COPY_BUFFER)
+        os.replace(dest + ".part", dest)
+
+class FileCache:
+    """레거시 FILE / FILE_RECV 로 받은 파일 캐시. 기존 dict처럼 cache[이름] = base64 문자열로 사용
+    내용은 디코딩한 원본으로 보관하고 같은 내용은 이름이 달라도 한 번만 둠.
+    메모리 예산을 넘으면 오래 안 쓴 것부터 FileStore(디스크)로 내보내고, 요청 시 다시 읽어 옴"""
+    def __init__(self, store=None, budget=FILE_CACHE_BUDGET):
+        self.store = store
+        self.budget = budget
+        self.names = {}              # 파일명 -> 내용 해시
+        self.memory = OrderedDict()  # 내용 해시 -> 원본 bytes (앞쪽이 가장 오래 안 쓴 것)
+        self.used = 0
+        self.on_disk = {}            # 내용 해시 -> manifest 해시
+        self.lock = threading.Lock()
+
+    def __contains__(self, name):
+        return name in self.names
+
+    def __setitem__(self, name, encoded):
+        self.put(name, base64.b64decode(encoded))
+
+    def put(self, name, data):
+        """원본 바이트로 저장 (바이너리 FILE_RECV 프레임)"""
+        content_hash = hashlib.sha256(data).hexdigest()
+        with self.lock:
+            self.names[name] = content_hash
+            if content_hash in self.memory: self.memory.move_to_end(content_hash)
+            elif content_hash not in self.on_disk: self._keep(content_hash, data, name)
+
+    def __getitem__(self, name):
+        return base64.b64encode(self.read(name)).decode('utf-8')
+
+    def _keep(self, content_hash, data, name):
+        self.memory[content_hash] = data
+        self.used += len(data)
+        while self.used > self.budget and self.memory:
+            old_hash, old_data = self.memory.popitem(last=False)
+            self.used -= len(old_data)
+            if old_hash not in self.on_disk:
+                if self.store is None: self.store = FileStore()
+                self.on_disk[old_hash] = self.store.import_bytes(old_data, name if old_hash == content_hash else old_hash)
+
+    def read(self, name):
+        content_hash = self.names[name]
+        with self.lock:
+            if content_hash in self.memory:
+                self.memory.move_to_end(content_hash)
+                return self.memory[content_hash]
+            data = self.store.read_bytes(self.on_disk[content_hash])
+            self._keep(content_hash, data, name)
+            return data
+
+    def save(self, name, path):
+        """디스크로 내보낸 파일은 메모리로 올리지 않고 저장소에서 바로 복사"""
+        content_hash = self.names[name]
+        with self.lock:
+            data = self.memory.get(content_hash)
+            if data is not None: self.memory.move_to_end(content_hash)
+        if data is None: return self.store.export(self.on_disk[content_hash], path)
+        with open(path, "wb") as f: f.write(data)
+
+# --- 호스트 쪽 (스레드 방식) ---
+def serve_file_upload(sock, stream, p, store):
+    """FILE_PUT 처리. 없는 청크만 받아 저장소에 쓰고 manifest 해시 반환 (실패 시 None)"""
+    manifest = check_manifest(p['manifest'])
+    need = store.missing(manifest)
+    sock.sendall(encode_packet({"type": "FILE_NEED", "chunks": need}))
+    expected = {manifest['chunks'][i] for i in need}
+    for _ in need:
+        header = read_header(stream)
+        if header['hash'] not in expected or not 0 < header['size'] <= FILE_CHUNK_SIZE: raise ValueError("unexpected chunk")
+        if not store.write_chunk(header['hash'], stream.read, header['size']): raise ValueError("chunk hash mismatch")
+    if store.missing(manifest): raise ValueError("upload incomplete")
+    manifest_hash = store.save_manifest(manifest)
+    sock.sendall(encode_packet({"type": "FILE_DONE", "manifest_hash": manifest_hash}))
+    return manifest_hash
+
+def serve_file_download(sock, p, store):
+    """FILE_GET 처리. manifest 뒤에 청크를 디스크에서 바로 전송 (sendfile)"""
+    manifest = store.load_manifest(p['manifest_hash'])
+    if manifest is None:
+        sock.sendall(encode_packet({"type": "FILE_ERROR", "reason": "not found"}))
+        return
+    sock.sendall(encode_packet({"type": "MANIFEST", "manifest": manifest}))
+    for chunk_hash in manifest['chunks']:
+        path = store.chunk_path(chunk_hash)
+        sock.sendall(encode_packet({"type": "CHUNK", "hash": chunk_hash, "size": os.path.getsize(path)}))
+        with open(path, "rb") as f: sock.sendfile(f)
+
+# --- 게스트 쪽 (백그라운드 스레드에서 호출) ---
+def upload_file(addr, path, name, sender, sender_id, room=None):
+    """파일을 별도 연결로 호스트에 업로드. 호스트가 이미 가진 청크는 보내지 않음"""
+    check_file(path, name)
+    manifest = scan_file(path, name)
+    with socket.create_connection(addr) as sock, open(path, "rb") as f:
+        stream = sock.makefile("rb")
+        header = {"type": "FILE_PUT", "manifest": manifest, "sender": sender, "sender_id": sender_id}
+        if room: header["room"] = room
+        sock.sendall(encode_packet(header))
+        reply = read_header(stream)
+        if reply['type'] != 'FILE_NEED': raise ConnectionError(reply.get('reason', 'upload rejected'))
+        for i in reply['chunks']:
+            f.seek(i * FILE_CHUNK_SIZE)
+            size = min(FILE_CHUNK_SIZE, manifest['size'] - i * FILE_CHUNK_SIZE)
+            sock.sendall(encode_packet({"type": "CHUNK", "hash": manifest['chunks'][i], "size": size}))
+            sock.sendfile(f, i * FILE_CHUNK_SIZE, size)
+        reply = read_header(stream)
+        if reply['type'] != 'FILE_DONE': raise ConnectionError(reply.get('reason', 'upload failed'))
+        return reply['manifest_hash']
+
+def download_file(addr, manifest_hash, dest, room=None):
+    """manifest 해시로 파일을 받아 dest에 저장. 청크마다 해시를 확인하며 디스크로 바로 씀"""
+    with socket.create_connection(addr) as sock:
+        stream = sock.makefile("rb")
+        header = {"type": "FILE_GET", "manifest_hash": manifest_hash}
+        if room: header["room"] = room
+        sock.sendall(encode_packet(header))
+        reply = read_header(stream, MANIFEST_MAX)
+        if reply['type'] != 'MANIFEST': raise FileNotFoundError(reply.get('reason', manifest_hash))
+        manifest = reply['manifest']
+        if manifest_hash_of(manifest) != manifest_hash: raise ValueError("manifest hash mismatch")
+        with open(dest + ".part", "wb") as out:
+            for chunk_hash in manifest['chunks']:
+                header = read_header(stream)
+                if header['hash'] != chunk_hash or not copy_verified(stream.read, header['size'], out, chunk_hash):
+                    raise ValueError("chunk hash mismatch")
+        os.replace(dest + ".part", dest)
+
+# ----------------------------------------------------------
+# [5] GUI & Application
+# ----------------------------------------------------------
+class ChatView:
+    """채팅 목록 (tk.Canvas 가상화). 블록마다 위젯을 만들지 않고 화면(+위아래 여유분)에 보이는
+    줄만 재사용 슬롯으로 그림. 내용은 Blockchain.chain에서 그때그때 읽어 오므로 기록이 길어져도 비용은 창 높이만큼"""
+    def __init__(self, parent, app):
+        self.app = app
+        self.frame = tk.Frame(parent, bg=THEME["chat_bg"])
+        self.canvas = tk.Canvas(self.frame, bg=THEME["chat_bg"], highlightthickness=0, bd=0)
+        self.scrollbar = tk.Scrollbar(self.frame, orient="vertical", command=self.on_scrollbar)
+        self.scrollbar.pack(side="right", fill="y")
+        self.canvas.pack(side="left", fill="both", expand=True)
+        self.slots = []
+        self.note_rows = []     # 블록이 아닌 안내 문구가 들어갈 행 번호 (오름차순)
+        self.notes = []
+        self.top = 0            # follow가 아닐 때 화면 맨 위 행
+        self.top_offset = 0     # 맨 위 행이 화면 위로 가려진 픽셀
+        self.follow = True      # 맨 아래(최신 메시지)에 붙어 있는지
+        self.marked = None      # 검색으로 이동한 블록 index (테두리 표시)
+        self.layout = []        # 마지막으로 그린 (행, y, 높이)
+        self.pending = False
+        self.used = 0
+        self.render_ms = 0.0
+        self.canvas.bind("<Configure>", lambda e: self.refresh())
+        self.canvas.bind("<MouseWheel>", self.on_wheel)
+        self.canvas.bind("<Button-4>", lambda e: self.scroll_pixels(-WHEEL_STEP))
+        self.canvas.bind("<Button-5>", lambda e: self.scroll_pixels(WHEEL_STEP))
+
+    def pack(self, **kw):
+        self.frame.pack(**kw)
+
+    # --- 데이터 (chain + 안내 문구) ---
+    def first_pos(self, chain):
+        # 제네시스는 숨기고, 체크포인트부터 시작한 체인은 첫 블록도 보여 줌
+        return 1 if len(chain) and chain[0].index == 0 else 0
+
+    def row_count(self):
+        chain = self.app.my_blockchain.chain
+        return max(len(chain) - self.first_pos(chain), 0) + len(self.notes)
+
+    def row_item(self, row):
+        j = bisect_left(self.note_rows, row)
+        if j < len(self.note_rows) and self.note_rows[j] == row: return self.notes[j]
+        chain = self.app.my_blockchain.chain
+        return chain[self.first_pos(chain) + row - j]
+
+    def note(self, message):
+        self.note_rows.append(self.row_count())
+        self.notes.append(message)
+        self.refresh()
+
+    def clear(self):
+        self.note_rows, self.notes = [], []
+        self.follow = True
+        self.refresh()
+
+    def scroll_to_end(self):
+        self.follow = True
+        self.refresh()
+
+    def jump_to_block(self, index):
+        """블록 index가 있는 행을 화면 맨 위로 (안내 문구 행은 건너서 계산)"""
+        chain = self.app.my_blockchain.chain
+        k = index - chain[0].index - self.first_pos(chain)
+        if k < 0: return
+        row = k
+        while True:
+            r = k + bisect_right(self.note_rows, row)
+            if r == row: break
+            row = r
+        self.top, self.top_offset, self.follow = row, 0, False
+        self.marked = index
+        self.pending = True
+        self.render()
+
+    # --- 그리기 ---
+    def refresh(self):
+        """여러 번 불러도 다음 idle에 한 번만 다시 그림"""
+        if not self.pending:
+            self.pending = True
+            self.canvas.after_idle(self.render)
+
+    def slot(self, i):
+        if i < len(self.slots): return self.slots[i]
+        s = {"tag": f"slot{i}", "bubbles": []}
+        self.slots.append(s)
+        return s
+
+    def bubble(self, tag):
+        """말풍선 하나(배경, 이름, 본문, 다운로드 버튼). 슬롯 태그를 같이 달아서 슬롯 단위로 이동/숨김"""
+        c = self.canvas
+        b = {"action": None}
+        b["bg"] = c.create_rectangle(0, 0, 0, 0, width=0, tags=tag)
+        b["name"] = c.create_text(0, 0, anchor="nw", tags=tag)
+        b["body"] = c.create_text(0, 0, anchor="nw", tags=tag)
+        b["btn"] = c.create_rectangle(0, 0, 0, 0, width=0, fill="#444", tags=tag)
+        b["btn_text"] = c.create_text(0, 0, text="DOWNLOAD", fill="white", font=(FONT_MAIN, 10), tags=tag)
+        for item in (b["btn"], b["btn_text"]):
+            c.tag_bind(item, "<Button-1>", lambda e, b=b: b["action"] and b["action"]())
+            c.tag_bind(item, "<Enter>", lambda e, b=b: c.itemconfigure(b["btn"], fill="#555"))
+            c.tag_bind(item, "<Leave>", lambda e, b=b: c.itemconfigure(b["btn"], fill="#444"))
+        return b
+
+    def text_size(self, item):
+        x0, y0, x1, y1 = self.canvas.bbox(item)
+        return x1 - x0, y1 - y0
+
+    def draw(self, s, item, width):
+        """슬롯을 y=0 기준으로 채우고 높이 반환. 묶음 블록은 메시지마다 말풍선 하나씩"""
+        self.canvas.itemconfigure(s["tag"], state="hidden")
+        entries = [("", "System", 0, item)] if isinstance(item, str) else block_entries(item)
+        bubbles = s["bubbles"]
+        y = 0
+        marked = not isinstance(item, str) and item.index == self.marked
+        for k, entry in enumerate(entries):
+            if k == len(bubbles): bubbles.append(self.bubble(s["tag"]))
+            y += self.draw_entry(bubbles[k], entry, y, width)
+            self.canvas.itemconfigure(bubbles[k]["bg"], width=2 if marked else 0, outline=THEME["search_mark"])
+        return y
+
+    def draw_entry(self, b, entry, top, width):
+        """말풍선 하나를 top 위치에 그리고 높이 반환"""
+        c = self.canvas
+        _, sender, sender_id, message = entry
+        b["action"] = None
+        if sender == "System":
+            c.itemconfigure(b["body"], text=f"--- {message} ---", fill=THEME["system_text"], font=(FONT_MONO, 9),
+                            width=max(width - 40, 100), justify="center", anchor="n", state="normal")
+            c.coords(b["body"], width // 2, top + 5)
+            return self.text_size(b["body"])[1] + 10
+
+        is_me = (sender_id == self.app.my_id)
+        y = top + 2
+        if not is_me:
+            c.itemconfigure(b["name"], text=sender, fill="#888", font=(FONT_MONO, 9), state="normal")
+            c.coords(b["name"], 22, y)
+            y += self.text_size(b["name"])[1]
+
+        if message.startswith(FILE_MANIFEST_PREFIX) or message.startswith("FILE_TRANSFER:") or message.startswith("📎"):
+            filename, manifest_hash = file_block_info(message)
+            bg_color = THEME["my_bubble"] if is_me else THEME["other_bubble"]
+            c.itemconfigure(b["body"], text=f"📦\n{textwrap.fill(filename, width=30)}", fill="white",
+                            font=(FONT_MONO, 11, "bold"), width=0, justify="left", anchor="nw", state="normal")
+            tw, th = self.text_size(b["body"])
+            w, h = tw + 28, th + 16
+            x0 = width - 20 - w if is_me else 20
+            c.coords(b["body"], x0 + 14, y + 8)
+            if not is_me:
+                b["action"] = lambda: self.app.manual_download(filename, manifest_hash)
+                c.coords(b["btn"], x0, y + h, x0 + w, y + h + 28)
+                c.coords(b["btn_text"], x0 + w // 2, y + h + 14)
+                c.itemconfigure(b["btn"], state="normal", fill="#444")
+                c.itemconfigure(b["btn_text"], state="normal")
+                h += 28
+            c.coords(b["bg"], x0, y, x0 + w, y + h)
+            c.itemconfigure(b["bg"], fill=bg_color, state="normal")
+            return y + h + 5 - top
+
+        bg_color = THEME["my_bubble"] if is_me else THEME["other_bubble"]
+        fg_color = THEME["my_text"] if is_me else THEME["other_text"]
+        if not is_me and f"@{self.app.nickname}" in message:
+            bg_color, fg_color = THEME["mention_bg"], THEME["mention_fg"]
+        c.itemconfigure(b["body"], text=message, fill=fg_color, font=(FONT_MAIN, 11),
+                        width=400, justify="left", anchor="nw", state="normal")
+        tw, th = self.text_size(b["body"])
+        w, h = tw + 28, th + 20
+        x0 = width - 20 - w if is_me else 20
+        c.coords(b["body"], x0 + 14, y + 10)
+        c.coords(b["bg"], x0, y, x0 + w, y + h)
+        c.itemconfigure(b["bg"], fill=bg_color, state="normal")
+        return y + h + 2 - top
+
+    def render(self):
+        self.pending = False
+        start = time.perf_counter()
+        c = self.canvas
+        height = c.winfo_height()
+        try: total = self.row_count()
+        except Exception: return
+        self.used = 0
+        if self.follow:
+            layout = self.fill_up(total - 1, height)
+            if layout and layout[0][1] > 0:
+                # 기록이 화면보다 짧으면 위에 붙여서 그림
+                shift = layout[0][1]
+                for s in self.slots[:self.used]: c.move(s["tag"], 0, -shift)
+                layout = [(row, y - shift, h) for row, y, h in layout]
+        else:
+            self.top = min(self.top, max(total - 1, 0))
+            layout = self.fill_up(self.top - 1, -self.top_offset) + self.fill_down(self.top, -self.top_offset, height + CHAT_OVERSCAN)
+            if layout and layout[-1][0] == total - 1 and layout[-1][1] + layout[-1][2] <= height:
+                # 맨 끝까지 내려왔으면 새 메시지를 따라가는 상태로 전환
+                self.follow = True
+                return self.render()
+        for s in self.slots[self.used:]: c.itemconfigure(s["tag"], state="hidden")
+        self.layout = layout
+        self.update_scrollbar(total, height)
+        self.render_ms = (time.perf_counter() - start) * 1000
+
+    def fill_up(self, row, bottom, limit=-CHAT_OVERSCAN):
+        layout = []
+        width = self.canvas.winfo_width()
+        while row >= 0 and bottom > limit:
+            s = self.slot(self.used)
+            self.used += 1
+            h = self.draw(s, self.row_item(row), width)
+            bottom -= h
+            self.canvas.move(s["tag"], 0, bottom)
+            layout.append((row, bottom, h))
+            row -= 1
+        layout.reverse()
+        return layout
+
+    def fill_down(self, row, top, limit):
+        layout = []
+        width = self.canvas.winfo_width()
+        total = self.row_count()
+        while row < total and top < limit:
+            s = self.slot(self.used)
+            self.used += 1
+            h = self.draw(s, self.row_item(row), width)
+            self.canvas.move(s["tag"], 0, top)
+            layout.append((row, top, h))
+            top += h
+            row += 1
+        return layout
+
+    def update_scrollbar(self, total, height):
+        visible = [(row, y, h) for row, y, h in self.layout if y + h > 0 and y < height]
+        if not total or not visible:
+            self.scrollbar.set(0, 1)
+            return
+        row, y, h = visible[0]
+        first = (row + (-y / h if h else 0)) / total
+        row, y, h = visible[-1]
+        last = (row + (min(height - y, h) / h if h else 1)) / total
+        self.scrollbar.set(first, last)
+
+    # --- 스크롤 ---
+    def scroll_pixels(self, dy):
+        if not self.layout: return
+        if dy > 0 and self.follow: return
+        target = dy
+        for row, y, h in self.layout:
+            if y <= target < y + h:
+                self.top, self.top_offset = row, target - y
+                break
+        else:
+            first_row, first_y, _ = self.layout[0]
+            if target < first_y: self.top, self.top_offset = max(first_row - 1, 0), 0
+            else: self.top, self.top_offset = self.layout[-1][0], 0
+        self.follow = False
+        self.pending = True
+        self.render()
+
+    def on_wheel(self, event):
+        units = event.delta / 120 if IS_WINDOWS else event.delta
+        self.scroll_pixels(int(-units * WHEEL_STEP))
+
+    def on_scrollbar(self, *args):
+        if args[0] == "moveto":
+            total = self.row_count()
+            pos = float(args[1]) * total
+            self.top, self.top_offset, self.follow = max(int(pos), 0), 0, False
+            self.render()
+        elif args[0] == "scroll":
+            step = self.canvas.winfo_height() * 9 // 10 if args[2] == "pages" else WHEEL_STEP
+            self.scroll_pixels(int(args[1]) * step)
+
+class LedgerWindow:
+    """원장 보기 창. 체인 전체를 문자열로 만들지 않고 LEDGER_PAGE 개씩 Blockchain에서 읽어 한 페이지만 표시.
+    검증 상태는 화면에 나온 블록만 계산해서 캐시하고, 마지막 페이지를 보고 있으면 새 블록이 오는 대로 갱신"""
+    def __init__(self, app):
+        self.app = app
+        self.start = 0
+        self.follow = True      # 마지막 페이지를 따라가는지
+        self.marked = None      # 찾아간 블록 index
+        self.status = {}        # (index, 해시) -> 검증 결과
+        self.pending = False
+        self.win = tk.Toplevel(app.root)
+        self.win.title("Blockchain Ledger")
+        self.win.geometry("800x600")
+        self.win.configure(bg="#1e1e1e")
+        self.win.protocol("WM_DELETE_WINDOW", self.close)
+
+        nav = tk.Frame(self.win, bg="#1e1e1e", pady=6)
+        nav.pack(side="top", fill="x")
+        for text, command in (("⏮", self.first_page), ("◀", self.prev_page), ("▶", self.next_page), ("⏭", self.last_page)):
+            app.create_button(nav, text, command, bg="#333", hover_bg="#555").pack(side="left", padx=2)
+        self.page_label = tk.Label(nav, text="", bg="#1e1e1e", fg="#cccccc", font=(FONT_MONO, 10))
+        self.page_label.pack(side="left", padx=10)
+        app.create_button(nav, "GO", self.jump, bg="#333", hover_bg="#555").pack(side="right", padx=2)
+        self.entry = app.create_entry(nav, font_size=10)
+        self.entry.pack(side="right", ipady=4)
+        self.entry.bind("<Return>", self.jump)
+        tk.Label(nav, text="index / hash", bg="#1e1e1e", fg="#888", font=(FONT_MONO, 9)).pack(side="right", padx=5)
+
+        self.txt = scrolledtext.ScrolledText(self.win, bg="#1e1e1e", fg="#00ff00", font=(FONT_MONO, 10))
+        self.txt.pack(fill='both', expand=True)
+        self.txt.tag_configure("ok", foreground="#4caf50")
+        self.txt.tag_configure("bad", foreground="#ff6b6b")
+        self.txt.tag_configure("mark", background="#3a3a20")
+        self.render()
+
+    def close(self):
+        self.app.ledger = None
+        self.win.destroy()
+
+    # --- 페이지 이동 ---
+    def bounds(self):
+        chain = self.app.my_blockchain
+        return chain.chain[0].index, chain.get_latest_block().index
+
+    def show(self, start):
+        first, last = self.bounds()
+        self.start = max(first, min(start, last))
+        self.follow = self.start + LEDGER_PAGE > last
+        self.render()
+
+    def first_page(self): self.show_page(self.bounds()[0])
+    def prev_page(self): self.show_page(self.start - LEDGER_PAGE)
+    def next_page(self): self.show_page(self.start + LEDGER_PAGE)
+    def last_page(self): self.show_page(self.bounds()[1])
+
+    def show_page(self, start):
+        self.marked = None
+        self.show(start)
+
+    def jump(self, e=None):
+        """숫자면 블록 index, 아니면 블록 해시로 찾아서 그 블록이 든 페이지로"""
+        query = self.entry.get().strip()
+        if not query: return
+        chain = self.app.my_blockchain
+        index = int(query) if query.isdigit() else chain.find_hash(query.lower())
+        if index is None or chain.get_block(index) is None:
+            self.page_label.config(text=f"not found: {query[:16]}")
+            return
+        first = self.bounds()[0]
+        self.marked = index
+        self.show(first + (index - first) // LEDGER_PAGE * LEDGER_PAGE)
+
+    # --- 그리기 ---
+    def refresh(self):
+        """새 블록이 왔을 때 (렌더링 큐에서 호출). 다음 idle에 한 번만 다시 그림"""
+        if self.pending or not self.win.winfo_exists(): return
+        self.pending = True
+        self.win.after_idle(self.render)
+
+    def check(self, block, prev):
+        key = (block.index, block.digest)
+        ok = self.status.get(key)
+        if ok is None:
+            linked = prev is None or (block.prev_digest == prev.digest and block.index == prev.index + 1)
+            ok = self.status[key] = linked and block.verify()
+        return ok
+
+    def render(self):
+        self.pending = False
+        if not self.win.winfo_exists(): return
+        chain = self.app.my_blockchain
+        first, last = self.bounds()
+        if self.follow or self.start > last: self.start = max(first, last - LEDGER_PAGE + 1)
+        blocks = chain.get_blocks(self.start, LEDGER_PAGE)
+        prev = chain.get_block(self.start - 1)
+        txt = self.txt
+        txt.config(state="normal")
+        txt.delete("1.0", tk.END)
+        mark_line = None
+        for b in blocks:
+            ok = self.check(b, prev)
+            prev = b
+            if b.index == self.marked: mark_line = txt.index("end-1c")
+            txt.insert(tk.END, "✔ " if ok else "✘ ", "ok" if ok else "bad")
+            if b.version == BATCH_VERSION:
+                lines = [f"[{b.index}] {b.timestamp} | {b.message.partition(chr(10))[0]}"]
+                lines += [f"    {ts} | {sender}: {message}" for ts, sender, _, message in block_entries(b)]
+            else:
+                lines = [f"[{b.index}] {b.timestamp} | {b.sender}: {b.message}"]
+            lines += [f"Hash: {b.hash}", "-" * 60, ""]
+            txt.insert(tk.END, "\n".join(lines))
+            if b.index == self.marked: txt.tag_add("mark", mark_line, "end-1c")
+        txt.config(state="disabled")
+        if mark_line: txt.see(mark_line)
+        elif self.follow: txt.see(tk.END)
+        end = blocks[-1].index if blocks else self.start
+        self.page_label.config(text=f"#{self.start} - #{end}  /  #{last}" + ("  (live)" if self.follow else ""))
+
 class BlockChatApp:
     def __init__(self, root):
         self.root = root
@@ -137,19 +3614,35 @@ class BlockChatApp:
         self.my_blockchain = Blockchain()
         self.socket = None
         self.is_host = False
-        self.clients = []
+        self.host = None            # 방을 열었을 때의 호스트 엔진 (ThreadedChatHost / AsyncChatHost)
         self.connected_users = []
+        self.presence = Presence()  # 게스트: 호스트의 PRESENCE 델타를 반영한 접속자 목록
+        self.relay = None           # 게스트 중계 노드 (RelayNode)
+        self.sync_blocks = []       # 검증을 기다리는 SYNC_PAGE 블록
+        self.chain_lock = threading.Lock()  # 호스트 수신 스레드와 중계 수신 스레드가 같은 체인에 add_block
         self.nickname = ""
         self.target_port = 9999
         self.my_link = ""
+        self.room_key = None
+        self.room_id = None         # 여러 방을 호스팅하는 호스트에서의 방 이름 (접속 코드 4번째 칸)
+        self.host_link = ""
+        self.guest_chains = {}      # 재접속 시 차이만 받기 위해 링크별 체인 보관
+        self.syncing = False
+        self.sync_stale = False
+        self.writers = {}           # 소켓 -> SocketWriter
         self.my_id = None
-        self.next_user_id = 1 
-        self.file_cache = {}
+        self.file_cache = FileCache()
+        self.file_store = None
+        self.host_addr = None
         self.running = True 
         self.is_floating = False
         
-        self.render_queue = []
+        self.chat_view = None
+        self.ledger = None            # 열려 있는 LedgerWindow
+        self.render_queue = deque()   # 블록 또는 None(기록 전체 갱신). 어느 스레드에서나 append
         self.is_rendering = False
+        self.render_stats = {"queue_depth": 0, "max_queue_depth": 0, "frames": 0, "items": 0,
+                             "last_frame_ms": 0.0, "max_frame_ms": 0.0, "total_frame_ms": 0.0}
 
         if not os.path.exists("downloads"): os.makedirs("downloads")
         self.setup_main_menu()
@@ -259,11 +3752,17 @@ class BlockChatApp:
         if self.socket:
             try: self.socket.close()
             except: pass
+        if self.host:
+            try:
+                self.host.stop()
+                self.my_blockchain.close()
+            except: pass
         try: self.root.destroy()
         except: pass
         sys.exit(0)
 
     def clear_screen(self):
+        self.chat_view = None
         for widget in self.root.winfo_children():
             if isinstance(widget, tk.Menu): continue 
             widget.destroy()
@@ -274,10 +3773,25 @@ class BlockChatApp:
             try: self.socket.close()
             except: pass
         self.socket = None
-        self.clients = []
         self.connected_users = []
+        self.presence = Presence()
+        self.sync_blocks = []
+        if self.relay:
+            self.relay.close()
+            self.relay = None
+        for writer in self.writers.values(): writer.close()
+        self.writers = {}
+        if self.host:
+            self.host.stop()
+            self.host = None
+        if self.is_host: self.my_blockchain.close()
+        elif self.host_link:
+            self.guest_chains[self.host_link] = self.my_blockchain
         self.my_blockchain = Blockchain()
         self.is_host = False
+        self.room_key = None
+        self.room_id = None
+        self.host_link = ""
         self.root.attributes('-topmost', False)
 
     def safe_update(self, func, *args):
@@ -409,6 +3923,10 @@ class BlockChatApp:
         u_frame.pack(side="left", padx=5)
         self.create_button(u_frame, "👥", self.show_user_list, bg="#333", hover_bg="#555").pack()
 
+        s_frame = tk.Frame(btn_frame, bg=THEME["app_bg"])
+        s_frame.pack(side="left", padx=5)
+        self.create_button(s_frame, "🔍", self.open_search_window, bg="#333", hover_bg="#555").pack()
+
         p_frame = tk.Frame(btn_frame, bg=THEME["app_bg"])
         p_frame.pack(side="left", padx=5)
         self.btn_pin = self.create_button(p_frame, "📌 PIN", self.toggle_floating, bg=THEME["btn_pin_inactive"])
@@ -424,12 +3942,13 @@ class BlockChatApp:
         self.create_button(e_frame, "EXIT", self.return_to_main, bg=THEME["btn_danger"], hover_bg="#e53935").pack()
 
         # 4. Chat Area
-        self.chat_area = scrolledtext.ScrolledText(self.root, state='disabled', bg=THEME["chat_bg"], fg="white",
-                                                   font=(FONT_MAIN, 12), relief="flat", padx=20, pady=20, highlightthickness=0)
-        self.chat_area.pack(fill="both", expand=True)
-        self.bind_right_click(self.chat_area)
+        self.chat_view = ChatView(self.root, self)
+        self.chat_view.pack(fill="both", expand=True, pady=(10, 0))
 
     # --- 기능 구현 ---
+    def set_connected_users(self, users):
+        self.connected_users = users
+
     def show_user_list(self):
         win = tk.Toplevel(self.root)
         win.title("Participants")
@@ -445,6 +3964,45 @@ class BlockChatApp:
         for user in self.connected_users:
             listbox.insert(tk.END, f"🟢 {user}")
 
+    def open_search_window(self):
+        win = tk.Toplevel(self.root)
+        win.title("Search")
+        win.geometry("460x500")
+        win.configure(bg=THEME["app_bg"])
+
+        entry = self.create_entry(win, font_size=11)
+        entry.pack(fill="x", padx=10, pady=(10, 5), ipady=6)
+        status = tk.Label(win, text="", bg=THEME["app_bg"], fg=THEME["system_text"], font=(FONT_MONO, 9))
+        status.pack(anchor="w", padx=10)
+        listbox = tk.Listbox(win, bg=THEME["input_bg"], fg="white", font=(FONT_MAIN, 10), relief="flat")
+        listbox.pack(fill="both", expand=True, padx=10, pady=10)
+        hits = []
+
+        def show_results(chain, query):
+            if not win.winfo_exists() or chain is not self.my_blockchain: return
+            start = time.perf_counter()
+            hits[:] = chain.search_index().search(query)
+            listbox.delete(0, tk.END)
+            for index, (_, sender, _, message) in hits:
+                text = file_block_info(message)[0] if message.startswith(FILE_MANIFEST_PREFIX) else message
+                listbox.insert(tk.END, f"#{index}  {sender}: {(text.splitlines() or [''])[0][:80]}")
+            status.config(text=f"{len(hits)} results ({(time.perf_counter() - start) * 1000:.1f}ms)")
+
+        def run(e=None):
+            query, chain = entry.get(), self.my_blockchain
+            if chain.search is not None: return show_results(chain, query)
+            # 첫 검색은 색인을 만드는 동안 창이 멈추지 않게 스레드에서
+            status.config(text="Indexing...")
+            threading.Thread(target=lambda: (chain.search_index(), self.safe_update(show_results, chain, query)), daemon=True).start()
+
+        def jump(e=None):
+            sel = listbox.curselection()
+            if sel and self.chat_view: self.chat_view.jump_to_block(hits[sel[0]][0])
+
+        entry.bind("<Return>", run)
+        listbox.bind("<<ListboxSelect>>", jump)
+        entry.focus_set()
+
     def toggle_floating(self):
         self.is_floating = not self.is_floating
         self.root.attributes('-topmost', self.is_floating)
@@ -467,293 +4025,313 @@ class BlockChatApp:
         messagebox.showinfo("Copied", f"Code: {self.my_link}")
 
     # --- 렌더링 최적화 ---
-    def process_render_queue(self):
-        if not self.render_queue:
-            self.is_rendering = False
-            return
-
-        self.is_rendering = True
-        chunk = self.render_queue[:5]
-        self.render_queue = self.render_queue[5:]
-
-        for block in chunk:
-            self.display_block_ui(block)
-        
-        self.root.after(10, self.process_render_queue)
-
-    def add_to_render_queue(self, block):
+    def display_block(self, block):
+        """어느 스레드에서나 호출 가능. 큐에 넣고, 처리 예약은 이미 돌고 있지 않을 때만 한 번"""
         self.render_queue.append(block)
         if not self.is_rendering:
-            self.process_render_queue()
+            self.is_rendering = True
+            self.safe_update(self.process_render_queue)
 
-    def display_block(self, block):
-        self.safe_update(self.add_to_render_queue, block)
+    def display_history(self):
+        """SYNC처럼 한꺼번에 들어온 기록은 블록별로 처리하지 않고 목록을 한 번에 다시 읽음"""
+        self.display_block(None)
 
-    def display_block_ui(self, block):
-        if block.message.startswith("FILE_TRANSFER:") or block.message.startswith("📎"):
-            filename = block.message.replace("FILE_TRANSFER:", "").replace("📎 파일 전송: ", "")
-            self._ui_draw_file(filename, block.sender, block.sender_id)
-            return
-        
-        if block.sender == "System":
-            self._ui_draw_bubble("System", block.message, False, True)
-        else:
-            is_me = (block.sender_id == self.my_id)
-            self._ui_draw_bubble(block.sender, block.message, is_me, False)
+    def process_render_queue(self):
+        """프레임당 RENDER_BUDGET 안에서 최대한 처리하고, 목록 다시 그리기/알림은 배치당 한 번"""
+        start = time.perf_counter()
+        deadline = start + RENDER_BUDGET
+        q = self.render_queue
+        stats = self.render_stats
+        stats["max_queue_depth"] = max(stats["max_queue_depth"], len(q))
+        if METRICS.on: METRICS.gauge("render_queue", len(q))
+        count = 0
+        follow = False
+        mentions = []
+        while q and (count & 63 or time.perf_counter() < deadline):
+            block = q.popleft()
+            count += 1
+            if block is None: continue
+            for _, sender, sender_id, message in block_entries(block):
+                if sender_id == self.my_id: follow = True
+                elif sender != "System" and f"@{self.nickname}" in message: mentions.append(sender)
 
-    def _ui_draw_bubble(self, sender, message, is_me, is_system):
-        self.chat_area.config(state='normal')
-        
-        if is_system:
-            frame = tk.Frame(self.chat_area, bg=THEME["chat_bg"], pady=5)
-            lbl = tk.Label(frame, text=f"--- {message} ---", bg=THEME["chat_bg"], fg=THEME["system_text"], font=(FONT_MONO, 9))
-            lbl.pack()
-            self.chat_area.window_create(tk.END, window=frame)
-            self.chat_area.insert(tk.END, "\n")
-            self.chat_area.tag_configure("center", justify='center')
-            self.chat_area.tag_add("center", "end-2l", "end-1l")
-        else:
-            container = tk.Frame(self.chat_area, bg=THEME["chat_bg"], pady=2)
-            
-            # [기능 구현] 멘션 알림 로직
-            bg_color = THEME["my_bubble"] if is_me else THEME["other_bubble"]
-            fg_color = THEME["my_text"] if is_me else THEME["other_text"]
-            
-            if f"@{self.nickname}" in message and not is_me:
-                bg_color = THEME["mention_bg"]
-                fg_color = THEME["mention_fg"]
-                # 알림 실행
+        if self.ledger and self.ledger.follow: self.ledger.refresh()
+        if self.chat_view:
+            if follow: self.chat_view.follow = True
+            self.chat_view.refresh()
+            # [기능 구현] 멘션 알림 로직 (몰려 들어와도 알림은 한 번)
+            if mentions:
                 self.flash_window()
-                self.show_toast_popup("🔔 알림", f"{sender}님이 나를 언급했습니다.")
-
-            if is_me:
-                bubble = tk.Label(container, text=message, bg=bg_color, fg=fg_color,
-                                  font=(FONT_MAIN, 11), padx=14, pady=10, justify="left", wraplength=400)
-                bubble.pack(side="right")
-                self.chat_area.window_create(tk.END, window=container)
-                self.chat_area.insert(tk.END, "\n")
-                self.chat_area.tag_configure("right", justify='right')
-                self.chat_area.tag_add("right", "end-2l", "end-1l")
-            else:
-                name_lbl = tk.Label(container, text=sender, bg=THEME["chat_bg"], fg="#888", font=(FONT_MONO, 9))
-                name_lbl.pack(anchor="w", padx=2)
-                
-                bubble = tk.Label(container, text=message, bg=bg_color, fg=fg_color,
-                                  font=(FONT_MAIN, 11), padx=14, pady=10, justify="left", wraplength=400)
-                bubble.pack(anchor="w")
-                self.chat_area.window_create(tk.END, window=container)
-                self.chat_area.insert(tk.END, "\n")
-                self.chat_area.tag_configure("left", justify='left')
-                self.chat_area.tag_add("left", "end-2l", "end-1l")
-
-        self.chat_area.see(tk.END)
-        self.chat_area.config(state='disabled')
-
-    def _ui_draw_file(self, filename, sender_name, sender_id):
-        self.chat_area.config(state='normal')
-        is_me = (sender_id == self.my_id)
-        
-        container = tk.Frame(self.chat_area, bg=THEME["chat_bg"], pady=5)
-        card_bg = THEME["my_bubble"] if is_me else THEME["other_bubble"]
-        
-        display_name = textwrap.fill(filename, width=30)
-        
-        card = tk.Frame(container, bg=card_bg, bd=0)
-        if is_me: card.pack(side="right")
-        else: card.pack(side="left")
-        
-        tk.Label(card, text=f"📦\n{display_name}", bg=card_bg, fg="white", 
-                 font=(FONT_MONO, 11, "bold"), padx=14, pady=8, justify="left").pack(anchor="w")
-        
-        # 파일 보낸 사람 표시
-        if not is_me:
-            tk.Label(card, text=f"From: {sender_name}", bg=card_bg, fg="#aaa", font=(FONT_MONO, 8)).pack(anchor="w", padx=10)
-            
-            dl_frame = tk.Frame(card, bg=card_bg)
-            dl_frame.pack(fill="x")
-            self.create_button(dl_frame, "DOWNLOAD", lambda: self.manual_download(filename), 
-                               bg="#444", hover_bg="#555").pack(fill="x")
+                if len(mentions) == 1: self.show_toast_popup("🔔 알림", f"{mentions[0]}님이 나를 언급했습니다.")
+                else: self.show_toast_popup("🔔 알림", f"{mentions[-1]}님 외 {len(mentions) - 1}건의 멘션이 있습니다.")
 
-        self.chat_area.window_create(tk.END, window=container)
-        self.chat_area.insert(tk.END, "\n")
-        
-        align = "right" if is_me else "left"
-        self.chat_area.tag_configure(align, justify=align)
-        self.chat_area.tag_add(align, "end-2l", "end-1l")
-        
-        self.chat_area.see(tk.END)
-        self.chat_area.config(state='disabled')
+        frame_ms = (time.perf_counter() - start) * 1000
+        stats["frames"] += 1
+        stats["items"] += count
+        stats["last_frame_ms"] = frame_ms
+        stats["max_frame_ms"] = max(stats["max_frame_ms"], frame_ms)
+        stats["total_frame_ms"] += frame_ms
+        stats["queue_depth"] = len(q)
+        if METRICS.on: METRICS.observe("render_frame", frame_ms / 1000)
+        if q: self.root.after(RENDER_INTERVAL, self.process_render_queue)
+        else:
+            self.is_rendering = False
+            # 다른 스레드가 방금 넣고 예약은 건너뛰었을 수 있음
+            if q and not self.is_rendering:
+                self.is_rendering = True
+                self.root.after(RENDER_INTERVAL, self.process_render_queue)
+
+    def render_metrics(self):
+        """렌더링 큐 상태 (큐 길이, 프레임당 처리 시간)"""
+        stats = dict(self.render_stats, queue_depth=len(self.render_queue))
+        stats["avg_frame_ms"] = stats["total_frame_ms"] / stats["frames"] if stats["frames"] else 0.0
+        if self.chat_view: stats["view_render_ms"] = self.chat_view.render_ms
+        return stats
+
+    def clear_chat_area(self):
+        self.render_queue.clear()
+        if self.chat_view: self.chat_view.clear()
+
+    def show_notice(self, message):
+        if self.chat_view: self.chat_view.note(message)
 
-    def manual_download(self, filename):
+    def manual_download(self, filename, manifest_hash=None):
+        if manifest_hash:
+            save_path = filedialog.asksaveasfilename(initialfile=filename)
+            if save_path: threading.Thread(target=self.download_worker, args=(manifest_hash, save_path), daemon=True).start()
+            return
         if filename not in self.file_cache:
             messagebox.showerror("Error", "File expired or not found.")
             return
         save_path = filedialog.asksaveasfilename(initialfile=filename)
         if save_path:
             try:
-                with open(save_path, "wb") as f: f.write(base64.b64decode(self.file_cache[filename]))
+                self.file_cache.save(filename, save_path)
                 messagebox.showinfo("Success", "File Saved.")
             except Exception as e: messagebox.showerror("Error", str(e))
 
+    def download_worker(self, manifest_hash, save_path):
+        try:
+            if self.is_host: self.file_store.export(manifest_hash, save_path)
+            else: download_file(self.host_addr, manifest_hash, save_path, self.room_id)
+            self.safe_update(messagebox.showinfo, "Success", "File Saved.")
+        except Exception as e: self.safe_update(messagebox.showerror, "Error", str(e))
+
     # --- Network Logic ---
     def send_file_action(self):
         filepath = filedialog.askopenfilename()
-        if not filepath: return
-        filename = os.path.basename(filepath)
-        if os.path.getsize(filepath) > 50 * 1024 * 1024:
-            messagebox.showwarning("Limit", "Max size: 50MB")
-            return
-        try:
-            with open(filepath, "rb") as f: encoded = base64.b64encode(f.read()).decode('utf-8')
-            self.file_cache[filename] = encoded
-            if self.is_host: self.mine_and_broadcast_file(self.nickname, self.my_id, filename, encoded)
-            else: self.safe_send(self.socket, {
-                "type": "FILE", "sender": self.nickname, "sender_id": self.my_id, "filename": filename, "content": encoded
-            })
-        except Exception as e: messagebox.showerror("Error", str(e))
+        if not filepath or self.my_id is None: return
+        # 채팅 소켓 대신 별도 연결로 청크 스트리밍 (FILE_MAX_CHUNKS 청크까지, 채팅은 계속 진행)
+        threading.Thread(target=self.upload_worker, args=(filepath, os.path.basename(filepath)), daemon=True).start()
 
-    def mine_and_broadcast_file(self, sender, sender_id, filename, encoded):
-        self.file_cache[filename] = encoded
-        log_msg = f"FILE_TRANSFER:{filename}" 
-        last = self.my_blockchain.get_latest_block()
-        new_block = Block(last.index+1, time.ctime(), sender, sender_id, log_msg, last.hash)
-        if self.my_blockchain.add_block(new_block):
-            self.safe_update(self.display_block, new_block)
-            packet = {"type": "FILE_RECV", "sender": sender, "sender_id": sender_id, "filename": filename, "content": encoded, "block_data": new_block.__dict__}
-            for c in self.clients: self.safe_send(c, packet)
+    def upload_worker(self, filepath, filename):
+        try:
+            if self.is_host:
+                manifest_hash = self.file_store.import_file(filepath, filename)
+                self.mine_and_broadcast(self.nickname, self.my_id, file_block_message(manifest_hash, filename))
+            else:
+                upload_file(self.host_addr, filepath, filename, self.nickname, self.my_id, self.room_id)
+        except Exception as e: self.safe_update(messagebox.showerror, "Error", str(e))
 
     def safe_send(self, sock, data):
+        self.send_raw(sock, encode_packet(data))
+
+    def send_raw(self, sock, data):
+        # 게스트 -> 호스트 패킷 (CHAT, SYNC_REQ 등)은 버리지 않음
         try:
-            packet = (json.dumps(data) + "\n").encode('utf-8')
-            sock.sendall(packet)
-        except: pass
+            writer = self.writers.get(sock) or self.writers.setdefault(sock, SocketWriter(sock))
+            writer.send_wait(data)
+        except: METRICS.fail("send")
+
+    def sync_have(self):
+        latest = self.my_blockchain.get_latest_block()
+        if latest.index == 0: return None
+        return {"index": latest.index, "hash": latest.hash}
+
+    def sync_locator(self):
+        # have 가 호스트에 없을 때(갈라졌을 때) 공통 블록을 찾는 데 쓰임
+        return self.my_blockchain.locator() if self.sync_have() else None
+
+    def request_sync(self):
+        self.syncing = True
+        self.sync_stale = False
+        self.safe_send(self.socket, {"type": "SYNC_REQ", "have": self.sync_have(), "locator": self.sync_locator()})
 
     def create_room(self):
         self.nickname = self.entry_nickname.get()
         if not self.nickname: return
         self.is_host = True
         self.my_id = 1
-        self.next_user_id = 2 
         self.running = True
         self.connected_users = [self.nickname] 
-        
-        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        while True:
-            try: self.socket.bind(('0.0.0.0', self.target_port)); break
-            except OSError: self.target_port += 1
-        self.socket.listen(5)
-        self.my_link = f"{get_local_ip()}:{self.target_port}"
+        self.file_store = FileStore()
+        # 호스트 엔진(GUI 없음)을 띄우고 이 창은 블록/접속자 콜백만 받아서 그림
+        engine = AsyncChatHost if USE_ASYNC_HOST else ThreadedChatHost
+        self.host = engine(self.nickname, file_cache=self.file_cache, file_store=self.file_store,
+                           on_block=self.display_block, on_users=self.set_connected_users)
+        self.target_port = open_room(self.host, self.target_port)
+        self.room_key = self.host.room_key
+        self.my_blockchain = self.host.blockchain
+        self.my_link = f"{get_local_ip()}:{self.target_port}:{self.room_key}"
         self.setup_chat_room(f"HOST | {self.nickname}")
-        self.safe_update(self._ui_draw_bubble, "System", "Room Created", False, True)
-        threading.Thread(target=self.accept_clients, daemon=True).start()
-
-    def accept_clients(self):
-        while self.running:
-            try:
-                c, a = self.socket.accept()
-                self.clients.append(c)
-                self.safe_send(c, {"type": "SYNC", "chain": [b.__dict__ for b in self.my_blockchain.chain]})
-                # 유저 목록 전송
-                self.safe_send(c, {"type": "USER_LIST", "users": self.connected_users})
-                threading.Thread(target=self.handle_client, args=(c,), daemon=True).start()
-            except: break
-
-    def handle_client(self, c):
-        client_name = None
-        buffer = b"" 
-        try:
-            while self.running:
-                data = c.recv(4096)
-                if not data: break
-                buffer += data
-                while b"\n" in buffer:
-                    line_bytes, buffer = buffer.split(b"\n", 1)
-                    if not line_bytes: continue
-                    try:
-                        p = json.loads(line_bytes.decode('utf-8'))
-                        if p['type'] == 'JOIN':
-                            client_name = p['nickname']
-                            assigned_id = self.next_user_id
-                            self.next_user_id += 1
-                            self.connected_users.append(client_name)
-                            self.safe_send(c, {"type": "WELCOME", "assigned_id": assigned_id})
-                            # 접속자 업데이트 방송
-                            for client in self.clients: self.safe_send(client, {"type": "USER_LIST", "users": self.connected_users})
-                            self.mine_and_broadcast("System", 0, f"'{client_name}' joined.")
-                        elif p['type'] == 'CHAT':
-                            self.mine_and_broadcast(p['sender'], p['sender_id'], p['message'])
-                        elif p['type'] == 'FILE':
-                            self.mine_and_broadcast_file(p['sender'], p['sender_id'], p['filename'], p['content'])
-                    except: continue
-        except: pass
-        finally:
-            if c in self.clients: self.clients.remove(c)
-            if client_name and client_name in self.connected_users:
-                self.connected_users.remove(client_name)
-                for client in self.clients: self.safe_send(client, {"type": "USER_LIST", "users": self.connected_users})
-            c.close()
-            if client_name: self.mine_and_broadcast("System", 0, f"'{client_name}' left.")
+        self.safe_update(self.show_notice, "Room Created")
+        self.host.run_in_thread()
 
     def connect_to_host(self):
         link = self.entry_link.get()
         if not link: return
         try:
-            ip, port = link.split(':')
+            ip, port, *key = link.split(':')
             self.running = True
+            self.host_addr = (ip, int(port))
             self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.socket.connect((ip, int(port)))
+            self.socket.connect(self.host_addr)
             self.is_host = False
+            self.host_link = link
+            self.room_key = key[0] if key else None
+            self.room_id = key[1] if len(key) > 1 else None
+            if link in self.guest_chains: self.my_blockchain = self.guest_chains.pop(link)
             self.setup_chat_room(f"GUEST | {self.nickname}")
-            self.safe_send(self.socket, {"type": "JOIN", "nickname": self.nickname})
+            # 재접속이면 보관해 둔 기록은 목록에 그대로 보이고, 빠진 부분만 요청
+            self.syncing = True
+            self.sync_stale = False
+            join = {"type": "JOIN", "nickname": self.nickname, "have": self.sync_have(),
+                    "locator": self.sync_locator(), "codecs": list(WIRE_CODECS), "presence": 1}
+            if self.room_id: join["room"] = self.room_id
+            self.safe_send(self.socket, join)
             threading.Thread(target=self.receive, daemon=True).start()
         except Exception as e:
             messagebox.showerror("Error", f"{e}")
             self.setup_main_menu()
 
     def receive(self):
-        buffer = b""
         try:
-            while self.running:
-                data = self.socket.recv(4096)
-                if not data: raise ConnectionResetError()
-                buffer += data
-                while b"\n" in buffer:
-                    line_bytes, buffer = buffer.split(b"\n", 1)
-                    if not line_bytes: continue
-                    try:
-                        p = json.loads(line_bytes.decode('utf-8'))
-                        if p['type'] == 'WELCOME':
-                            self.my_id = p['assigned_id']
-                            self.safe_update(self._ui_draw_bubble, "System", "Connected.", False, True)
-                        elif p['type'] == 'SYNC':
-                            if self.my_blockchain.replace_chain(p['chain']):
-                                self.safe_update(self._ui_draw_bubble, "System", "History Synced.", False, True)
-                                # 렌더링 큐에 추가 (렉 방지)
-                                for b in self.my_blockchain.chain[1:]: 
-                                    self.safe_update(self.add_to_render_queue, b)
-                        elif p['type'] == 'BLOCK':
-                            b = p['data']
-                            new_b = Block(b['index'], b['timestamp'], b['sender'], b['sender_id'], b['message'], b['previous_hash'])
-                            new_b.hash = b['hash']
-                            if self.my_blockchain.add_block(new_b): 
-                                self.safe_update(self.display_block, new_b)
-                        elif p['type'] == 'FILE_RECV':
-                            self.file_cache[p['filename']] = p['content']
-                            b = p['block_data']
-                            new_b = Block(b['index'], b['timestamp'], b['sender'], b['sender_id'], b['message'], b['previous_hash'])
-                            new_b.hash = b['hash']
-                            if self.my_blockchain.add_block(new_b): 
-                                self.safe_update(self.display_block, new_b)
-                        elif p['type'] == 'USER_LIST':
-                            self.connected_users = p['users']
-                    except: continue
+            for frame in FrameReader(self.socket).frames():
+                if not self.running: break
+                try:
+                    p = frame if isinstance(frame, dict) else json.loads(frame)  # 바이너리 프레임은 이미 패킷
+                    with self.chain_lock: self.handle_packet(p)
+                except: METRICS.fail("receive")
+            raise ConnectionResetError()
         except:
             if self.running:
                 self.running = False
                 self.safe_update(messagebox.showwarning, "Info", "Connection Closed")
                 self.safe_update(self.setup_main_menu)
 
+    def handle_packet(self, p):
+        if p['type'] == 'WELCOME':
+            self.my_id = p['assigned_id']
+            self.safe_update(self.show_notice, "Connected.")
+            if p.get('relay') and GUEST_RELAY and self.room_key and not self.relay: self.open_relay()
+        elif p['type'] == 'SYNC':
+            self.syncing = False
+            if self.my_blockchain.replace_chain(p['chain'], self.show_verify_progress):
+                self.safe_update(self.show_notice, "History Synced.")
+                self.display_history()
+            else:
+                self.safe_update(self.show_notice, f"Invalid block #{self.my_blockchain.bad_block_index} in history.")
+        elif p['type'] == 'CHECKPOINT':
+            if self.room_key and not verify_checkpoint(self.room_key, p['index'], p['hash'], p['sig']):
+                self.safe_update(self.show_notice, "Invalid checkpoint.")
+                return
+            self.sync_blocks = []
+            cp = wire_block(p['block'])
+            if cp.index == p['index'] and cp.hash == p['hash'] and self.my_blockchain.reset_to_checkpoint(cp):
+                self.safe_update(self.clear_chat_area)
+                self.display_history()
+        elif p['type'] == 'DIVERGED':
+            self.handle_diverged(p)
+        elif p['type'] == 'SYNC_PAGE':
+            # 모았다가 verify_chain 으로 한 번에 검증 (긴 기록은 프로세스 풀, 진행률 표시)
+            self.sync_blocks.extend(wire_block(d) for d in p['blocks'])
+            if len(self.sync_blocks) >= SYNC_VERIFY_BATCH: self.apply_sync_blocks()
+        elif p['type'] == 'SYNC_DONE':
+            self.apply_sync_blocks()
+            self.syncing = False
+            if self.sync_stale: self.request_sync()
+            else:
+                self.safe_update(self.show_notice, "History Synced.")
+        elif p['type'] in ('BLOCK', 'FILE_RECV'):
+            self.receive_broadcast(p)
+        elif p['type'] == 'PRESENCE':
+            # 버전이 비면 (놓친 델타) 스냅샷을 다시 받음
+            if not self.presence.apply(p): self.safe_send(self.socket, {"type": "PRESENCE_REQ"})
+            else: self.connected_users = self.presence.names()
+        elif p['type'] == 'USER_LIST':   # 구버전 호스트
+            self.connected_users = p['users']
+        elif p['type'] == 'RELAY_PEERS':
+            if self.relay: self.relay.set_children(p['children'])
+        elif p['type'] == 'HEAD':
+            self.check_head(p)
+
+    def open_relay(self):
+        """호스트가 중계를 켰을 때만 중계 포트를 열고 알림 (이 포트로 다른 게스트가 블록을 전달해 줌, 못 열면 호스트에게서만 받음)"""
+        try: self.relay = RelayNode(self.room_key, self.receive_relayed)
+        except OSError: return
+        self.safe_send(self.socket, {"type": "RELAY_PORT", "port": self.relay.port})
+
+    def apply_sync_blocks(self):
+        blocks, self.sync_blocks = self.sync_blocks, []
+        if not blocks: return
+        chain = self.my_blockchain
+        if chain.extend(blocks, self.show_verify_progress): self.display_history()
+        if chain.bad_block_index is not None:
+            self.safe_update(self.show_notice, f"Invalid block #{chain.bad_block_index} in history.")
+
+    def handle_diverged(self, p):
+        """공통 블록 범위(lo, hi)를 이진 탐색으로 좁히고, 찾으면 그 뒤만 잘라 냄 (호스트가 이어서 SYNC_PAGE 전송)"""
+        chain = self.my_blockchain
+        lo, hi = p['lo'], p['hi']
+        if not chain.has_block(lo, p['hash']):
+            # 그 사이 기록이 바뀜 -> 체크포인트부터 다시
+            return self.safe_send(self.socket, {"type": "SYNC_REQ", "have": None})
+        if hi - lo <= 1:
+            if chain.truncate(lo): self.display_history()
+            return
+        mid = (lo + hi) // 2
+        self.safe_send(self.socket, {"type": "PROBE", "index": mid, "hash": chain.get_block(mid).hash, "lo": lo, "hi": hi})
+
+    def show_verify_progress(self, checked, total):
+        title = "chainChat" if checked >= total else f"chainChat - verifying {checked * 100 // total}%"
+        self.safe_update(self.root.title, title)
+
+    def receive_block(self, data):
+        new_b = wire_block(data)
+        if self.my_blockchain.add_block(new_b):
+            self.display_block(new_b)
+            return True
+        if new_b.index > self.my_blockchain.get_latest_block().index:
+            # 연결되지 않는 앞선 블록 -> 빠진 구간만 다시 요청
+            if self.syncing: self.sync_stale = True
+            else: self.request_sync()
+        return False
+
+    def receive_broadcast(self, p):
+        """BLOCK / FILE_RECV (호스트에게서 직접 또는 중계로). 처음 보는 블록만 체인에 넣고, 들어가면 자식 게스트에게 전달"""
+        block = wire_block(p['data'] if p['type'] == 'BLOCK' else p['block_data'])
+        if self.relay and self.relay.seen(block.digest): return
+        extra = None
+        if p['type'] == 'FILE_RECV':
+            if 'raw' in p: self.file_cache.put(p['filename'], p['raw'])
+            else: self.file_cache[p['filename']] = p['content']
+            extra = {k: v for k, v in p.items() if k not in ("type", "block_data")}
+        if self.receive_block(block) and self.relay: self.relay.forward(block, extra)
+
+    def receive_relayed(self, p):
+        # 중계 수신 스레드
+        if not self.running: return
+        try:
+            with self.chain_lock: self.receive_broadcast(p)
+        except: METRICS.fail("receive")
+
+    def check_head(self, p):
+        """HEAD 는 RELAY_HEAD_SECONDS 전에 방송된 블록. 아직 없으면 중계에서 빠진 것 -> 호스트에게 직접 받음"""
+        if self.syncing or p['index'] <= self.my_blockchain.get_latest_block().index: return
+        if self.relay and self.relay.receiving(): return    # 큰 파일 블록이 오는 중
+        self.safe_send(self.socket, {"type": "RELAY_MISS"})
+        self.request_sync()
+
     def send_message(self, e=None):
         msg = self.msg_entry.get()
         if not msg: return
@@ -764,25 +4342,78 @@ class BlockChatApp:
         else: self.safe_send(self.socket, {"type": "CHAT", "sender": self.nickname, "sender_id": self.my_id, "message": msg})
 
     def mine_and_broadcast(self, sender, sender_id, msg):
-        last = self.my_blockchain.get_latest_block()
-        new_b = Block(last.index+1, time.ctime(), sender, sender_id, msg, last.hash)
-        if self.my_blockchain.add_block(new_b):
-            self.safe_update(self.display_block, new_b)
-            for c in self.clients: self.safe_send(c, {"type": "BLOCK", "data": new_b.__dict__})
+        if self.host: self.host.call(self.host.mine_and_broadcast, sender, sender_id, msg)
 
     def open_ledger_window(self):
-        win = tk.Toplevel(self.root)
-        win.title("Blockchain Ledger")
-        win.geometry("800x600")
-        win.configure(bg="#1e1e1e")
-        txt = scrolledtext.ScrolledText(win, bg="#1e1e1e", fg="#00ff00", font=(FONT_MONO, 10))
-        txt.pack(fill='both', expand=True)
-        log = ""
-        for b in self.my_blockchain.chain:
-            log += f"[{b.index}] {b.timestamp} | {b.sender}: {b.message}\nHash: {b.hash}\n{'-'*60}\n"
-        txt.insert(tk.END, log)
+        if self.ledger and self.ledger.win.winfo_exists(): return self.ledger.win.lift()
+        self.ledger = LedgerWindow(self)
+
+# ----------------------------------------------------------
+# [6] 헤드리스 호스트 (python main.py --headless --port 9999)
+# ----------------------------------------------------------
+def run_headless(argv):
+    """Tk 없이 방을 호스팅 (서버/CI용 중계). --room 으로 같은 포트에 방을 더 만듦. Ctrl+C 로 종료"""
+    global BLOCK_VERSION
+    parser = argparse.ArgumentParser(prog="main.py --headless", description="chainChat headless host")
+    parser.add_argument("--headless", action="store_true")
+    parser.add_argument("--port", type=int, default=9999)
+    parser.add_argument("--async", dest="use_async", action="store_true", help="asyncio 호스트 엔진 사용")
+    parser.add_argument("--verbose", action="store_true", help="블록마다 한 줄씩 출력")
+    parser.add_argument("--room", action="append", default=[], help="같은 포트에 만들 방 이름 (여러 번 가능)")
+    parser.add_argument("--idle", type=float, default=ROOM_IDLE_SECONDS, help="접속 없는 방을 메모리에서 내리는 시간 (초)")
+    parser.add_argument("--workers", type=int, default=HOST_WORKERS,
+                        help="워커 프로세스 수 (1 이상이면 멀티 프로세스 호스트, 방 하나만)")
+    parser.add_argument("--relay", type=int, default=RELAY_FANOUT,
+                        help="게스트끼리 블록 중계 (호스트가 직접 보내는 게스트 수 = 각 게스트가 전달하는 자식 수, 0 = 끔)")
+    parser.add_argument("--metrics-file", default=METRICS_FILE, help="통계 JSON 을 주기적으로 쓸 파일")
+    parser.add_argument("--metrics-port", type=int, default=METRICS_PORT, help="127.0.0.1 HTTP 통계 포트 (/metrics, /profile)")
+    parser.add_argument("--profile", action="store_true", default=PROFILE_ON, help="샘플링 프로파일러 켜기")
+    parser.add_argument("--block-version", type=int, choices=(0, 1), default=BLOCK_VERSION,
+                        help="새 블록 해시 인코딩 (0 = 구버전 클라이언트 호환 JSON, 1 = 바이너리)")
+    args = parser.parse_args(argv)
+    BLOCK_VERSION = args.block_version
+    if args.workers and args.room: parser.error("--workers hosts a single room (no --room)")
+    if METRICS_ON or args.metrics_file or args.metrics_port or args.profile:
+        start_metrics(args.metrics_file, args.metrics_port, args.profile)
+
+    on_block = None
+    if args.verbose:
+        on_block = lambda room, b: print(f"{room and f'#{room} '}[{b.index}] {b.sender}: {b.message.partition(chr(10))[0]}",
+                                         flush=True)
+    signal.signal(signal.SIGTERM, lambda *a: sys.exit(0))  # 서비스 관리자의 종료 요청도 체인을 닫고 끝냄
+    if args.workers:
+        host = ProcessChatHost(None, file_store=FileStore(), workers=args.workers, relay=args.relay,
+                               on_block=on_block and (lambda b: on_block(DEFAULT_ROOM, b)))
+        port = open_room(host, args.port, scan=False)
+        host.run_in_thread()
+        print(f"chainChat host on port {port} ({host.workers} workers, chain #{host.blockchain.get_latest_block().index})",
+              flush=True)
+        print(f"ACCESS CODE: {get_local_ip()}:{port}:{host.room_key}", flush=True)
+    else:
+        engine = AsyncChatHost if args.use_async or USE_ASYNC_HOST else ThreadedChatHost
+        host = RoomHost(engine, file_store=FileStore(), on_block=on_block, idle=args.idle, relay=args.relay)
+        host.open('0.0.0.0', args.port)
+        try:
+            for room_id in args.room: host.add_room(room_id)
+        except ValueError as e: parser.error(str(e))
+        host.run_in_thread()
+        print(f"chainChat host on port {args.port} ({len(host.rooms)} rooms)", flush=True)
+        print(f"ACCESS CODE: {host.access_code()}", flush=True)
+        for room_id in sorted(host.rooms):
+            if room_id: print(f"ROOM {room_id}: {host.access_code(room_id)}", flush=True)
+    try:
+        while True: time.sleep(3600)
+    except KeyboardInterrupt: pass
+    finally:
+        host.stop()
+        if args.workers: host.blockchain.close()
+        if args.metrics_file: METRICS.dump(args.metrics_file)
+    return 0
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()  # PyInstaller 빌드에서 검증용 프로세스 풀 사용
+    if "--headless" in sys.argv[1:]: sys.exit(run_headless(sys.argv[1:]))
+    if METRICS_ON: start_metrics(METRICS_FILE, METRICS_PORT, PROFILE_ON)
     root = tk.Tk()
     app = BlockChatApp(root)
     root.mainloop()